@@ -0,0 +1,104 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from structured_log import log_event
+
+
+class AgentBusyError(Exception):
+    """Raised when a model's concurrency limit stays saturated for longer than the wait timeout."""
+
+
+class RegisteredAgent:
+    def __init__(self, model_name, lm, agent, max_concurrent):
+        self.model_name = model_name
+        self.lm = lm
+        self.agent = agent
+        self.max_concurrent = max_concurrent
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.created_at = time.time()
+        self.active = 0
+        self.requests = 0
+        self.rejected = 0
+
+
+class AgentRegistry:
+    """Builds the LM client and agent program for each allowed model once and shares them.
+
+    Agents are created lazily on first use (or ahead of time with warm_up) through
+    lm_factory(model_name) and agent_factory(lm). acquire() hands out a model's agent
+    while holding one of its max_concurrent_per_model slots, so a burst of requests
+    for one endpoint queues here instead of piling onto the serving endpoint.
+    """
+
+    def __init__(self, allowed_models, lm_factory, agent_factory, max_concurrent_per_model=4,
+                 acquire_timeout=30):
+        self.allowed_models = list(allowed_models)
+        self.lm_factory = lm_factory
+        self.agent_factory = agent_factory
+        self.max_concurrent_per_model = max_concurrent_per_model
+        self.acquire_timeout = acquire_timeout
+        self._agents = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name):
+        if model_name not in self.allowed_models:
+            raise ValueError(f"Unsupported LLM model: {model_name}")
+        registered = self._agents.get(model_name)
+        if registered is None:
+            with self._lock:
+                registered = self._agents.get(model_name)
+                if registered is None:
+                    lm = self.lm_factory(model_name)
+                    registered = RegisteredAgent(model_name, lm, self.agent_factory(lm),
+                                                 self.max_concurrent_per_model)
+                    self._agents[model_name] = registered
+                    log_event('agent_registered', model=model_name)
+        return registered
+
+    @contextmanager
+    def acquire(self, model_name):
+        registered = self.get(model_name)
+        if not registered.slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                registered.rejected += 1
+            raise AgentBusyError(f"All {registered.max_concurrent} slots for {model_name} are busy")
+        with self._lock:
+            registered.active += 1
+            registered.requests += 1
+        try:
+            yield registered
+        finally:
+            with self._lock:
+                registered.active -= 1
+            registered.slots.release()
+
+    def warm_up(self, model_names=None, ping=False):
+        """Build agents ahead of time; with ping, also send one tiny request to open the connection."""
+        for model_name in model_names or self.allowed_models:
+            try:
+                registered = self.get(model_name)
+                if ping:
+                    registered.lm("ping", max_tokens=1)
+                    log_event('agent_warmed_up', model=model_name)
+            except Exception as e:
+                log_event('agent_warm_up_failed', level='error', model=model_name, error=str(e))
+
+    def warm_up_in_background(self, model_names=None, ping=False):
+        thread = threading.Thread(target=self.warm_up, args=(model_names, ping),
+                                  name="agent-registry-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            return {
+                model_name: {
+                    'active': registered.active,
+                    'requests': registered.requests,
+                    'rejected': registered.rejected,
+                    'max_concurrent': registered.max_concurrent,
+                    'age_seconds': time.time() - registered.created_at,
+                }
+                for model_name, registered in self._agents.items()
+            }
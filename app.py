@@ -1,30 +1,47 @@
-import dspy
-import mlflow
-import mlflow.deployments
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-from typing import Optional
-from pyspark.sql import SparkSession
-from databricks.connect import DatabricksSession
+# dspy, mlflow, databricks-connect and markdown2 take seconds to import, so they are imported where they
+# are first used or by the deferred start-up steps below, after the server can already accept connections
+import time
+_import_started = time.perf_counter()
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, stream_with_context, g
 import os
 from markupsafe import Markup
-import markdown2
-import time
-import base64
+import atexit
+import json
+import itertools
+import threading
+from spark_session import SparkSessionManager
+from startup import DeferredStartup
+from query_cache import QueryResultCache
+from result_fetch import fetch_arrow, iter_rows, collect_bounded_rows
+from customer_prefetch import CustomerPrefetcher, extract_customer_entities
+from batch_lookup import BatchQueryRunner
+import metrics
+from structured_log import configure_logging, log_event, preview
+from telemetry import AsyncRunLogger, ExperimentCache
+from conversation_store import create_conversation_store
+from agent_registry import AgentRegistry, AgentBusyError
+from live_call import LiveCallSession, parse_start_message
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
+from audio_transcription import (
+    save_upload_to_tempfile, iter_audio_segments, transcribe_segments, endpoint_transcriber, stitch_transcripts
+)
+from transcript_delta import RollingCallSummary, PromptTokenTracker, split_new_dialogue, estimate_tokens
+
+# Structured JSON logs; LOG_DEBUG_SAMPLE_RATE keeps a fraction of the debug events (payload previews)
+configure_logging(
+    os.environ.get('LOG_LEVEL', 'INFO'),
+    debug_sample_rate=float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '0.1'))
+)
 
 # Initialize Flask app
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # For session management
-
-# Define the transcript router class
-class transcript_router(dspy.Signature):
-    """This handles a ongoing, live call transcript and determines what tools to call to find relevant information to help the call agent handle the conversation with the customer. Prioritize the call_agent_ask to find more useful information to the call agent and to determine which tables to use in the sql query. Check conversatinon_history to see what tables were already sql queried and use that if so. Do not re-query. Skip to a FINISH action if no tools are required given the information. Prepare relevant_information to help the call agent solve issues, achieve upsell goals and prioritize calls
-    relevant_information must be in formatted like a report in Markdown and is also your response"""
-    transcript: str = dspy.InputField()
-    call_agent_ask: Optional[str] = dspy.InputField()
-    conversation_history: list = dspy.InputField()
-    queried_table: str = dspy.OutputField()
-    relevant_information: str = dspy.OutputField(desc="Format using Markdown. Use actual newlines, not \ n characters. If necessary, add a recommended response to say for the call_agent")
-
+# Session cookies only carry browser_session_id. With the sqlite store several worker processes serve
+# the same browsers, so they must all sign cookies with the same FLASK_SECRET_KEY.
+if not os.environ.get('FLASK_SECRET_KEY') and os.environ.get('CONVERSATION_STORE', 'memory') == 'sqlite':
+    raise RuntimeError("Set FLASK_SECRET_KEY when CONVERSATION_STORE=sqlite so every worker accepts the session cookie")
+app.secret_key = os.environ.get('FLASK_SECRET_KEY') or os.urandom(24)  # For session management
+sock = Sock(app)  # WebSocket routes for live-call mode
 
 def sql_lookup(sql_query):
     """This function is to query the following tables to find more information based on the provided transcript. Decide which table to use based on the call_agent's ask and transcript situation.
@@ -39,27 +56,327 @@ def sql_lookup(sql_query):
     Use austin_choi_demo_catalog.agents.customer_profiles to find customer information.
     """
     try:
-        spark = DatabricksSession.builder.serverless(True).getOrCreate()
-        print("Spark Session successfully retrieved.")
-        results = spark.sql(sql_query)
-        data_list = [row.asDict() for row in results.collect()]
-        return data_list
+        # Only the source that answered records a sql_lookup observation; a miss falls through uncounted
+        if profile_snapshot:
+            start = time.perf_counter()
+            answered, rows = profile_snapshot.try_lookup(sql_query)
+            if answered:
+                rows = collect_bounded_rows(rows, SQL_LOOKUP_MAX_ROWS, SQL_LOOKUP_MAX_BYTES)
+                observe_sql_lookup('snapshot', start)
+                return rows
+        if customer_prefetcher:
+            start = time.perf_counter()
+            answered, rows = customer_prefetcher.try_lookup(sql_query)
+            if answered:
+                observe_sql_lookup('prefetch', start)
+                return rows
+        with metrics.timer('sql_lookup', source='query'):
+            return query_cache.get_or_compute(sql_query, lambda: fetch_bounded_results(sql_query))
     except NameError:
         # For local development where spark might not be available
-        print("Spark not available in this environment. Using mock data.")
+        log_event('spark_unavailable', level='warning')
         return [{"mock_data": "This is mock data since Spark is not available"}]
 
 
-# Configure MLflow
-mlflow.set_tracking_uri("databricks")
-mlflow.set_registry_uri("databricks-uc")
+def observe_sql_lookup(source, start):
+    # Same series metrics.timer('sql_lookup', source=...) records into
+    metrics.observe('stage_duration_seconds', time.perf_counter() - start, stage='sql_lookup', source=source)
 
-# DSPy LLM configuration will be set dynamically based on form input
-selected_llm = dspy.LM(f"databricks/databricks-claude-3-7-sonnet", cache=False)
-dspy.configure(lm=selected_llm)
 
-# Enable MLflow DSPy autologging at startup
-mlflow.dspy.autolog()
+def sql_lookup_batch(sql_queries: list[str]):
+    """Run several independent SQL queries at the same time, against the same tables sql_lookup can query. Prefer this over several sql_lookup calls when the information needed comes from more than one query, for example a customer's profile from austin_choi_demo_catalog.agents.customer_profiles together with their past calls from austin_choi_demo_catalog.agents.transcripts.
+
+    Returns one entry per query, in the same order, with either its result or an error; a failed query does not affect the others.
+    """
+    return batch_query_runner.run(sql_queries)
+
+
+def find_similar_calls(situation: str, k: int = 5):
+    """Find the past calls most similar to a situation, to see how other agents handled it. Describe the situation in plain words, e.g. "customer angry about a missed delivery window asking for a refund".
+
+    Returns up to k calls from austin_choi_demo_catalog.agents.transcripts, most relevant first, each with agent_name, customer_name, tone, topic, an excerpt of the transcript and a relevance score. Prefer this over querying austin_choi_demo_catalog.agents.transcripts with sql_lookup to find similar past calls.
+    """
+    if not transcript_index.ready:
+        return [{"_notice": "The past-call index is still loading; use sql_lookup on austin_choi_demo_catalog.agents.transcripts instead."}]
+    with metrics.timer('similar_calls'):
+        return transcript_index.search(situation, k=max(1, min(int(k), TRANSCRIPT_INDEX_MAX_RESULTS)))
+
+
+# One long-lived Spark session per process, shared by every sql_lookup call.
+# It is created in the background at startup so the first tool call only pays the query cost.
+spark_sessions = SparkSessionManager(
+    max_concurrent_queries=int(os.environ.get('SPARK_MAX_CONCURRENT_QUERIES', '4')),
+    health_check_interval=int(os.environ.get('SPARK_HEALTH_CHECK_INTERVAL', '300'))
+)
+
+# Results of repeated sql_lookup queries are served from memory. Each table gets its own TTL
+# since customer_profiles changes rarely while new transcripts arrive throughout the day.
+query_cache = QueryResultCache(
+    table_ttls={
+        'customer_profiles': int(os.environ.get('QUERY_CACHE_PROFILES_TTL', '3600')),
+        'transcripts': int(os.environ.get('QUERY_CACHE_TRANSCRIPTS_TTL', '300')),
+    },
+    max_entries=int(os.environ.get('QUERY_CACHE_MAX_ENTRIES', '512')),
+    max_bytes=int(os.environ.get('QUERY_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+)
+
+# Optional on-disk cache of LLM responses, so repeated analyses of the same transcript skip the model
+llm_response_cache = None
+if os.environ.get('LLM_RESPONSE_CACHE_ENABLED', 'false').lower() == 'true':
+    from response_cache import LLMResponseCache
+    llm_response_cache = LLMResponseCache(
+        os.environ.get('LLM_RESPONSE_CACHE_PATH', '/tmp/llm_response_cache.db'),
+        max_bytes=int(os.environ.get('LLM_RESPONSE_CACHE_MAX_BYTES', str(256 * 1024 * 1024))),
+        max_age=int(os.environ.get('LLM_RESPONSE_CACHE_MAX_AGE', str(7 * 24 * 3600))),
+        near_duplicates=os.environ.get('LLM_RESPONSE_CACHE_NEAR_DUPLICATES', 'false').lower() == 'true'
+    )
+
+CUSTOMER_PROFILES_TABLE = "austin_choi_demo_catalog.agents.customer_profiles"
+TRANSCRIPTS_TABLE = "austin_choi_demo_catalog.agents.transcripts"
+profile_snapshot = None
+
+# Customers named in a submitted transcript are looked up in the background while the agent's first
+# LLM step runs, so its sql_lookup for their profile or past calls is answered without another round-trip
+customer_prefetcher = None
+if os.environ.get('CUSTOMER_PREFETCH_ENABLED', 'true').lower() == 'true':
+    customer_prefetcher = CustomerPrefetcher(
+        run_query=lambda sql_query: query_cache.get_or_compute(sql_query, lambda: fetch_bounded_results(sql_query)),
+        tables=[CUSTOMER_PROFILES_TABLE, TRANSCRIPTS_TABLE],
+        max_workers=int(os.environ.get('CUSTOMER_PREFETCH_WORKERS', '4')),
+        ttl=int(os.environ.get('CUSTOMER_PREFETCH_TTL', '120'))
+    )
+
+def prefetch_customer_data(transcript):
+    if not customer_prefetcher:
+        return
+    snapshot_ready = profile_snapshot is not None and profile_snapshot.ready
+    entities = extract_customer_entities(transcript, profile_snapshot.keys() if snapshot_ready else None)
+    if not entities['customer_names']:
+        return
+    log_event('customers_identified', customer_names=entities['customer_names'],
+              account_numbers=entities['account_numbers'])
+    # Profile lookups are already answered locally when the snapshot is loaded
+    customer_prefetcher.prefetch(entities['customer_names'], [TRANSCRIPTS_TABLE] if snapshot_ready else None)
+
+def on_customer_profiles_changed(changed_customers):
+    query_cache.invalidate_table(CUSTOMER_PROFILES_TABLE)
+    if customer_prefetcher:
+        customer_prefetcher.invalidate_table(CUSTOMER_PROFILES_TABLE)
+    if llm_response_cache:
+        # Only responses that mention a changed customer are stale; a full reload drops everything
+        if changed_customers is None:
+            llm_response_cache.clear()
+        else:
+            llm_response_cache.invalidate_mentions(changed_customers)
+
+# Optional local snapshot of customer_profiles. When enabled, point lookups by customer_name are
+# answered in-process from an Arrow copy that is refreshed in the background from the Delta change feed.
+if os.environ.get('PROFILE_SNAPSHOT_ENABLED', 'false').lower() == 'true':
+    from profile_snapshot import CustomerProfileSnapshot
+    profile_snapshot = CustomerProfileSnapshot(
+        spark_sessions,
+        CUSTOMER_PROFILES_TABLE,
+        snapshot_dir=os.environ.get('PROFILE_SNAPSHOT_DIR', '/tmp/customer_profile_snapshot'),
+        refresh_interval=int(os.environ.get('PROFILE_SNAPSHOT_REFRESH_INTERVAL', '300')),
+        on_change=lambda changed_customers: on_customer_profiles_changed(changed_customers)
+    )
+    profile_snapshot.start_background_refresh()
+
+# Local search index over past calls, kept up to date from the transcripts table's change feed.
+# The agent's find_similar_calls tool ranks past calls against it instead of scanning the table.
+transcript_index = None
+if os.environ.get('TRANSCRIPT_INDEX_ENABLED', 'false').lower() == 'true':
+    from transcript_index import TranscriptIndex
+    transcript_index = TranscriptIndex(
+        spark_sessions,
+        TRANSCRIPTS_TABLE,
+        index_dir=os.environ.get('TRANSCRIPT_INDEX_DIR', '/tmp/transcript_index'),
+        refresh_interval=int(os.environ.get('TRANSCRIPT_INDEX_REFRESH_INTERVAL', '300'))
+    )
+    transcript_index.start_background_refresh()
+TRANSCRIPT_INDEX_MAX_RESULTS = int(os.environ.get('TRANSCRIPT_INDEX_MAX_RESULTS', '10'))
+
+# Budgets for a single sql_lookup result. Rows and text length are enforced by the warehouse;
+# the byte budget caps what ends up in the agent's prompt.
+SQL_LOOKUP_MAX_ROWS = int(os.environ.get('SQL_LOOKUP_MAX_ROWS', '200'))
+SQL_LOOKUP_MAX_BYTES = int(os.environ.get('SQL_LOOKUP_MAX_BYTES', str(64 * 1024)))
+SQL_LOOKUP_MAX_TEXT_CHARS = int(os.environ.get('SQL_LOOKUP_MAX_TEXT_CHARS', '2000'))
+
+# Queries from one sql_lookup_batch call run concurrently, each still bounded by the Spark query limit.
+# Timed-out queries keep a worker until they finish; past BATCH_LOOKUP_MAX_ABANDONED of them new ones are refused.
+batch_query_runner = BatchQueryRunner(
+    run_query=sql_lookup,
+    max_workers=int(os.environ.get('BATCH_LOOKUP_WORKERS', '8')),
+    query_timeout=int(os.environ.get('BATCH_LOOKUP_QUERY_TIMEOUT', '60')),
+    max_queries=int(os.environ.get('BATCH_LOOKUP_MAX_QUERIES', '5')),
+    max_abandoned=int(os.environ.get('BATCH_LOOKUP_MAX_ABANDONED', '4'))
+)
+
+def fetch_bounded_results(sql_query):
+    with metrics.timer('spark_query'):
+        table = spark_sessions.run(
+            lambda spark: fetch_arrow(spark, sql_query, SQL_LOOKUP_MAX_ROWS, SQL_LOOKUP_MAX_TEXT_CHARS)
+        )
+    return collect_bounded_rows(iter_rows(table), SQL_LOOKUP_MAX_ROWS, SQL_LOOKUP_MAX_BYTES)
+
+# Conversation history and other per-session state are kept server-side, keyed by browser_session_id.
+# Use the sqlite backend when running more than one worker process.
+conversation_store = create_conversation_store(
+    os.environ.get('CONVERSATION_STORE', 'memory'),
+    path=os.environ.get('CONVERSATION_STORE_PATH', '/tmp/conversations.db'),
+    max_turns=int(os.environ.get('CONVERSATION_MAX_TURNS', '20')),
+    idle_ttl=int(os.environ.get('CONVERSATION_IDLE_TTL', str(4 * 3600))),
+    purge_interval=int(os.environ.get('CONVERSATION_PURGE_INTERVAL', '300'))
+)
+
+# Incremental mode sends the LLM only the dialogue that is new since the last processed turn,
+# plus a compact rolling summary of earlier turns, instead of the full transcript and history.
+INCREMENTAL_TRANSCRIPT_MODE = os.environ.get('INCREMENTAL_TRANSCRIPT_MODE', 'false').lower() == 'true'
+prompt_token_tracker = PromptTokenTracker()
+
+def count_prompt_tokens(response, fallback_text):
+    # Prefer the usage reported by the model endpoint (tracked per request, since LM clients
+    # are shared between requests); estimate from the inputs if it is missing
+    usage = response.get_lm_usage() if hasattr(response, 'get_lm_usage') else None
+    prompt_tokens = sum((model_usage or {}).get('prompt_tokens', 0) or 0 for model_usage in (usage or {}).values())
+    return prompt_tokens or estimate_tokens(fallback_text)
+
+# Experiment IDs are resolved once and then reused, instead of a tracking-server lookup per request
+experiment_cache = ExperimentCache()
+
+# Async telemetry mode: runs are queued and written to MLflow by a background thread, and traces are
+# exported asynchronously by MLflow, so tracking stays off the request path. A fraction
+# MLFLOW_TELEMETRY_SAMPLE_RATE of runs and traces is kept; runs that don't fit in the queue are dropped.
+MLFLOW_ASYNC_TELEMETRY = os.environ.get('MLFLOW_ASYNC_TELEMETRY', 'false').lower() == 'true'
+async_run_logger = None
+if MLFLOW_ASYNC_TELEMETRY:
+    telemetry_sample_rate = float(os.environ.get('MLFLOW_TELEMETRY_SAMPLE_RATE', '1.0'))
+    os.environ.setdefault('MLFLOW_ENABLE_ASYNC_TRACE_LOGGING', 'true')
+    os.environ.setdefault('MLFLOW_TRACE_SAMPLING_RATIO', str(telemetry_sample_rate))
+    async_run_logger = AsyncRunLogger(
+        max_queue=int(os.environ.get('MLFLOW_TELEMETRY_MAX_QUEUE', '1000')),
+        batch_size=int(os.environ.get('MLFLOW_TELEMETRY_BATCH_SIZE', '50')),
+        flush_interval=float(os.environ.get('MLFLOW_TELEMETRY_FLUSH_INTERVAL', '2')),
+        sample_rate=telemetry_sample_rate
+    )
+    # Write out the queued runs when the process exits; whatever is still queued after
+    # MLFLOW_TELEMETRY_SHUTDOWN_TIMEOUT seconds is counted as dropped
+    atexit.register(async_run_logger.stop, float(os.environ.get('MLFLOW_TELEMETRY_SHUTDOWN_TIMEOUT', '10')))
+
+def start_tracked_run(route, llm_model, experiment_id):
+    """Start tracking one transcript request; pass the returned handle to end_tracked_run()."""
+    tracked_run = {
+        'run_id': None,
+        'route': route,
+        'llm_model': llm_model,
+        'experiment_id': experiment_id or experiment_cache.active_experiment_id,
+        'started_at': time.time(),
+        'status': 'FAILED',
+        'metrics': {}
+    }
+    if not async_run_logger:
+        import mlflow
+        with metrics.timer('mlflow_start_run'):
+            tracked_run['run_id'] = mlflow.start_run().info.run_id
+    return tracked_run
+
+def end_tracked_run(tracked_run):
+    if tracked_run is None:
+        return
+    if not async_run_logger:
+        import mlflow
+        with metrics.timer('mlflow_end_run'):
+            mlflow.end_run()
+        return
+    if not tracked_run['experiment_id']:
+        # No experiment was ever selected in this process, so there is nowhere to log the run
+        return
+    ended_at = time.time()
+    async_run_logger.record(
+        tracked_run['experiment_id'],
+        params={'route': tracked_run['route'], 'llm_model': tracked_run['llm_model']},
+        metrics=dict(tracked_run['metrics'], latency_seconds=ended_at - tracked_run['started_at']),
+        start_time=tracked_run['started_at'],
+        end_time=ended_at,
+        status=tracked_run['status']
+    )
+
+# LM clients and ReAct agents are built once per allowed model and shared by all requests.
+# Each model gets a bounded number of concurrent requests; the rest wait up to AGENT_ACQUIRE_TIMEOUT seconds.
+ALLOWED_LLM_MODELS = [
+    "databricks-gpt-oss-20b",
+    "databricks-gpt-oss-120b",
+    "databricks-llama-4-maverick",
+    "databricks-claude-3-7-sonnet",
+]
+DEFAULT_LLM_MODEL = "databricks-claude-3-7-sonnet"
+
+def build_lm(llm_model):
+    from router_program import CachedLM
+    return CachedLM(f"databricks/{llm_model}", response_cache=llm_response_cache, cache=False)
+
+def build_agent(lm):
+    from router_program import build_agent
+    tools = [sql_lookup, sql_lookup_batch]
+    if transcript_index:
+        tools.append(find_similar_calls)
+    return build_agent(tools=tools)
+
+agent_registry = AgentRegistry(
+    ALLOWED_LLM_MODELS,
+    lm_factory=build_lm,
+    agent_factory=build_agent,
+    max_concurrent_per_model=int(os.environ.get('AGENT_MAX_CONCURRENT_PER_MODEL', '4')),
+    acquire_timeout=int(os.environ.get('AGENT_ACQUIRE_TIMEOUT', '30'))
+)
+
+def init_mlflow():
+    import mlflow
+    import mlflow.deployments
+    mlflow.set_tracking_uri("databricks")
+    mlflow.set_registry_uri("databricks-uc")
+
+def init_agent_runtime():
+    import dspy
+    import mlflow.dspy
+    from router_program import StageTimingCallback
+    # The registry's LMs and agents live for the whole process; without this their history
+    # would keep every prompt and response of every request
+    dspy.configure(lm=agent_registry.get(DEFAULT_LLM_MODEL).lm, callbacks=[StageTimingCallback()],
+                   disable_history=True)
+    # Enable MLflow DSPy autologging
+    mlflow.dspy.autolog()
+
+    # Optionally build agents (and open endpoint connections) for some or all models as well,
+    # e.g. AGENT_WARM_UP_MODELS=all or AGENT_WARM_UP_MODELS=databricks-claude-3-7-sonnet
+    warm_up_models = os.environ.get('AGENT_WARM_UP_MODELS', '')
+    if warm_up_models:
+        agent_registry.warm_up_in_background(
+            None if warm_up_models == 'all' else [model.strip() for model in warm_up_models.split(',')],
+            ping=os.environ.get('AGENT_WARM_UP_PING', 'false').lower() == 'true'
+        )
+
+# Remote clients are set up in background threads so the server binds and answers /ready right away;
+# routes that need one wait for it (up to STARTUP_WAIT_TIMEOUT seconds). /ready reports each step.
+# DEFERRED_STARTUP=false runs the steps one after another before the app finishes importing.
+DEFERRED_STARTUP = os.environ.get('DEFERRED_STARTUP', 'true').lower() == 'true'
+STARTUP_WAIT_TIMEOUT = int(os.environ.get('STARTUP_WAIT_TIMEOUT', '120'))
+startup = DeferredStartup()
+startup.add('spark', spark_sessions.get_session)
+startup.add('mlflow', init_mlflow)
+startup.add('agent', init_agent_runtime, after=['mlflow'])
+startup.start(background=DEFERRED_STARTUP)
+
+def wait_for_startup(*steps):
+    """Return an error response if a start-up step the route needs is still warming up, else None."""
+    for step in steps:
+        if not startup.wait(step, timeout=STARTUP_WAIT_TIMEOUT):
+            return jsonify({
+                'success': False,
+                'error': f'{step} is still starting up',
+                'user_message': 'The assistant is still starting up. Please try again in a moment.'
+            }), 503
+    return None
 
 example_transcript_turn_1 = """
 Austin: Thank you for calling QuickShip Logistics, this is Austin speaking. How may I assist you today?
@@ -103,49 +420,180 @@ Avery Johnson: Yes, email those right away. And listen, I need better communicat
 Austin: Absolutely, Mr. Johnson. I'm setting up automated alerts to your email and phone for each milestone scan. I'll personally monitor these shipments through our hub transfer and assign them priority status during sortation. I've also noted your account for a follow-up call tomorrow afternoon to confirm all pickups were completed successfully. Is there anything else I can assist you with today?
 """
 
-# Initialize session defaults
-def init_session(force_reset=False):
-    # Check if this is a new browser session or if force_reset is True
-    if 'browser_session_id' not in session or force_reset:
-        # Clear all session data for new browser sessions or resets
-        session.clear()
-        # Set a browser session ID to track this session
-        session['browser_session_id'] = os.urandom(16).hex()
-
-        # Initialize session variables with default values
-        session['ai_response'] = ""
-        session['conversation_history'] = []
-        session['transcript_input'] = "Put a transcript you would like to analyze here"
-        session['mlflow_experiment_id'] = ""
-        session['llm_model'] = "databricks-claude-3-7-sonnet"
-        session['processing'] = False
-        session['demo_state'] = {
+# Default per-session values. They live in the server-side conversation store;
+# the cookie only carries the opaque browser_session_id.
+def default_session_values():
+    return {
+        'ai_response': "",
+        'transcript_input': "Put a transcript you would like to analyze here",
+        'mlflow_experiment_id': "",
+        'llm_model': DEFAULT_LLM_MODEL,
+        'processing': False,
+        'call_summary': {},
+        'processed_line_keys': [],
+        'turn_count': 0,
+        'demo_state': {
             'current_turn': 1,
             'turn1_processed': False,
             'turn2_processed': False,
             'turn3_processed': False
         }
-    else:
-        # Initialize session variables if they don't exist
-        if 'ai_response' not in session:
-            session['ai_response'] = ""
-        if 'conversation_history' not in session:
-            session['conversation_history'] = []
-        if 'transcript_input' not in session:
-            session['transcript_input'] = "Put a transcript you would like to analyze here"
-        if 'mlflow_experiment_id' not in session:
-            session['mlflow_experiment_id'] = ""
-        if 'llm_model' not in session:
-            session['llm_model'] = "databricks-claude-3-7-sonnet"
-        if 'processing' not in session:
-            session['processing'] = False
-        if 'demo_state' not in session:
-            session['demo_state'] = {
-                'current_turn': 1,
-                'turn1_processed': False,
-                'turn2_processed': False,
-                'turn3_processed': False
-            }
+    }
+
+def get_session_value(key, default=None):
+    return conversation_store.get_value(session['browser_session_id'], key, default)
+
+def set_session_values(**values):
+    conversation_store.set_values(session['browser_session_id'], **values)
+
+def get_conversation_history():
+    return conversation_store.get_history(session['browser_session_id'])
+
+# Initialize session defaults
+def init_session(force_reset=False):
+    with metrics.timer('session_init'):
+        # Check if this is a new browser session or if force_reset is True
+        if 'browser_session_id' not in session or force_reset:
+            # Drop the server-side state of the previous browser session, if any
+            if 'browser_session_id' in session:
+                conversation_store.delete(session['browser_session_id'])
+            session.clear()
+            # Set a browser session ID to track this session
+            session['browser_session_id'] = os.urandom(16).hex()
+
+            # Initialize session variables with default values
+            set_session_values(**default_session_values())
+        else:
+            # Initialize session variables if they don't exist (e.g. the stored session expired)
+            stored_values = conversation_store.get_values(session['browser_session_id'])
+            missing_values = {key: value for key, value in default_session_values().items()
+                              if key not in stored_values}
+            if missing_values:
+                set_session_values(**missing_values)
+
+def prepare_router_inputs(transcript):
+    # In incremental mode only the new part of the transcript and a rolling summary are sent
+    if INCREMENTAL_TRANSCRIPT_MODE:
+        call_summary = RollingCallSummary.from_dict(get_session_value('call_summary'))
+        new_dialogue, processed_line_keys = split_new_dialogue(
+            transcript, get_session_value('processed_line_keys', [])
+        )
+        # A re-submitted transcript has no new lines; analyze it as-is rather than send nothing
+        router_transcript = new_dialogue or transcript
+        log_event('incremental_transcript', sent_chars=len(router_transcript), total_chars=len(transcript))
+        return {
+            'transcript': router_transcript,
+            'history': call_summary.as_history(),
+            'call_summary': call_summary,
+            'processed_line_keys': processed_line_keys
+        }
+    return {
+        'transcript': transcript,
+        'history': get_conversation_history(),
+        'call_summary': None,
+        'processed_line_keys': None
+    }
+
+def record_prompt_tokens(response, router_inputs):
+    # Counted separately since the stored history is capped at CONVERSATION_MAX_TURNS
+    turn_number = get_session_value('turn_count', 0) + 1
+    set_session_values(turn_count=turn_number)
+    prompt_tokens = count_prompt_tokens(response, router_inputs['transcript'] + str(router_inputs['history']))
+    prompt_token_tracker.record(turn_number, prompt_tokens)
+    log_event('prompt_tokens', turn=turn_number, prompt_tokens=prompt_tokens)
+    return prompt_tokens
+
+def render_markdown(relevant_information):
+    # Convert Markdown to HTML with error handling
+    try:
+        # Use markdown2 with extras for better rendering
+        import markdown2
+        with metrics.timer('markdown_render'):
+            markdown_response = markdown2.markdown(
+                relevant_information,
+                extras=['fenced-code-blocks', 'tables', 'break-on-newline']
+            )
+
+        log_event('markdown_rendered', level='debug', markdown_chars=len(relevant_information),
+                  html_chars=len(markdown_response), markdown=preview(relevant_information))
+    except Exception as md_error:
+        log_event('markdown_render_failed', level='error', error=str(md_error))
+        # Fallback to plain text if markdown conversion fails
+        markdown_response = f"<pre>{relevant_information}</pre>"
+    return markdown_response
+
+def update_demo_state(transcript):
+    # Update demo state if we're in demo mode
+    demo_state = get_session_value('demo_state', {})
+    if demo_state:
+        # Check which turn was processed based on the transcript content
+        if transcript.strip() == example_transcript_turn_1.strip():
+            demo_state['turn1_processed'] = True
+            # If Turn 1 is processed, update current_turn to 2
+            if not demo_state.get('turn2_processed', False):
+                demo_state['current_turn'] = 2
+        elif transcript.strip() == example_transcript_turn_2.strip():
+            demo_state['turn2_processed'] = True
+            # If Turn 2 is processed, update current_turn to 3
+            if not demo_state.get('turn3_processed', False):
+                demo_state['current_turn'] = 3
+        elif transcript.strip() == example_transcript_turn_3.strip():
+            demo_state['turn3_processed'] = True
+        set_session_values(demo_state=demo_state)
+        log_event('demo_state_updated', level='debug', demo_state=demo_state)
+
+def finish_turn(transcript, router_inputs, response, prompt_tokens):
+    """Validate and render a transcript_router response and record it in the session."""
+    # Validate response data
+    if not hasattr(response, 'relevant_information') or not response.relevant_information:
+        log_event('response_missing_field', level='warning', field='relevant_information')
+        response.relevant_information = "No relevant information was found."
+
+    if not hasattr(response, 'queried_table'):
+        log_event('response_missing_field', level='warning', field='queried_table')
+        response.queried_table = ""
+
+    markdown_response = render_markdown(response.relevant_information)
+
+    # Store the response in the conversation history
+    conversation_store.append_turn(session['browser_session_id'], {
+        "transcript": transcript,
+        "response": markdown_response,
+        "queried_table": response.queried_table,
+        "prompt_tokens": prompt_tokens
+    })
+    if router_inputs['call_summary'] is not None:
+        router_inputs['call_summary'].add_turn(
+            router_inputs['transcript'], response.relevant_information, response.queried_table
+        )
+        set_session_values(
+            call_summary=router_inputs['call_summary'].to_dict(),
+            processed_line_keys=router_inputs['processed_line_keys']
+        )
+
+    # Store the response in session
+    set_session_values(ai_response=markdown_response)
+
+    update_demo_state(transcript)
+    return markdown_response
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Request latency and status per route. Streaming responses are timed until the response starts.
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if 'request_started' in g:
+        metrics.observe('request_duration_seconds', time.perf_counter() - g.request_started,
+                        help_text="Time to produce each HTTP response", route=route)
+    metrics.inc('requests_total', help_text="HTTP responses by route and status", route=route,
+                status=response.status_code)
+    return response
 
 # Routes
 @app.route('/')
@@ -155,184 +603,155 @@ def index():
     init_session(force_reset=True)
 
     return render_template('index.html',
-                          transcript_input=session.get('transcript_input', ''),
-                          ai_response=Markup(session.get('ai_response', '')),
-                          conversation_history=session.get('conversation_history', []),
-                          processing=session.get('processing', False),
-                          demo_state=session.get('demo_state', {}))
+                          transcript_input=get_session_value('transcript_input', ''),
+                          ai_response=Markup(get_session_value('ai_response', '')),
+                          conversation_history=get_conversation_history(),
+                          processing=get_session_value('processing', False),
+                          demo_state=get_session_value('demo_state', {}))
 
-@app.route('/process_transcript', methods=['POST'])
-def process_transcript():
-    init_session()
+def start_transcript_request():
+    """Read the transcript form, update the session and configure MLflow and DSPy.
+
+    Returns (request_state, None) on success or (None, error_response) if the request can't be processed.
+    """
+    startup_error = wait_for_startup('mlflow', 'agent')
+    if startup_error:
+        return None, startup_error
 
     # Get form data
     transcript = request.form.get('transcript', '')
     call_agent_ask = request.form.get('call_agent_ask', '')
     mlflow_experiment_id = request.form.get('mlflow_experiment_id', '')
-    llm_model = request.form.get('llm_model', 'databricks-claude-3-7-sonnet')
+    llm_model = request.form.get('llm_model', DEFAULT_LLM_MODEL)
 
-    # Print debug information
-    print(f"Process transcript request received. Transcript length: {len(transcript)}")
-    print(f"Call agent ask: {call_agent_ask}")
-    print(f"MLflow experiment ID: {mlflow_experiment_id}")
-    print(f"LLM model: {llm_model}")
-    print(f"Form data: {request.form}")
+    log_event('transcript_request', transcript_chars=len(transcript), call_agent_ask=preview(call_agent_ask),
+              mlflow_experiment_id=mlflow_experiment_id, llm_model=llm_model)
 
     # Update session
-    session['transcript_input'] = transcript
-    session['mlflow_experiment_id'] = mlflow_experiment_id
-    session['llm_model'] = llm_model
-    session['processing'] = True
+    set_session_values(
+        transcript_input=transcript,
+        mlflow_experiment_id=mlflow_experiment_id,
+        llm_model=llm_model,
+        processing=True
+    )
 
     # Configure MLflow experiment if ID is provided
     if mlflow_experiment_id:
         try:
-            mlflow.set_experiment(experiment_id=mlflow_experiment_id)
-            print(f"MLflow experiment set to ID: {mlflow_experiment_id}")
+            with metrics.timer('mlflow_set_experiment'):
+                experiment_cache.activate(mlflow_experiment_id)
         except Exception as e:
-            print(f"Error setting MLflow experiment ID: {str(e)}")
-            return jsonify({
+            log_event('mlflow_set_experiment_failed', level='error',
+                      mlflow_experiment_id=mlflow_experiment_id, error=str(e))
+            return None, (jsonify({
                 'success': False,
                 'error': f'Invalid MLflow experiment ID: {mlflow_experiment_id}',
                 'user_message': f'Please check the MLflow experiment ID: {mlflow_experiment_id}',
-                'demo_state': session.get('demo_state', {})
-            }), 400
+                'demo_state': get_session_value('demo_state', {})
+            }), 400)
 
-    # Configure DSPy with selected model
+    # Start looking up the customers named in the transcript while the agent gets going
     try:
-        selected_llm = dspy.LM(f"databricks/{llm_model}", cache=False)
-        # dspy.configure(lm=selected_llm)
-        print(f"DSPy configured with model: databricks/{llm_model}")
-        
-        # Re-initialize transcript_routing with the new model configuration
-        transcript_routing = dspy.ReAct(transcript_router, tools=[sql_lookup], max_iters=3)
+        prefetch_customer_data(transcript)
     except Exception as e:
-        print(f"Error configuring DSPy with model {llm_model}: {str(e)}")
-        return jsonify({
+        log_event('customer_prefetch_failed', level='error', error=str(e))
+
+    # Look up the pre-built agent for the selected model
+    try:
+        agent_registry.get(llm_model)
+    except Exception as e:
+        log_event('llm_model_unavailable', level='error', llm_model=llm_model, error=str(e))
+        return None, (jsonify({
             'success': False,
             'error': f'Error configuring LLM model: {llm_model}',
             'user_message': f'Failed to configure the selected model: {llm_model}',
-            'demo_state': session.get('demo_state', {})
-        }), 500
+            'demo_state': get_session_value('demo_state', {})
+        }), 500)
+
+    return {
+        'transcript': transcript,
+        'call_agent_ask': call_agent_ask,
+        'mlflow_experiment_id': mlflow_experiment_id,
+        'llm_model': llm_model
+    }, None
+
+@app.route('/process_transcript', methods=['POST'])
+def process_transcript():
+    init_session()
+
+    request_state, error_response = start_transcript_request()
+    if error_response:
+        return error_response
+    transcript = request_state['transcript']
+    call_agent_ask = request_state['call_agent_ask']
+    llm_model = request_state['llm_model']
+    mlflow_experiment_id = request_state['mlflow_experiment_id']
 
+    import dspy
     try:
         # Process the transcript
-        mlflow_run = None
+        tracked_run = None
         try:
             # Start MLflow run with explicit error handling
-            mlflow_run = mlflow.start_run()
+            tracked_run = start_tracked_run('process_transcript', llm_model, mlflow_experiment_id)
 
-            print("Starting transcript processing with MLflow run ID:", mlflow_run.info.run_id)
-
-            # Call the transcript_routing function with the user's input
-            with dspy.context(lm=selected_llm):
-                response = transcript_routing(
-                    transcript=transcript,
-                    call_agent_ask=call_agent_ask if call_agent_ask else None,
-                    conversation_history=session.get('conversation_history', [])
-                )
+            log_event('transcript_processing_started', mlflow_run_id=tracked_run['run_id'])
 
-            print("Transcript processing completed successfully")
+            router_inputs = prepare_router_inputs(transcript)
 
-            # Validate response data
-            if not hasattr(response, 'relevant_information') or not response.relevant_information:
-                print("Warning: Response is missing relevant_information")
-                response.relevant_information = "No relevant information was found."
+            # Call the transcript_routing agent for the selected model with the user's input
+            with agent_registry.acquire(llm_model) as registered_agent:
+                with metrics.timer('agent', model=llm_model), dspy.context(lm=registered_agent.lm, track_usage=True):
+                    response = registered_agent.agent(
+                        transcript=router_inputs['transcript'],
+                        call_agent_ask=call_agent_ask if call_agent_ask else None,
+                        conversation_history=router_inputs['history']
+                    )
 
-            if not hasattr(response, 'queried_table'):
-                print("Warning: Response is missing queried_table")
-                response.queried_table = ""
+            log_event('transcript_processing_completed', llm_model=llm_model)
 
-            # Convert Markdown to HTML with error handling
-            try:
-                # Debug: print the raw markdown content
-                print("Raw markdown content:")
-                print(response.relevant_information)
-                print("=" * 50)
-                
-                # Use markdown2 with extras for better rendering
-                markdown_response = markdown2.markdown(
-                    response.relevant_information,
-                    extras=['fenced-code-blocks', 'tables', 'break-on-newline']
-                )
-                
-                # Debug: print the converted HTML
-                print("Converted HTML:")
-                print(markdown_response)
-                print("=" * 50)
-                
-                print("Markdown conversion successful")
-            except Exception as md_error:
-                print(f"Error converting markdown: {str(md_error)}")
-                # Fallback to plain text if markdown conversion fails
-                markdown_response = f"<pre>{response.relevant_information}</pre>"
-
-            # Store the response in the conversation history
-            conversation_history = session.get('conversation_history', [])
-            conversation_history.append({
-                "transcript": transcript,
-                "response": markdown_response,
-                "queried_table": response.queried_table
-            })
-            session['conversation_history'] = conversation_history
-            print("Conversation history updated")
-
-            # Store the response in session
-            session['ai_response'] = markdown_response
-
-            # Update demo state if we're in demo mode
-            demo_state = session.get('demo_state', {})
-            print("Demo state before update:", demo_state)
-            if demo_state:
-                # Check which turn was processed based on the transcript content
-                if transcript.strip() == example_transcript_turn_1.strip():
-                    demo_state['turn1_processed'] = True
-                    # If Turn 1 is processed, update current_turn to 2
-                    if not demo_state.get('turn2_processed', False):
-                        demo_state['current_turn'] = 2
-                    print("Turn 1 processed, updated demo_state:", demo_state)
-                elif transcript.strip() == example_transcript_turn_2.strip():
-                    demo_state['turn2_processed'] = True
-                    # If Turn 2 is processed, update current_turn to 3
-                    if not demo_state.get('turn3_processed', False):
-                        demo_state['current_turn'] = 3
-                    print("Turn 2 processed, updated demo_state:", demo_state)
-                elif transcript.strip() == example_transcript_turn_3.strip():
-                    demo_state['turn3_processed'] = True
-                    print("Turn 3 processed, updated demo_state:", demo_state)
-                session['demo_state'] = demo_state
-                print("Demo state after update:", demo_state)
+            prompt_tokens = record_prompt_tokens(response, router_inputs)
+            markdown_response = finish_turn(transcript, router_inputs, response, prompt_tokens)
+            tracked_run['status'] = 'FINISHED'
+            tracked_run['metrics']['prompt_tokens'] = prompt_tokens
 
             # Prepare the response
             result = {
                 'success': True,
                 'response': markdown_response,
-                'demo_state': session.get('demo_state', {})
+                'prompt_tokens': prompt_tokens,
+                'demo_state': get_session_value('demo_state', {})
             }
 
         finally:
             # Always end the MLflow run if it was started
-            if mlflow_run:
-                print("Ending MLflow run")
-                mlflow.end_run()
+            end_tracked_run(tracked_run)
 
             # Reset processing state regardless of success or failure
-            session['processing'] = False
+            set_session_values(processing=False)
 
         return jsonify(result)
 
+    except AgentBusyError as e:
+        log_event('agent_busy', level='warning', llm_model=llm_model, error=str(e))
+        set_session_values(processing=False)
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'user_message': f'The {llm_model} model is busy right now. Please try again in a moment.',
+            'demo_state': get_session_value('demo_state', {})
+        }), 503
+
     except Exception as e:
         # Handle errors with more detailed logging
         import traceback
         error_traceback = traceback.format_exc()
         error_message = f"An error occurred during processing: {str(e)}"
 
-        print("ERROR in process_transcript:")
-        print(error_message)
-        print(error_traceback)
+        log_event('process_transcript_failed', level='error', error=error_message, traceback=error_traceback)
 
         # Make sure processing state is reset
-        session['processing'] = False
+        set_session_values(processing=False)
 
         # Provide a user-friendly error message
         user_message = "Sorry, an error occurred while processing your transcript. Please try again."
@@ -345,9 +764,108 @@ def process_transcript():
             'success': False,
             'error': error_message,
             'user_message': user_message,
-            'demo_state': session.get('demo_state', {})
+            'demo_state': get_session_value('demo_state', {})
         }), 500
 
+@app.route('/process_transcript_stream', methods=['POST'])
+def process_transcript_stream():
+    """Same as /process_transcript, but streams Server-Sent Events while the agent works.
+
+    Events, in order: 'status' for tool-call progress (which table is being queried),
+    'token' with partial relevant_information markdown as the LLM writes it, then a
+    single 'final' event carrying the same payload /process_transcript returns, or 'error'.
+    """
+    init_session()
+
+    request_state, error_response = start_transcript_request()
+    if error_response:
+        return error_response
+    transcript = request_state['transcript']
+    call_agent_ask = request_state['call_agent_ask']
+    llm_model = request_state['llm_model']
+    mlflow_experiment_id = request_state['mlflow_experiment_id']
+
+    import dspy
+    from router_program import ToolProgressMessages
+
+    def generate():
+        tracked_run = None
+        try:
+            tracked_run = start_tracked_run('process_transcript_stream', llm_model, mlflow_experiment_id)
+            log_event('transcript_processing_started', mlflow_run_id=tracked_run['run_id'], streaming=True)
+            yield sse_event('status', {'message': "Analyzing the conversation..."})
+
+            router_inputs = prepare_router_inputs(transcript)
+
+            response = None
+            with agent_registry.acquire(llm_model) as registered_agent:
+                streaming_routing = dspy.streamify(
+                    registered_agent.agent,
+                    status_message_provider=ToolProgressMessages(),
+                    stream_listeners=[dspy.streaming.StreamListener(signature_field_name='relevant_information')],
+                    async_streaming=False
+                )
+                with metrics.timer('agent', model=llm_model), dspy.context(lm=registered_agent.lm, track_usage=True):
+                    for item in streaming_routing(
+                        transcript=router_inputs['transcript'],
+                        call_agent_ask=call_agent_ask if call_agent_ask else None,
+                        conversation_history=router_inputs['history']
+                    ):
+                        if isinstance(item, dspy.streaming.StatusMessage):
+                            yield sse_event('status', {'message': item.message})
+                        elif isinstance(item, dspy.streaming.StreamResponse):
+                            yield sse_event('token', {'chunk': item.chunk})
+                        elif isinstance(item, dspy.Prediction):
+                            response = item
+
+            if response is None:
+                raise RuntimeError("The agent finished without producing a response")
+            log_event('transcript_processing_completed', llm_model=llm_model, streaming=True)
+
+            prompt_tokens = record_prompt_tokens(response, router_inputs)
+            markdown_response = finish_turn(transcript, router_inputs, response, prompt_tokens)
+            tracked_run['status'] = 'FINISHED'
+            tracked_run['metrics']['prompt_tokens'] = prompt_tokens
+            yield sse_event('final', {
+                'success': True,
+                'response': markdown_response,
+                'prompt_tokens': prompt_tokens,
+                'demo_state': get_session_value('demo_state', {})
+            })
+        except Exception as e:
+            import traceback
+            error_message = f"An error occurred during processing: {str(e)}"
+            log_event('process_transcript_stream_failed', level='error', error=error_message,
+                      traceback=traceback.format_exc())
+
+            user_message = "Sorry, an error occurred while processing your transcript. Please try again."
+            if app.debug:
+                user_message += f" Error details: {str(e)}"
+            yield sse_event('error', {
+                'success': False,
+                'error': error_message,
+                'user_message': user_message,
+                'demo_state': get_session_value('demo_state', {})
+            })
+        finally:
+            end_tracked_run(tracked_run)
+            set_session_values(processing=False)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        # Disable proxy buffering so events reach the browser as soon as they are written
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Long recordings are split on silence into segments of at most AUDIO_MAX_SEGMENT_SECONDS
+# and transcribed by a pool of AUDIO_TRANSCRIBE_WORKERS concurrent endpoint requests
+AUDIO_MAX_SEGMENT_MS = int(os.environ.get('AUDIO_MAX_SEGMENT_SECONDS', '60')) * 1000
+AUDIO_TRANSCRIBE_WORKERS = int(os.environ.get('AUDIO_TRANSCRIBE_WORKERS', '4'))
+AUDIO_TRANSCRIBE_RETRIES = int(os.environ.get('AUDIO_TRANSCRIBE_RETRIES', '2'))
+# A file that can't be decoded here is sent whole, so it is held in memory; larger ones are refused
+AUDIO_MAX_UNSPLIT_BYTES = int(os.environ.get('AUDIO_MAX_UNSPLIT_BYTES', str(25 * 1024 * 1024)))
+
 @app.route('/process_audio', methods=['POST'])
 def process_audio():
     try:
@@ -360,81 +878,71 @@ def process_audio():
 
         audio_file = request.files['audio_file']
         filename = audio_file.filename
-        print(f"Received audio file: {filename}")
+        log_event('audio_received', filename=filename)
 
         # Strictly verify file format is WAV or MP3
         if not (filename.lower().endswith('.wav') or filename.lower().endswith('.mp3')):
             error_msg = f"Error: Received file with unsupported format: {filename}. Only WAV or MP3 formats are supported."
-            print(error_msg)
+            log_event('audio_format_unsupported', level='warning', filename=filename)
             return jsonify({
                 'success': False,
                 'error': error_msg
             }), 400
 
-        # Read the file as bytes
-        audio_bytes = audio_file.read()
-
-        # Log file size and format for debugging
-        file_format = filename.split('.')[-1].upper()
-        print(f"Processing {file_format} audio file, size: {len(audio_bytes)} bytes")
-
-        # Convert bytes to base64
-        audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-        print(f"Audio successfully converted to base64 (format: {file_format})")
-        print(f"Base64 string length: {len(audio_base64)} characters")
-        # Print just the first 50 characters of the base64 string for verification
-        print(f"Base64 preview: {audio_base64[:50]}...")
-
-        # Initialize MLflow client
-        client = mlflow.deployments.get_deploy_client("databricks")
-        endpoint_name = "gemma3n"
-
-        try:
-            # Get Databricks instance name
-            databricks_instance = "e2-demo-west.cloud.databricks.com"
-            endpoint_url = f"https://{databricks_instance}/ml/endpoints/{endpoint_name}"
-            print(f"Endpoint URL: {endpoint_url}")
-        except:
-            # For local development where dbutils might not be available
-            print("dbutils not available in this environment.")
-
-        # Process the audio using the MLflow endpoint
-        start_time = time.time()
-
-        # Prepare the request payload with the base64-encoded audio
-        # Include format information in the request
+        # Stream the upload to a temporary file instead of holding it in memory
         audio_format = filename.split('.')[-1].lower()
-        transcribe_prompt = f"transcribe the {audio_format} audio"
-        print(f"Using transcription prompt: '{transcribe_prompt}'")
+        audio_path = save_upload_to_tempfile(audio_file, suffix=f".{audio_format}")
+        try:
+            log_event('audio_processing_started', audio_format=audio_format, size_bytes=os.path.getsize(audio_path))
 
-        request_payload = {
-            "dataframe_split": {
-                "columns": ["text", "audio_base64", "image_base64"],
-                "data": [[transcribe_prompt, audio_base64, ""]]
-            }
-        }
+            # Initialize MLflow client
+            startup_error = wait_for_startup('mlflow')
+            if startup_error:
+                return startup_error
+            import mlflow.deployments
+            client = mlflow.deployments.get_deploy_client("databricks")
+            endpoint_name = "gemma3n"
 
-        # Log the request details (without the actual base64 data which would be too large)
-        print(f"Sending request to MLflow endpoint: {endpoint_name}")
-        print(f"Request payload structure: {list(request_payload['dataframe_split'].keys())}")
-        print(f"Audio format being sent: {audio_format}")
-        print(f"Request includes audio format in prompt: {transcribe_prompt}")
-        print(f"Columns being sent: {request_payload['dataframe_split']['columns']}")
-
-        # Send the request to the MLflow endpoint
-        response = client.predict(
-            endpoint=endpoint_name,
-            inputs=request_payload
-        )
+            # Process the audio using the MLflow endpoint
+            start_time = time.time()
 
-        end_time = time.time()
-        total_time = end_time - start_time
+            # Split long recordings on silence into bounded WAV segments and transcribe them in parallel.
+            # If the file can't be decoded here (e.g. no ffmpeg for MP3), send it whole as before.
+            try:
+                segments = iter_audio_segments(audio_path, audio_format, max_segment_ms=AUDIO_MAX_SEGMENT_MS)
+                first_segment = next(segments, None)
+                segments = itertools.chain([first_segment], segments) if first_segment is not None else iter(())
+                transcribe_fn = endpoint_transcriber(client, endpoint_name, 'wav')
+            except Exception as decode_error:
+                log_event('audio_split_failed', level='warning', error=str(decode_error))
+                if os.path.getsize(audio_path) > AUDIO_MAX_UNSPLIT_BYTES:
+                    return jsonify({
+                        'success': False,
+                        'error': f"The {audio_format} file could not be split and is too large to send whole "
+                                 f"(limit {AUDIO_MAX_UNSPLIT_BYTES // (1024 * 1024)} MB). Upload a WAV file instead."
+                    }), 413
+                with open(audio_path, 'rb') as f:
+                    segments = iter([f.read()])
+                transcribe_fn = endpoint_transcriber(client, endpoint_name, audio_format)
+
+            with metrics.timer('audio_transcription'):
+                transcripts = transcribe_segments(
+                    segments,
+                    transcribe_fn,
+                    max_workers=AUDIO_TRANSCRIBE_WORKERS,
+                    retries=AUDIO_TRANSCRIBE_RETRIES
+                )
 
-        print(f"Response received from MLflow endpoint")
-        print(f"Processing time: {total_time:.2f} seconds")
+            end_time = time.time()
+            total_time = end_time - start_time
 
-        # Extract the transcript from the response
-        transcript = response['predictions']['predictions']
+            log_event('audio_processing_completed', endpoint=endpoint_name, segments=len(transcripts),
+                      workers=AUDIO_TRANSCRIBE_WORKERS, seconds=round(total_time, 3))
+        finally:
+            os.remove(audio_path)
+
+        # Stitch the segment transcripts back together in order
+        transcript = stitch_transcripts(transcripts)
 
         return jsonify({
             'success': True,
@@ -443,25 +951,202 @@ def process_audio():
 
     except Exception as e:
         import traceback
-import dbdemos_tracker
         error_traceback = traceback.format_exc()
         error_message = f"An error occurred during audio processing: {str(e)}"
 
-        print("ERROR in process_audio:")
-        print(error_message)
-        print(error_traceback)
+        log_event('process_audio_failed', level='error', error=error_message, traceback=error_traceback)
 
         return jsonify({
             'success': False,
             'error': error_message
         }), 500
 
+# Live-call mode: the browser streams 16 kHz mono PCM over a WebSocket, the server transcribes
+# rolling windows and re-runs the agent once enough new dialogue has built up
+LIVE_CALL_WINDOW_SECONDS = float(os.environ.get('LIVE_CALL_WINDOW_SECONDS', '5'))
+LIVE_CALL_MAX_QUEUED_WINDOWS = int(os.environ.get('LIVE_CALL_MAX_QUEUED_WINDOWS', '4'))
+LIVE_CALL_MIN_NEW_CHARS = int(os.environ.get('LIVE_CALL_MIN_NEW_CHARS', '80'))
+
+@sock.route('/live_call')
+def live_call(ws):
+    """WebSocket protocol: a JSON 'start' message, then binary PCM frames, then a JSON 'stop' message.
+
+    The server sends JSON messages with an 'event' of 'transcript' (newly transcribed text),
+    'status', 'guidance' (rendered report for the latest dialogue) or 'error'.
+    """
+    # Reject a malformed start message before any session or endpoint client is created
+    try:
+        start = parse_start_message(ws.receive(), ALLOWED_LLM_MODELS, DEFAULT_LLM_MODEL)
+    except ValueError as e:
+        log_event('live_call_rejected', level='warning', error=str(e))
+        ws.send(json.dumps({'event': 'error', 'user_message': str(e)}))
+        return
+    for step in ('mlflow', 'agent'):
+        if not startup.wait(step, timeout=STARTUP_WAIT_TIMEOUT):
+            ws.send(json.dumps({'event': 'error', 'user_message': "The assistant is still starting up. Please try again in a moment."}))
+            return
+    import dspy
+    import mlflow.deployments
+    llm_model = start['llm_model']
+    call_agent_ask = start['call_agent_ask']
+    sample_rate = start['sample_rate']
+    log_event('live_call_started', llm_model=llm_model, sample_rate=sample_rate)
+
+    send_lock = threading.Lock()
+    call_summary = RollingCallSummary()
+
+    def send_event(event, data):
+        with send_lock:
+            ws.send(json.dumps(dict(data, event=event)))
+
+    def route(dialogue):
+        try:
+            prefetch_customer_data(dialogue)
+        except Exception as e:
+            log_event('customer_prefetch_failed', level='error', error=str(e))
+        with agent_registry.acquire(llm_model) as registered_agent:
+            with metrics.timer('agent', model=llm_model, mode='live'), dspy.context(lm=registered_agent.lm):
+                response = registered_agent.agent(
+                    transcript=dialogue,
+                    call_agent_ask=call_agent_ask,
+                    conversation_history=call_summary.as_history()
+                )
+        relevant_information = getattr(response, 'relevant_information', None) or "No relevant information was found."
+        call_summary.add_turn(dialogue, relevant_information, getattr(response, 'queried_table', ""))
+        return {'response': render_markdown(relevant_information)}
+
+    client = mlflow.deployments.get_deploy_client("databricks")
+    live_session = LiveCallSession(
+        send_event,
+        endpoint_transcriber(client, "gemma3n", 'wav'),
+        route,
+        sample_rate=sample_rate,
+        window_seconds=LIVE_CALL_WINDOW_SECONDS,
+        max_queued_windows=LIVE_CALL_MAX_QUEUED_WINDOWS,
+        min_new_chars=LIVE_CALL_MIN_NEW_CHARS
+    )
+    try:
+        while True:
+            message = ws.receive()
+            if message is None:
+                break
+            if isinstance(message, (bytes, bytearray)):
+                live_session.add_audio(message)
+                continue
+            try:
+                message_type = json.loads(message).get('type')
+            except (ValueError, AttributeError):
+                # Not a JSON object; tell the browser but keep the call going
+                log_event('live_call_bad_message', level='warning', message=preview(message))
+                send_event('error', {'user_message': "Ignored a message that was not a JSON object."})
+                continue
+            if message_type == 'stop':
+                break
+    except ConnectionClosed:
+        log_event('live_call_disconnected')
+    finally:
+        live_session.close()
+        log_event('live_call_ended', **live_session.stats())
+
+# Every stats() below is also exported as gauges on /metrics
+metrics.register_collector('spark_session', spark_sessions.stats)
+metrics.register_collector('query_cache', query_cache.stats)
+metrics.register_collector('prompt_tokens', prompt_token_tracker.stats, label='turn')
+metrics.register_collector('agent_registry', agent_registry.stats, label='model')
+metrics.register_collector('batch_lookup', batch_query_runner.stats)
+if profile_snapshot:
+    metrics.register_collector('profile_snapshot', profile_snapshot.stats)
+if transcript_index:
+    metrics.register_collector('transcript_index', transcript_index.stats)
+if llm_response_cache:
+    metrics.register_collector('llm_response_cache', llm_response_cache.stats)
+if customer_prefetcher:
+    metrics.register_collector('customer_prefetch', customer_prefetcher.stats)
+if async_run_logger:
+    metrics.register_collector('mlflow_telemetry', async_run_logger.stats)
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """200 once every start-up step is warm, 503 before; lists each step's state either way."""
+    status = {
+        'ready': startup.ready,
+        'deferred': DEFERRED_STARTUP,
+        'import_seconds': APP_IMPORT_SECONDS,
+        'steps': startup.status()
+    }
+    if profile_snapshot:
+        status['profile_snapshot_ready'] = profile_snapshot.ready
+    if transcript_index:
+        status['transcript_index_ready'] = transcript_index.ready
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latency histograms, counters and component stats in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/mlflow_telemetry_stats', methods=['GET'])
+def mlflow_telemetry_stats():
+    stats = {'async': MLFLOW_ASYNC_TELEMETRY, 'experiments': experiment_cache.stats()}
+    if async_run_logger:
+        stats['runs'] = async_run_logger.stats()
+    return jsonify(stats)
+
+@app.route('/spark_session_stats', methods=['GET'])
+def spark_session_stats():
+    return jsonify(spark_sessions.stats())
+
+@app.route('/query_cache_stats', methods=['GET'])
+def query_cache_stats():
+    return jsonify(query_cache.stats())
+
+@app.route('/profile_snapshot_stats', methods=['GET'])
+def profile_snapshot_stats():
+    if not profile_snapshot:
+        return jsonify({'enabled': False})
+    return jsonify(dict(profile_snapshot.stats(), enabled=True))
+
+@app.route('/transcript_index_stats', methods=['GET'])
+def transcript_index_stats():
+    if not transcript_index:
+        return jsonify({'enabled': False})
+    return jsonify(dict(transcript_index.stats(), enabled=True))
+
+@app.route('/customer_prefetch_stats', methods=['GET'])
+def customer_prefetch_stats():
+    if not customer_prefetcher:
+        return jsonify({'enabled': False})
+    return jsonify(dict(customer_prefetcher.stats(), enabled=True))
+
+@app.route('/batch_lookup_stats', methods=['GET'])
+def batch_lookup_stats():
+    return jsonify(batch_query_runner.stats())
+
+@app.route('/prompt_token_stats', methods=['GET'])
+def prompt_token_stats():
+    return jsonify({'incremental_mode': INCREMENTAL_TRANSCRIPT_MODE, 'turns': prompt_token_tracker.stats()})
+
+@app.route('/agent_registry_stats', methods=['GET'])
+def agent_registry_stats():
+    return jsonify(agent_registry.stats())
+
+@app.route('/llm_response_cache_stats', methods=['GET'])
+def llm_response_cache_stats():
+    if not llm_response_cache:
+        return jsonify({'enabled': False})
+    return jsonify(dict(llm_response_cache.stats(), enabled=True))
+
 @app.route('/clear_history', methods=['POST'])
 def clear_history():
-    if 'conversation_history' in session:
-        session['conversation_history'] = []
+    if 'browser_session_id' in session:
+        conversation_store.clear_history(session['browser_session_id'])
+        set_session_values(call_summary={}, processed_line_keys=[], turn_count=0)
     return jsonify({'success': True})
 
+APP_IMPORT_SECONDS = round(time.perf_counter() - _import_started, 3)
+log_event('app_imported', seconds=APP_IMPORT_SECONDS, deferred_startup=DEFERRED_STARTUP)
+
 if __name__ == '__main__':
+    import dbdemos_tracker
     dbdemos_tracker.initialize()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,228 @@
+import base64
+import io
+import itertools
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from structured_log import log_event
+
+
+def save_upload_to_tempfile(file_storage, suffix, chunk_size=1024 * 1024):
+    """Stream an uploaded file to a named temporary file and return its path."""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, 'wb') as temp_file:
+        shutil.copyfileobj(file_storage.stream, temp_file, chunk_size)
+    return path
+
+
+def plan_segments(speech_ranges, total_ms, max_segment_ms):
+    """Group speech ranges into [start, end) segments no longer than max_segment_ms.
+
+    Segments are cut in the silence between speech ranges where possible; a single
+    stretch of speech longer than max_segment_ms is cut at fixed intervals.
+    """
+    segments = []
+    current_start = current_end = None
+    for start, end in speech_ranges:
+        # Hard-split speech that is too long for one segment on its own
+        while end - start > max_segment_ms:
+            if current_start is not None:
+                segments.append((current_start, current_end))
+                current_start = None
+            segments.append((start, start + max_segment_ms))
+            start += max_segment_ms
+        if current_start is None:
+            current_start, current_end = start, end
+        elif end - current_start <= max_segment_ms:
+            current_end = end
+        else:
+            segments.append((current_start, current_end))
+            current_start, current_end = start, end
+    if current_start is not None:
+        segments.append((current_start, current_end))
+    if not segments and total_ms > 0:
+        segments.append((0, min(total_ms, max_segment_ms)))
+    return segments
+
+
+def iter_audio_segments(path, audio_format, max_segment_ms=60000, min_silence_ms=700,
+                        silence_thresh_offset=16, keep_silence_ms=200):
+    """Yield WAV-encoded segments of the audio file at path, split on silence.
+
+    The recording is decoded max_segment_ms at a time and down-mixed to 16 kHz mono, the
+    rate the transcription endpoint expects. Each decoded window is planned together
+    with the unfinished tail of the previous one, so memory stays around two windows
+    whatever the length of the call. Segments are encoded one at a time as they are
+    consumed, so only the segments currently in flight exist as encoded bytes.
+    """
+    from pydub.silence import detect_nonsilent
+
+    audio = None
+    first_window = None
+    emitted = 0
+    windows = _decode_windows(path, audio_format, max_segment_ms)
+    while True:
+        with metrics.timer('audio_decode', audio_format=audio_format):
+            window = next(windows, None)
+        last = window is None
+        if not last:
+            audio = window if audio is None else audio + window
+            if first_window is None:
+                first_window = window
+        if audio is None:
+            break
+        speech_ranges = detect_nonsilent(
+            audio,
+            min_silence_len=min_silence_ms,
+            silence_thresh=audio.dBFS - silence_thresh_offset,
+            seek_step=10
+        )
+        segments = plan_segments(speech_ranges, len(audio), max_segment_ms) if speech_ranges else []
+        if not last and segments:
+            # The last segment may continue into the next window; plan it again with that window
+            carry_from = max(0, segments.pop()[0] - keep_silence_ms)
+        else:
+            carry_from = len(audio)
+        for start, end in segments:
+            emitted += 1
+            yield _encode_wav(audio[max(0, start - keep_silence_ms):min(len(audio), end + keep_silence_ms)])
+        audio = audio[carry_from:] if carry_from < len(audio) else None
+        if last:
+            break
+    if not emitted and first_window is not None:
+        # No speech detected: send the start of the recording anyway
+        yield _encode_wav(first_window[:max_segment_ms])
+
+
+def _decode_windows(path, audio_format, window_ms):
+    """Yield the recording as consecutive 16 kHz mono AudioSegments of window_ms each."""
+    from pydub import AudioSegment
+
+    if audio_format == 'wav':
+        try:
+            wav_file = wave.open(path, 'rb')
+        except wave.Error:
+            # Not plain PCM (e.g. float samples); let ffmpeg decode it
+            wav_file = None
+        if wav_file is not None:
+            with wav_file:
+                frame_rate = wav_file.getframerate()
+                frames_per_window = max(1, frame_rate * window_ms // 1000)
+                while True:
+                    data = wav_file.readframes(frames_per_window)
+                    if not data:
+                        return
+                    yield AudioSegment(data=data, sample_width=wav_file.getsampwidth(), frame_rate=frame_rate,
+                                       channels=wav_file.getnchannels()).set_channels(1).set_frame_rate(16000)
+
+    # ffmpeg streams the decoded samples, so only one window of them is held at a time
+    process = subprocess.Popen(
+        [AudioSegment.converter, '-nostdin', '-v', 'error', '-f', audio_format, '-i', path,
+         '-f', 's16le', '-ac', '1', '-ar', '16000', '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    window_bytes = 16000 * 2 * window_ms // 1000
+    decoded = False
+    try:
+        while True:
+            data = process.stdout.read(window_bytes)
+            if not data:
+                break
+            decoded = True
+            yield AudioSegment(data=data, sample_width=2, frame_rate=16000, channels=1)
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        error = process.stderr.read().decode('utf-8', 'replace').strip()
+        process.stderr.close()
+        process.wait()
+    if not decoded:
+        raise RuntimeError(f"Could not decode {audio_format} audio: {error or 'no audio stream'}")
+
+
+def _encode_wav(audio):
+    buffer = io.BytesIO()
+    with metrics.timer('audio_encode'):
+        audio.export(buffer, format='wav')
+    return buffer.getvalue()
+
+
+def transcribe_segments(segments, transcribe_fn, max_workers=4, retries=2, retry_backoff=1.0):
+    """Transcribe audio segments concurrently and return their transcripts in order.
+
+    At most max_workers segments are encoded and in flight at once, which keeps memory
+    bounded for long recordings. Each segment is retried up to retries times with
+    exponential backoff before the whole transcription fails. Once a segment has failed
+    no further segments are decoded or sent, and the others stop retrying.
+    """
+    failed = threading.Event()
+
+    def transcribe_with_retries(index, segment):
+        for attempt in range(retries + 1):
+            try:
+                return transcribe_fn(segment)
+            except Exception as e:
+                if attempt == retries or failed.is_set():
+                    raise
+                delay = retry_backoff * (2 ** attempt)
+                log_event('segment_transcription_retry', level='warning', segment=index, error=str(e), delay_seconds=delay)
+                time.sleep(delay)
+
+    def on_done(future):
+        # Flag the failure before freeing the slot, so the loop below sees it
+        if future.exception() is not None:
+            failed.set()
+        in_flight.release()
+
+    in_flight = threading.BoundedSemaphore(max_workers)
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcribe") as executor:
+        segments = iter(segments)
+        for index in itertools.count():
+            # Don't decode the next segment until a worker is free to take it
+            in_flight.acquire()
+            segment = None if failed.is_set() else next(segments, None)
+            if segment is None:
+                break
+            future = executor.submit(transcribe_with_retries, index, segment)
+            future.add_done_callback(on_done)
+            futures.append(future)
+        return [future.result() for future in futures]
+
+
+def endpoint_transcriber(client, endpoint_name, audio_format='wav'):
+    """Return a transcribe_fn that sends one audio segment to the model serving endpoint."""
+    transcribe_prompt = f"transcribe the {audio_format} audio"
+
+    def transcribe(audio_bytes):
+        with metrics.timer('audio_encode', encoding='base64'):
+            request_payload = {
+                "dataframe_split": {
+                    "columns": ["text", "audio_base64", "image_base64"],
+                    "data": [[transcribe_prompt, base64.b64encode(audio_bytes).decode('utf-8'), ""]]
+                }
+            }
+        with metrics.timer('transcription_endpoint_call', endpoint=endpoint_name):
+            response = client.predict(endpoint=endpoint_name, inputs=request_payload)
+        return response['predictions']['predictions']
+
+    return transcribe
+
+
+def stitch_transcripts(transcripts):
+    parts = []
+    for transcript in transcripts:
+        if isinstance(transcript, list):
+            transcript = " ".join(str(part) for part in transcript)
+        transcript = str(transcript).strip()
+        if transcript:
+            parts.append(transcript)
+    return "\n".join(parts)
@@ -0,0 +1,296 @@
+"""Run transcript_router over a backlog of transcripts, outside the Flask app.
+
+    python batch_analysis.py transcripts.jsonl --output guidance.jsonl
+    python batch_analysis.py austin_choi_demo_catalog.agents.transcripts --output guidance.jsonl \\
+        --concurrency 16 --model databricks-claude-3-7-sonnet --rate-limit databricks-claude-3-7-sonnet=120
+    python batch_analysis.py calls.parquet --output guidance.jsonl --resume
+
+The source is a JSONL file, a Parquet file or a table name. Every row needs a transcript
+column; an id column (--id-field) identifies it in the output, otherwise a hash of the
+transcript does (numbered when the same transcript appears more than once). Rows are analyzed --concurrency at a time, each with an empty
+conversation history, spread round-robin over the --model endpoints. --rate-limit caps
+the LM requests per minute sent to a model.
+
+Results are appended to --output as one JSON line per row as soon as the row finishes, so
+the output is also the checkpoint. With --resume, rows that already have a result there
+are skipped, and rows that failed are tried again.
+
+Customers named in a transcript get their profile looked up in the background, and the
+results are kept for the whole run. Later rows about the same customer reuse those
+results instead of querying the warehouse again. App settings read from the environment
+at import time (query cache sizes, Spark concurrency, ...) apply as usual.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import dspy
+
+import metrics
+from structured_log import log_event
+
+
+class RateLimiter:
+    """Spaces calls evenly so no more than per_minute start in any minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RateLimitCallback(dspy.utils.callback.BaseCallback):
+    """Holds each LM request until its model's rate limiter lets it through."""
+
+    def __init__(self, limiters):
+        # Keyed by model name without the "databricks/" provider prefix
+        self.limiters = limiters
+
+    def on_lm_start(self, call_id, instance, inputs):
+        model_name = str(getattr(instance, 'model', '')).split('/', 1)[-1]
+        limiter = self.limiters.get(model_name)
+        if limiter:
+            limiter.acquire()
+
+
+def row_key(row, id_field, transcript_field, seen=None):
+    """The row's id, else a hash of its transcript; with seen, repeats of a transcript get -2, -3, ... appended."""
+    if row.get(id_field) not in (None, ''):
+        return str(row[id_field])
+    key = hashlib.sha1(str(row.get(transcript_field) or '').encode('utf-8')).hexdigest()[:16]
+    if seen is not None:
+        seen[key] += 1
+        if seen[key] > 1:
+            key = f"{key}-{seen[key]}"
+    return key
+
+
+def iter_source_rows(source, spark_sessions, limit=None, batch_size=1000):
+    """Yield rows (dicts) from a .jsonl or .parquet file, or from a table by name."""
+    if source.endswith('.jsonl'):
+        rows = _iter_jsonl(source)
+    elif source.endswith('.parquet') or os.path.isdir(source):
+        rows = _iter_parquet(source, batch_size)
+    else:
+        rows = _iter_table(spark_sessions, source)
+    return itertools.islice(rows, limit) if limit else rows
+
+
+def _iter_jsonl(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _iter_parquet(path, batch_size):
+    import pyarrow.dataset as ds
+
+    for batch in ds.dataset(path, format='parquet').to_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def _iter_table(spark_sessions, table_name):
+    # Stream the rows a partition at a time. This holds none of run()'s query slots while the
+    # rows are analyzed, so the agent's own lookups aren't starved.
+    dataframe = spark_sessions.get_session().sql(f"SELECT * FROM {table_name}")
+    for row in dataframe.toLocalIterator():
+        yield row.asDict(recursive=True)
+
+
+def load_checkpoint(output_path):
+    """Return the keys that already have a successful result in output_path."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line of a run that crashed mid-write
+                continue
+            if 'error' in record:
+                completed.discard(record['key'])
+            else:
+                completed.add(record['key'])
+    return completed
+
+
+def open_output(output_path, resume):
+    if not resume:
+        return open(output_path, 'x')
+    output = open(output_path, 'a+')
+    # Start on a fresh line if a crash left a partial record at the end
+    if output.tell() > 0:
+        output.seek(output.tell() - 1)
+        if output.read(1) != '\n':
+            output.write('\n')
+    return output
+
+
+def prefetch_profiles(app, transcript):
+    if not app.customer_prefetcher:
+        return []
+    snapshot_ready = app.profile_snapshot is not None and app.profile_snapshot.ready
+    entities = app.extract_customer_entities(transcript, app.profile_snapshot.keys() if snapshot_ready else None)
+    # Only profiles are shared across rows; past transcripts are mostly different per call
+    if entities['customer_names'] and not snapshot_ready:
+        app.customer_prefetcher.prefetch(entities['customer_names'], [app.CUSTOMER_PROFILES_TABLE])
+    return entities['customer_names']
+
+
+def analyze_row(app, key, row, llm_model, transcript_field, call_agent_ask, callbacks):
+    transcript = row[transcript_field]
+    started_at = time.perf_counter()
+    customer_names = prefetch_profiles(app, transcript)
+    with app.agent_registry.acquire(llm_model) as registered_agent:
+        with metrics.timer('agent', model=llm_model), \
+                dspy.context(lm=registered_agent.lm, track_usage=True, callbacks=callbacks):
+            response = registered_agent.agent(
+                transcript=transcript,
+                call_agent_ask=row.get('call_agent_ask') or call_agent_ask,
+                conversation_history=[]
+            )
+    return {
+        'key': key,
+        'llm_model': llm_model,
+        'customer_names': customer_names,
+        'queried_table': getattr(response, 'queried_table', '') or '',
+        'relevant_information': getattr(response, 'relevant_information', '') or '',
+        'prompt_tokens': app.count_prompt_tokens(response, transcript),
+        'latency_seconds': round(time.perf_counter() - started_at, 3),
+    }
+
+
+def run_batch(app, rows, output, models, concurrency, rate_limits, completed, id_field='id',
+              transcript_field='transcript', call_agent_ask=None, progress_interval=30):
+    """Analyze rows with up to concurrency in flight, writing each result to output as it finishes."""
+    callbacks = list(dspy.settings.callbacks or [])
+    if rate_limits:
+        callbacks.append(RateLimitCallback({model: RateLimiter(limit) for model, limit in rate_limits.items()}))
+    model_cycle = itertools.cycle(models)
+    counts = {'succeeded': 0, 'failed': 0, 'skipped': 0}
+    started_at = last_progress = time.time()
+
+    def write_result(key, future):
+        try:
+            record = future.result()
+            counts['succeeded'] += 1
+        except Exception as e:
+            record = {'key': key, 'error': str(e)}
+            counts['failed'] += 1
+            log_event('batch_row_failed', level='warning', key=key, error=str(e))
+        output.write(json.dumps(record) + '\n')
+        output.flush()
+
+    pending = {}
+    seen = Counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-analysis") as executor:
+        for row in rows:
+            key = row_key(row, id_field, transcript_field, seen)
+            if key in completed or not row.get(transcript_field):
+                counts['skipped'] += 1
+                continue
+            completed.add(key)
+            # Keep only a couple of batches in flight so large sources are streamed, not loaded up front
+            while len(pending) >= concurrency * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write_result(pending.pop(future), future)
+            future = executor.submit(analyze_row, app, key, row, next(model_cycle), transcript_field,
+                                     call_agent_ask, callbacks)
+            pending[future] = key
+
+            if time.time() - last_progress >= progress_interval:
+                last_progress = time.time()
+                log_event('batch_progress', in_flight=len(pending), elapsed_seconds=round(last_progress - started_at),
+                          **counts)
+        for future in wait(pending).done:
+            write_result(pending.pop(future), future)
+
+    counts['elapsed_seconds'] = round(time.time() - started_at, 1)
+    return counts
+
+
+def parse_rate_limits(settings):
+    rate_limits = {}
+    for setting in settings:
+        model, _, per_minute = setting.partition('=')
+        rate_limits[model] = float(per_minute)
+    return rate_limits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help="A .jsonl or .parquet file, or a table name")
+    parser.add_argument('--output', required=True, help="JSONL file the results are appended to")
+    parser.add_argument('--resume', action='store_true', help="Continue a previous run into the same --output")
+    parser.add_argument('--model', action='append', dest='models',
+                        help="LLM serving endpoint to use (repeatable; rows are spread round-robin)")
+    parser.add_argument('--rate-limit', action='append', default=[], metavar='MODEL=REQUESTS_PER_MINUTE',
+                        help="Cap the LM requests per minute sent to a model (repeatable)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Rows analyzed at the same time")
+    parser.add_argument('--id-field', default='id')
+    parser.add_argument('--transcript-field', default='transcript')
+    parser.add_argument('--call-agent-ask', default="Summarize the guidance and recommended actions for this call.",
+                        help="Ask used for rows without a call_agent_ask column")
+    parser.add_argument('--limit', type=int, help="Analyze at most this many rows of the source")
+    parser.add_argument('--profile-cache-ttl', type=int, default=24 * 3600,
+                        help="Seconds a customer's profile lookup is reused across rows")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.output) and not args.resume:
+        parser.error(f"{args.output} already exists; pass --resume to continue that run")
+
+    # The app reads these at import time; every row should get an agent slot without timing out
+    os.environ.setdefault('AGENT_MAX_CONCURRENT_PER_MODEL', str(args.concurrency))
+    os.environ.setdefault('AGENT_ACQUIRE_TIMEOUT', str(24 * 3600))
+    os.environ.setdefault('CUSTOMER_PREFETCH_TTL', str(args.profile_cache_ttl))
+    os.environ.setdefault('QUERY_CACHE_PROFILES_TTL', str(args.profile_cache_ttl))
+    import app
+    app.startup.wait('agent')
+
+    models = args.models or [app.DEFAULT_LLM_MODEL]
+    for model in models + list(parse_rate_limits(args.rate_limit)):
+        if model not in app.ALLOWED_LLM_MODELS:
+            parser.error(f"Unsupported LLM model: {model}")
+
+    completed = load_checkpoint(args.output) if args.resume else set()
+    if completed:
+        log_event('batch_resumed', completed=len(completed))
+    with open_output(args.output, args.resume) as output:
+        counts = run_batch(
+            app,
+            iter_source_rows(args.source, app.spark_sessions, args.limit),
+            output,
+            models,
+            args.concurrency,
+            parse_rate_limits(args.rate_limit),
+            completed,
+            id_field=args.id_field,
+            transcript_field=args.transcript_field,
+            call_agent_ask=args.call_agent_ask
+        )
+    log_event('batch_finished', output=args.output, query_cache=app.query_cache.stats(),
+              customer_prefetch=app.customer_prefetcher.stats() if app.customer_prefetcher else None, **counts)
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from structured_log import log_event
+
+
+class BatchQueryRunner:
+    """Runs several independent queries from one agent step concurrently.
+
+    Queries go to a shared pool of max_workers threads through run_query. Each query
+    gets query_timeout seconds from the moment a worker starts it; a query still queued
+    query_timeout seconds after the batch began is cancelled instead. Each query's
+    result is reported on its own, so one failing or slow query doesn't lose the others.
+    At most max_queries run per batch and the rest are reported as skipped. Queries that
+    time out keep running in the background; while max_abandoned of them are still
+    running, new queries are refused so hung queries can't take over the whole pool.
+    """
+
+    def __init__(self, run_query, max_workers=8, query_timeout=60, max_queries=5, max_abandoned=None):
+        self.run_query = run_query
+        self.query_timeout = query_timeout
+        self.max_queries = max_queries
+        self.max_abandoned = max_abandoned if max_abandoned is not None else max(1, max_workers // 2)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-lookup")
+        self._lock = threading.Lock()
+        self._abandoned = 0
+
+        self.batches = 0
+        self.queries = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.refused = 0
+
+    def run(self, queries):
+        """Return one {'query', 'result'} or {'query', 'error'} entry per query, in order."""
+        if isinstance(queries, str):
+            queries = [queries]
+        queries = [query for query in queries if query and str(query).strip()]
+        accepted, skipped = queries[:self.max_queries], queries[self.max_queries:]
+
+        with self._lock:
+            refused = self._abandoned >= self.max_abandoned
+        if refused:
+            accepted, skipped = [], queries
+        batch_started = time.monotonic()
+        started_at = {}
+
+        def run_one(index, query):
+            started_at[index] = time.monotonic()
+            return self.run_query(query)
+
+        futures = [self._executor.submit(run_one, index, query) for index, query in enumerate(accepted)]
+        outcomes = {}
+        pending = set(range(len(futures)))
+        while pending:
+            now = time.monotonic()
+            for index in list(pending):
+                # Deadlines count from when a worker picked the query up, or from the batch start while queued
+                if now < started_at.get(index, batch_started) + self.query_timeout:
+                    continue
+                if futures[index].cancel():
+                    outcomes[index] = 'cancelled'
+                elif index in started_at:
+                    outcomes[index] = 'timeout'
+                    self._abandon(futures[index])
+                else:
+                    # It started between the two checks; give it its own deadline
+                    continue
+                pending.discard(index)
+            if not pending:
+                break
+            next_deadline = min(started_at.get(index, batch_started) + self.query_timeout for index in pending)
+            done, _ = wait([futures[index] for index in pending], timeout=max(0.0, next_deadline - now),
+                           return_when=FIRST_COMPLETED)
+            pending -= {index for index in pending if futures[index] in done}
+
+        results = []
+        failures = timeouts = cancelled = 0
+        for index, (query, future) in enumerate(zip(accepted, futures)):
+            outcome = outcomes.get(index)
+            if outcome == 'timeout':
+                timeouts += 1
+                results.append({'query': query, 'error': f"Timed out after {self.query_timeout} seconds"})
+                continue
+            if outcome == 'cancelled':
+                cancelled += 1
+                results.append({'query': query, 'error': f"Not started within {self.query_timeout} seconds, "
+                                                         f"the lookup pool is busy"})
+                continue
+            try:
+                results.append({'query': query, 'result': future.result()})
+            except Exception as e:
+                failures += 1
+                log_event('batched_query_failed', level='warning', error=str(e))
+                results.append({'query': query, 'error': str(e)})
+        for query in skipped:
+            if refused:
+                results.append({'query': query, 'error': "Refused, earlier lookups are still running; try again later"})
+            else:
+                results.append({'query': query, 'error': f"Skipped, at most {self.max_queries} queries run per batch"})
+        if refused:
+            log_event('batched_queries_refused', level='warning', queries=len(queries), max_abandoned=self.max_abandoned)
+
+        with self._lock:
+            self.batches += 1
+            self.queries += len(accepted)
+            self.failures += failures
+            self.timeouts += timeouts
+            self.cancelled += cancelled
+            self.refused += len(queries) if refused else 0
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'queries': self.queries,
+                'avg_queries_per_batch': self.queries / self.batches if self.batches else 0.0,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'cancelled': self.cancelled,
+                'refused': self.refused,
+                'abandoned_running': self._abandoned,
+            }
+
+    def _abandon(self, future):
+        # Leave it running; a cache or prefetch may still pick up its result later
+        with self._lock:
+            self._abandoned += 1
+        future.add_done_callback(self._release_abandoned)
+
+    def _release_abandoned(self, future):
+        with self._lock:
+            self._abandoned -= 1
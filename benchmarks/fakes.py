@@ -0,0 +1,382 @@
+"""Local stand-ins for the remote services app.py talks to, for offline benchmarking.
+
+Each fake sleeps for a configurable latency (with jitter) and returns a payload of a
+configurable size, so scenarios can model a fast or slow workspace on a plain Linux
+box. install() patches them in before app is imported; patch_app() swaps the pieces
+app binds at import time.
+"""
+import io
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import wave
+from types import SimpleNamespace
+
+import pyarrow as pa
+
+
+DEFAULT_CONFIG = {
+    # LM serving endpoint
+    'lm_latency_ms': 800,
+    'lm_ms_per_output_char': 0.05,
+    'lm_response_chars': 1500,
+    'lm_tool_calls_per_turn': 1,
+    'lm_stream_chunk_chars': 24,
+    # Serverless Spark
+    'spark_connect_ms': 2000,
+    'spark_query_ms': 600,
+    'spark_rows': 20,
+    'spark_text_chars': 400,
+    # Delta tables get a new version every delta_commit_seconds, adding delta_rows_per_commit rows
+    'delta_commit_seconds': 60,
+    'delta_rows_per_commit': 2,
+    # MLflow tracking
+    'mlflow_set_experiment_ms': 50,
+    'mlflow_start_run_ms': 80,
+    'mlflow_end_run_ms': 80,
+    # gemma3n transcription endpoint
+    'transcribe_latency_ms': 1500,
+    'transcribe_ms_per_audio_second': 40,
+    # Relative jitter applied to every latency, e.g. 0.2 for +/-20%
+    'jitter': 0.2,
+}
+
+
+class FakeServices:
+    def __init__(self, config=None, seed=0):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.calls = {}
+        self._calls_lock = threading.Lock()
+        self.started_at = time.time()
+
+    def configure(self, **overrides):
+        self.config.update(overrides)
+
+    def sleep(self, milliseconds):
+        time.sleep(self.jittered_seconds(milliseconds))
+
+    def jittered_seconds(self, milliseconds):
+        with self._random_lock:
+            factor = 1 + self._random.uniform(-self.config['jitter'], self.config['jitter'])
+        return max(0.0, milliseconds * factor) / 1000
+
+    def count(self, service):
+        with self._calls_lock:
+            self.calls[service] = self.calls.get(service, 0) + 1
+
+    def reset_counts(self):
+        with self._calls_lock:
+            counts, self.calls = self.calls, {}
+        return counts
+
+    # LM: replaces dspy's litellm completion call, so dspy.LM, CachedLM and the adapters run as usual.
+    # Inside dspy.streamify the reply is also sent in chunks through dspy's send_stream, as litellm
+    # would with stream=True: lm_latency_ms until the first chunk, then lm_ms_per_output_char per character.
+
+    def lm_completion(self, request, num_retries=0, cache=None, **kwargs):
+        self.count('lm')
+        content = self._lm_reply(request.get('messages') or [])
+        stream, predict_id = _send_stream()
+        if stream is None:
+            self.sleep(self.config['lm_latency_ms'] + len(content) * self.config['lm_ms_per_output_char'])
+        else:
+            from asyncer import syncify
+            syncify(self._stream_reply)(stream, predict_id, request.get('model', 'fake'), content)
+        return _model_response(request.get('model', 'fake'), request.get('messages') or [], content)
+
+    async def lm_acompletion(self, request, num_retries=0, cache=None, **kwargs):
+        import asyncio
+
+        self.count('lm')
+        content = self._lm_reply(request.get('messages') or [])
+        stream, predict_id = _send_stream()
+        if stream is None:
+            await asyncio.sleep(self.jittered_seconds(
+                self.config['lm_latency_ms'] + len(content) * self.config['lm_ms_per_output_char']))
+        else:
+            await self._stream_reply(stream, predict_id, request.get('model', 'fake'), content)
+        return _model_response(request.get('model', 'fake'), request.get('messages') or [], content)
+
+    async def _stream_reply(self, stream, predict_id, model, content):
+        import asyncio
+        from litellm.types.utils import Delta, ModelResponseStream, StreamingChoices
+
+        await asyncio.sleep(self.jittered_seconds(self.config['lm_latency_ms']))
+        chunk_chars = self.config['lm_stream_chunk_chars']
+        for start in range(0, len(content), chunk_chars):
+            piece = content[start:start + chunk_chars]
+            await asyncio.sleep(self.jittered_seconds(len(piece) * self.config['lm_ms_per_output_char']))
+            chunk = ModelResponseStream(model=model, choices=[StreamingChoices(delta=Delta(content=piece))])
+            if predict_id is not None:
+                # dspy's stream listeners only accept chunks tagged with the predictor that asked for them
+                chunk.predict_id = predict_id
+            await stream.send(chunk)
+
+    def _lm_reply(self, messages):
+        system = next((m['content'] for m in messages if m.get('role') == 'system'), '')
+        last_user = next((m['content'] for m in reversed(messages) if m.get('role') == 'user'), '')
+        if isinstance(last_user, list):
+            last_user = " ".join(part.get('text', '') for part in last_user if isinstance(part, dict))
+
+        if '[[ ## next_tool_name ## ]]' in system:
+            # A ReAct step: query until the configured number of tool calls is reached, then finish
+            observations = len(re.findall(r"\[\[ ## observation_\d+ ## \]\]", last_user))
+            if observations < self.config['lm_tool_calls_per_turn']:
+                customer = _customer_name(last_user)
+                if observations % 2 == 1 and 'find_similar_calls' in system:
+                    args = {'situation': "customer frustrated about a delayed multi-stop pickup"}
+                    return _chat_fields(next_thought="See how other agents handled similar calls.",
+                                        next_tool_name='find_similar_calls', next_tool_args=json.dumps(args))
+                table = 'customer_profiles' if observations % 2 == 0 else 'transcripts'
+                args = {'sql_query': f"SELECT * FROM austin_choi_demo_catalog.agents.{table} "
+                                     f"WHERE customer_name = '{customer}'"}
+                return _chat_fields(next_thought=f"Look up {table} for {customer}.",
+                                    next_tool_name='sql_lookup', next_tool_args=json.dumps(args))
+            return _chat_fields(next_thought="I have what the agent needs.", next_tool_name='finish',
+                                next_tool_args='{}')
+
+        report = _markdown_report(self.config['lm_response_chars'])
+        return _chat_fields(reasoning="Summarised the lookups for the call agent.",
+                            queried_table='austin_choi_demo_catalog.agents.customer_profiles',
+                            relevant_information=report)
+
+    # Spark: DatabricksSession.builder.serverless(True).getOrCreate() returns a FakeSparkSession
+
+    def databricks_session_class(self):
+        services = self
+
+        class FakeBuilder:
+            def serverless(self, enabled=True):
+                return self
+
+            def getOrCreate(self):
+                services.count('spark_connect')
+                services.sleep(services.config['spark_connect_ms'])
+                return FakeSparkSession(services)
+
+        class FakeDatabricksSession:
+            builder = FakeBuilder()
+
+        return FakeDatabricksSession
+
+    def fetch_arrow(self, spark, sql_query, max_rows, max_text_chars):
+        """Stand-in for result_fetch.fetch_arrow, which needs pyspark column functions."""
+        table = spark.sql(sql_query).toArrow()
+        columns = {}
+        for name in table.column_names:
+            values = table[name].to_pylist()
+            if pa.types.is_string(table[name].type):
+                values = [value[:max_text_chars] if isinstance(value, str) else value for value in values]
+            columns[name] = values
+        return pa.table(columns).slice(0, max_rows + 1)
+
+    def delta_version(self):
+        return int((time.time() - self.started_at) / self.config['delta_commit_seconds'])
+
+    def fake_rows(self, sql_query):
+        if sql_query.lstrip().upper().startswith('DESCRIBE HISTORY'):
+            return pa.Table.from_pylist([{'version': self.delta_version()}])
+        changes = re.search(r"table_changes\('([^']+)', (\d+), (\d+)\)", sql_query)
+        if changes:
+            return self._fake_changes(changes.group(1), int(changes.group(2)), int(changes.group(3)))
+        customer = (re.findall(r"'((?:[^']|'')*)'", sql_query) or ['Avery Johnson'])[0]
+        text = ("The customer asked about a delayed multi-stop pickup. " * 50)[:self.config['spark_text_chars']]
+        rows = []
+        for i in range(self.config['spark_rows']):
+            if 'transcripts' in sql_query.lower():
+                rows.append({'agent_name': f"Agent {i}", 'customer_name': customer, 'tone': 'frustrated',
+                             'topic': 'pickup scheduling', 'transcript': text})
+            else:
+                rows.append({'customer_name': customer, 'total_calls': 10 + i, 'complaint_calls': i,
+                             'avg_sentiment_score': 0.4, 'customer_lifetime_value': 120000.0 + i,
+                             'profitability_class': 'high', 'recommended_action': text[:120]})
+        return pa.Table.from_pylist(rows)
+
+    def _fake_changes(self, table_name, start_version, end_version):
+        # Past calls are appended; profiles are rewritten in place
+        change_type = 'insert' if 'transcripts' in table_name.lower() else 'update_postimage'
+        rows = []
+        for version in range(start_version, end_version + 1):
+            for i in range(self.config['delta_rows_per_commit']):
+                row = self.fake_rows(f"SELECT * FROM {table_name} WHERE customer_name = 'Customer {version}-{i}'")
+                rows.append(dict(row.to_pylist()[0], _change_type=change_type, _commit_version=version))
+        return pa.Table.from_pylist(rows)
+
+    # MLflow tracking and the model serving deploy client
+
+    def set_experiment(self, experiment_name=None, experiment_id=None, **kwargs):
+        self.count('mlflow_set_experiment')
+        self.sleep(self.config['mlflow_set_experiment_ms'])
+        return SimpleNamespace(experiment_id=experiment_id or '0', name=experiment_name)
+
+    def start_run(self, *args, **kwargs):
+        self.count('mlflow_start_run')
+        self.sleep(self.config['mlflow_start_run_ms'])
+        return SimpleNamespace(info=SimpleNamespace(run_id=f"fake-{time.time_ns()}"))
+
+    def end_run(self, *args, **kwargs):
+        self.count('mlflow_end_run')
+        self.sleep(self.config['mlflow_end_run_ms'])
+
+    def get_deploy_client(self, target_uri=None):
+        return FakeDeployClient(self)
+
+    def mlflow_client_class(self):
+        services = self
+
+        class FakeMlflowClient:
+            # The calls the async run logger makes from its background thread
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def create_run(self, experiment_id, start_time=None, tags=None, **kwargs):
+                return services.start_run()
+
+            def log_batch(self, run_id, metrics=(), params=(), tags=(), **kwargs):
+                services.count('mlflow_log_batch')
+
+            def set_terminated(self, run_id, status=None, end_time=None):
+                services.end_run()
+
+        return FakeMlflowClient
+
+
+class FakeSparkSession:
+    def __init__(self, services):
+        self.services = services
+
+    def sql(self, sql_query):
+        self.services.count('spark_query')
+        self.services.sleep(self.services.config['spark_query_ms'])
+        return FakeDataFrame(self.services.fake_rows(sql_query))
+
+    def stop(self):
+        pass
+
+
+class FakeDataFrame:
+    def __init__(self, table):
+        self.table = table
+
+    def toArrow(self):
+        return self.table
+
+    def collect(self):
+        return [FakeRow(row) for row in self.table.to_pylist()]
+
+
+class FakeRow(dict):
+    """Like pyspark's Row, readable both as row['version'] and as row.version."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class FakeDeployClient:
+    def __init__(self, services):
+        self.services = services
+
+    def predict(self, endpoint=None, inputs=None):
+        self.services.count('transcribe')
+        audio_base64 = inputs['dataframe_split']['data'][0][1]
+        # 16 kHz 16-bit mono WAV is ~32000 bytes per second, ~43000 once base64-encoded
+        audio_seconds = len(audio_base64) / 43000
+        self.services.sleep(self.services.config['transcribe_latency_ms']
+                            + audio_seconds * self.services.config['transcribe_ms_per_audio_second'])
+        words = int(audio_seconds * 2.5) or 1
+        return {'predictions': {'predictions': " ".join(["pickup"] * words)}}
+
+
+def install(services):
+    """Patch the fakes into dspy, databricks-connect and mlflow. Call before importing app."""
+    import databricks.connect
+    import dspy.clients.lm
+    import mlflow
+    import mlflow.deployments
+    import mlflow.dspy
+    import mlflow.tracking
+
+    dspy.clients.lm.litellm_completion = services.lm_completion
+    dspy.clients.lm.alitellm_completion = services.lm_acompletion
+    databricks.connect.DatabricksSession = services.databricks_session_class()
+    mlflow.set_experiment = services.set_experiment
+    mlflow.start_run = services.start_run
+    mlflow.end_run = services.end_run
+    mlflow.tracking.MlflowClient = services.mlflow_client_class()
+    mlflow.deployments.get_deploy_client = services.get_deploy_client
+    # Traces would be exported to the workspace; the fakes model the tracking calls instead
+    mlflow.dspy.autolog = lambda *args, **kwargs: None
+
+
+def patch_app(app_module, services):
+    """Swap the pieces app binds at import time."""
+    app_module.fetch_arrow = services.fetch_arrow
+
+
+def wav_bytes(seconds, sample_rate=16000, speech_seconds=4.0, pause_seconds=1.0):
+    """A mono 16-bit WAV of alternating tone ("speech") and silence, so silence splitting has work to do."""
+    frames = bytearray()
+    period = speech_seconds + pause_seconds
+    for i in range(int(seconds * sample_rate)):
+        t = i / sample_rate
+        speaking = (t % period) < speech_seconds
+        sample = int(8000 * math.sin(2 * math.pi * 220 * t)) if speaking else 0
+        frames += struct.pack('<h', sample)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def _send_stream():
+    """The stream dspy.streamify opened for the current call (or None) and the id of the calling predictor."""
+    import dspy
+
+    stream = dspy.settings.send_stream
+    caller_predict = dspy.settings.caller_predict
+    return stream, (id(caller_predict) if caller_predict is not None else None)
+
+
+def _customer_name(text):
+    match = re.search(r"this is ([A-Z][a-z]+ [A-Z][a-z]+)", text)
+    return match.group(1) if match else 'Avery Johnson'
+
+
+def _chat_fields(**fields):
+    parts = [f"[[ ## {name} ## ]]\n{value}" for name, value in fields.items()]
+    return "\n\n".join(parts + ["[[ ## completed ## ]]"])
+
+
+def _markdown_report(chars):
+    lines = ["## Customer Summary", "", "| Field | Value |", "|---|---|"]
+    i = 0
+    while sum(len(line) + 1 for line in lines) < chars:
+        lines.append(f"| detail {i} | value {i} for the call agent |")
+        i += 1
+    lines += ["", "**Recommended response:** Offer a consolidated pickup with expedited service."]
+    return "\n".join(lines)
+
+
+def _model_response(model, messages, content):
+    import litellm
+
+    prompt_tokens = sum(len(str(m.get('content', ''))) for m in messages) // 4
+    completion_tokens = len(content) // 4
+    return litellm.ModelResponse(
+        model=model,
+        choices=[{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+        usage={'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+               'total_tokens': prompt_tokens + completion_tokens},
+    )
@@ -0,0 +1,64 @@
+"""Where the time goes when app.py is imported.
+
+    python -m benchmarks.import_profile
+    python -m benchmarks.import_profile --module batch_analysis --top 40
+    python -m benchmarks.import_profile --env DEFERRED_STARTUP=false
+
+Imports the module in a fresh interpreter with -X importtime and lists the slowest
+imports by cumulative time, plus the total. Only modules imported while the module
+itself loads are counted; with deferred start-up (the default), the imports done by the
+background start-up steps are reported by /ready instead.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+
+def profile_imports(module, env=None):
+    """Return (total_seconds, [(cumulative_seconds, self_seconds, depth, name), ...]) for importing module."""
+    # Exit right after the import so background start-up threads don't add to the trace
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}, os; os._exit(0)"],
+        capture_output=True, text=True, env=dict(os.environ, **(env or {})),
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((int(cumulative_us) / 1e6, int(self_us) / 1e6, depth, name.strip()))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    total = next((entry[0] for entry in reversed(entries) if entry[3] == module), None)
+    return total, entries
+
+
+def print_profile(module, total, entries, top):
+    print(f"import {module}: {total:.3f}s" if total is not None else f"import {module}")
+    print(f"{'cumulative':>11} {'self':>9}  module")
+    for cumulative, self_seconds, depth, name in sorted(entries, reverse=True)[:top]:
+        print(f"{cumulative:>10.3f}s {self_seconds:>8.3f}s  {'  ' * depth}{name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='app', help="Module to import")
+    parser.add_argument('--top', type=int, default=25, help="How many of the slowest imports to list")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="Environment setting for the profiled interpreter (repeatable)")
+    args = parser.parse_args(argv)
+
+    env = {'LOG_LEVEL': 'WARNING'}
+    for setting in args.env:
+        key, _, value = setting.partition('=')
+        env[key] = value
+    total, entries = profile_imports(args.module, env)
+    print_profile(args.module, total, entries, args.top)
+    return total
+
+
+if __name__ == '__main__':
+    main()
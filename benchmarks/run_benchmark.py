@@ -0,0 +1,347 @@
+"""Offline load test for app.py against local stand-ins of the Databricks services.
+
+    python -m benchmarks.run_benchmark
+    python -m benchmarks.run_benchmark --only transcript_concurrent --output after.json --compare before.json
+    python -m benchmarks.run_benchmark --env INCREMENTAL_TRANSCRIPT_MODE=true
+    python -m benchmarks.run_benchmark --only transcript_similar_calls --env TRANSCRIPT_INDEX_ENABLED=true
+
+Each line of the scenarios file is one scenario: a request mix (routes with weights and
+form inputs), how many requests to send and from how many concurrent clients, and
+overrides for the fake services (see benchmarks.fakes.DEFAULT_CONFIG). The app is served
+in-process by a threaded werkzeug server; every client keeps its own session cookie.
+Reports throughput, latency percentiles per route, peak RSS and how often each fake
+service was called. App settings read from the environment at import time apply to the
+whole run, so pass them with --env.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import queue
+import random
+import resource
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+from benchmarks import fakes
+
+
+DEFAULT_SCENARIOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios.jsonl')
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def current_rss_bytes():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRssSampler:
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def __enter__(self):
+        self.peak = current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_bytes())
+
+
+class BenchmarkClient:
+    """One simulated browser: its own cookie jar, so its own server-side session."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        self.opener.open(base_url + '/', timeout=timeout).read()
+
+    def send(self, spec):
+        route = spec['route']
+        if route == 'process_audio':
+            body, content_type = multipart_body({'audio_file': ('call.wav', spec['audio'], 'audio/wav')})
+        else:
+            body = urllib.parse.urlencode(spec['form']).encode('utf-8')
+            content_type = 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(self.base_url + '/' + route, data=body,
+                                         headers={'Content-Type': content_type})
+
+        start = time.perf_counter()
+        first_byte = first_token = None
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status = response.status
+                first_chunk = response.read(1)
+                first_byte = time.perf_counter() - start
+                if route == 'process_transcript_stream':
+                    # Read event by event to time the first partial answer
+                    lines = [first_chunk + response.readline()]
+                    for line in response:
+                        if first_token is None and line.startswith(b'event: token'):
+                            first_token = time.perf_counter() - start
+                        lines.append(line)
+                    payload = b"".join(lines)
+                else:
+                    payload = first_chunk + response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except Exception as e:
+            return {'route': route, 'ok': False, 'status': None, 'error': str(e),
+                    'seconds': time.perf_counter() - start, 'first_byte_seconds': None, 'first_token_seconds': None}
+        seconds = time.perf_counter() - start
+
+        ok = status == 200
+        if ok and route == 'process_transcript_stream':
+            ok = b'event: final' in payload
+        elif ok:
+            try:
+                ok = bool(json.loads(payload).get('success'))
+            except ValueError:
+                ok = False
+        return {'route': route, 'ok': ok, 'status': status, 'seconds': seconds, 'first_byte_seconds': first_byte,
+                'first_token_seconds': first_token}
+
+
+def multipart_body(files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field, (filename, content, content_type) in files.items():
+        parts.append(
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode('utf-8'))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def build_requests(scenario, app_module, seed):
+    """Expand the scenario's weighted mix into the list of requests to send."""
+    rng = random.Random(seed)
+    audio_cache = {}
+    mix = scenario['mix']
+    weights = [entry.get('weight', 1) for entry in mix]
+    specs = []
+    for _ in range(scenario['requests']):
+        entry = rng.choices(mix, weights=weights)[0]
+        route = entry['route']
+        if route == 'process_audio':
+            seconds = entry.get('audio_seconds', 30)
+            if seconds not in audio_cache:
+                audio_cache[seconds] = fakes.wav_bytes(seconds)
+            specs.append({'route': route, 'audio': audio_cache[seconds]})
+            continue
+        transcript = entry.get('transcript', 'example_transcript_turn_1')
+        # Names of the demo transcripts in app.py can be used instead of literal text
+        transcript = getattr(app_module, transcript, transcript)
+        specs.append({'route': route, 'form': {
+            'transcript': transcript,
+            'call_agent_ask': entry.get('call_agent_ask', ''),
+            'mlflow_experiment_id': entry.get('mlflow_experiment_id', ''),
+            'llm_model': entry.get('llm_model', app_module.DEFAULT_LLM_MODEL),
+        }})
+    return specs
+
+
+def run_scenario(scenario, app_module, services, base_url, seed, timeout):
+    services.config = dict(fakes.DEFAULT_CONFIG, **scenario.get('fakes', {}))
+    specs = build_requests(scenario, app_module, seed)
+    concurrency = scenario.get('concurrency', 1)
+
+    clients = [BenchmarkClient(base_url, timeout) for _ in range(concurrency)]
+    for client, spec in zip(clients, specs[:scenario.get('warmup', 0)]):
+        client.send(spec)
+    services.reset_counts()
+
+    work = queue.Queue()
+    for spec in specs:
+        work.put(spec)
+    results = []
+    results_lock = threading.Lock()
+
+    def worker(client):
+        while True:
+            try:
+                spec = work.get_nowait()
+            except queue.Empty:
+                return
+            result = client.send(spec)
+            with results_lock:
+                results.append(result)
+
+    with PeakRssSampler() as rss:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(client,), daemon=True) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - started
+
+    return summarize(scenario, results, wall_seconds, rss.peak, services.reset_counts())
+
+
+def summarize(scenario, results, wall_seconds, peak_rss, service_calls):
+    def latency_summary(values):
+        values = sorted(values)
+        summary = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+        summary['mean'] = sum(values) / len(values) if values else None
+        summary['max'] = values[-1] if values else None
+        return summary
+
+    routes = {}
+    for route in sorted({result['route'] for result in results}):
+        route_results = [result for result in results if result['route'] == route]
+        routes[route] = {
+            'requests': len(route_results),
+            'errors': sum(1 for result in route_results if not result['ok']),
+            'latency_seconds': latency_summary([result['seconds'] for result in route_results]),
+            'first_byte_seconds': latency_summary([result['first_byte_seconds'] for result in route_results
+                                                   if result['first_byte_seconds'] is not None]),
+            'first_token_seconds': latency_summary([result['first_token_seconds'] for result in route_results
+                                                    if result.get('first_token_seconds') is not None]),
+        }
+    return {
+        'scenario': scenario['name'],
+        'concurrency': scenario.get('concurrency', 1),
+        'requests': len(results),
+        'errors': sum(1 for result in results if not result['ok']),
+        'wall_seconds': wall_seconds,
+        'throughput_rps': len(results) / wall_seconds if wall_seconds else 0.0,
+        'latency_seconds': latency_summary([result['seconds'] for result in results]),
+        'peak_rss_mb': peak_rss / (1024 * 1024),
+        'routes': routes,
+        'service_calls': service_calls,
+    }
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def print_report(report, baseline=None):
+    baseline_by_name = {entry['scenario']: entry for entry in (baseline or {}).get('scenarios', [])}
+    print()
+    print(f"{'scenario':<28}{'req':>6}{'err':>5}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'rss MB':>9}")
+    for entry in report['scenarios']:
+        latency = entry['latency_seconds']
+        print(f"{entry['scenario']:<28}{entry['requests']:>6}{entry['errors']:>5}{entry['throughput_rps']:>8.2f}"
+              f"{format_seconds(latency['p50']):>9}{format_seconds(latency['p95']):>9}"
+              f"{format_seconds(latency['p99']):>9}{entry['peak_rss_mb']:>9.0f}")
+        for route, route_entry in entry['routes'].items():
+            route_latency = route_entry['latency_seconds']
+            print(f"  {route:<26}{route_entry['requests']:>6}{route_entry['errors']:>5}{'':>8}"
+                  f"{format_seconds(route_latency['p50']):>9}{format_seconds(route_latency['p95']):>9}"
+                  f"{format_seconds(route_latency['p99']):>9}")
+            first_token = route_entry['first_token_seconds']
+            if first_token['p50'] is not None:
+                print(f"    first token: p50 {format_seconds(first_token['p50'])}, "
+                      f"p95 {format_seconds(first_token['p95'])}")
+        print(f"  service calls: {json.dumps(entry['service_calls'], sort_keys=True)}")
+
+        previous = baseline_by_name.get(entry['scenario'])
+        if previous:
+            def change(new, old):
+                return "-" if not old or new is None else f"{(new - old) / old * 100:+.1f}%"
+            print(f"  vs baseline: rps {change(entry['throughput_rps'], previous['throughput_rps'])}, "
+                  f"p95 {change(latency['p95'], previous['latency_seconds']['p95'])}, "
+                  f"p99 {change(latency['p99'], previous['latency_seconds']['p99'])}, "
+                  f"rss {change(entry['peak_rss_mb'], previous['peak_rss_mb'])}")
+
+
+def load_scenarios(path, only=None):
+    scenarios = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                scenarios.append(json.loads(line))
+    if only:
+        scenarios = [scenario for scenario in scenarios if scenario['name'] in only]
+    return scenarios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS, help="JSONL file of scenarios")
+    parser.add_argument('--only', nargs='+', help="Run only the named scenarios")
+    parser.add_argument('--output', help="Write the report as JSON to this path")
+    parser.add_argument('--compare', help="A previous --output report to compare against")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="App setting to apply before the app is imported (repeatable)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=600, help="Per-request timeout in seconds")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    for setting in args.env:
+        key, _, value = setting.partition('=')
+        os.environ[key] = value
+
+    services = fakes.FakeServices(seed=args.seed)
+    fakes.install(services)
+    import app as app_module
+    fakes.patch_app(app_module, services)
+
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="benchmark-server", daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'env': {setting.partition('=')[0]: setting.partition('=')[2] for setting in args.env},
+        'scenarios': [],
+    }
+    try:
+        for scenario in load_scenarios(args.scenarios, args.only):
+            print(f"Running {scenario['name']}: {scenario['requests']} requests, "
+                  f"concurrency {scenario.get('concurrency', 1)}", file=sys.stderr)
+            report['scenarios'].append(
+                run_scenario(scenario, app_module, services, base_url, args.seed, args.timeout)
+            )
+    finally:
+        server.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ConversationStore(abc.ABC):
+    """Server-side per-session state, keyed by the browser_session_id kept in the cookie.
+
+    Each session holds a small dict of values (current transcript, last response,
+    selected model, demo state, ...) and a conversation history bounded to max_turns
+    entries, oldest dropped first. Sessions idle for longer than idle_ttl seconds expire:
+    on their next access, or when purge_expired() runs, which the stores do at most every
+    purge_interval seconds as sessions are written.
+    """
+
+    def __init__(self, max_turns=20, idle_ttl=4 * 3600):
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+
+    def get_value(self, session_id, key, default=None):
+        return self.get_values(session_id).get(key, default)
+
+    @abc.abstractmethod
+    def get_values(self, session_id):
+        pass
+
+    @abc.abstractmethod
+    def set_values(self, session_id, **values):
+        pass
+
+    @abc.abstractmethod
+    def get_history(self, session_id):
+        pass
+
+    @abc.abstractmethod
+    def append_turn(self, session_id, turn):
+        pass
+
+    @abc.abstractmethod
+    def clear_history(self, session_id):
+        pass
+
+    @abc.abstractmethod
+    def delete(self, session_id):
+        pass
+
+    @abc.abstractmethod
+    def purge_expired(self):
+        pass
+
+    @abc.abstractmethod
+    def stats(self):
+        pass
+
+
+class MemoryConversationStore(ConversationStore):
+    """In-process store with LRU eviction once more than max_sessions are active.
+
+    State lives in the worker process, so it only suits single-process deployments.
+    """
+
+    def __init__(self, max_sessions=1000, purge_interval=300, **kwargs):
+        super().__init__(**kwargs)
+        self.max_sessions = max_sessions
+        self.purge_interval = purge_interval
+        self._last_purge = time.time()
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_values(self, session_id):
+        with self._lock:
+            entry = self._touch(session_id, create=False)
+            return dict(entry['values']) if entry else {}
+
+    def set_values(self, session_id, **values):
+        with self._lock:
+            self._touch(session_id)['values'].update(values)
+            if time.time() - self._last_purge > self.purge_interval:
+                self._purge()
+
+    def get_history(self, session_id):
+        with self._lock:
+            entry = self._touch(session_id, create=False)
+            return list(entry['history']) if entry else []
+
+    def append_turn(self, session_id, turn):
+        with self._lock:
+            history = self._touch(session_id)['history']
+            history.append(turn)
+            del history[:-self.max_turns]
+
+    def clear_history(self, session_id):
+        with self._lock:
+            entry = self._touch(session_id, create=False)
+            if entry:
+                entry['history'] = []
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def purge_expired(self):
+        with self._lock:
+            return self._purge()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'sessions': len(self._sessions),
+                'turns': sum(len(entry['history']) for entry in self._sessions.values()),
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    # Callers must hold self._lock
+    def _touch(self, session_id, create=True):
+        entry = self._sessions.get(session_id)
+        now = time.time()
+        if entry and entry['last_access'] < now - self.idle_ttl:
+            del self._sessions[session_id]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            if not create:
+                return None
+            entry = {'values': {}, 'history': []}
+            self._sessions[session_id] = entry
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        entry['last_access'] = now
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def _purge(self):
+        self._last_purge = time.time()
+        cutoff = self._last_purge - self.idle_ttl
+        expired = [sid for sid, entry in self._sessions.items() if entry['last_access'] < cutoff]
+        for session_id in expired:
+            del self._sessions[session_id]
+        self.expirations += len(expired)
+        return len(expired)
+
+
+class SqliteConversationStore(ConversationStore):
+    """Store backed by a local SQLite file, shared by every worker process on the host."""
+
+    def __init__(self, path, purge_interval=300, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self.expirations = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                session_values TEXT NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                turn TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS turns_by_session ON turns (session_id, id);
+            CREATE INDEX IF NOT EXISTS sessions_by_access ON sessions (last_access);
+        """)
+
+    def get_values(self, session_id):
+        with self._lock:
+            row = self._live_session(session_id)
+            return json.loads(row[0]) if row else {}
+
+    def set_values(self, session_id, **values):
+        with self._lock:
+            # IMMEDIATE takes the write lock before the read, so another worker process
+            # can't write the session between our read and our write and lose its update
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._live_session(session_id)
+                merged = json.loads(row[0]) if row else {}
+                merged.update(values)
+                self._connection.execute(
+                    "INSERT INTO sessions (session_id, session_values, last_access) VALUES (?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET session_values = excluded.session_values, "
+                    "last_access = excluded.last_access",
+                    (session_id, json.dumps(merged), time.time())
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._maybe_purge()
+
+    def get_history(self, session_id):
+        with self._lock:
+            if not self._live_session(session_id):
+                return []
+            rows = self._connection.execute(
+                "SELECT turn FROM turns WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+            return [json.loads(row[0]) for row in rows]
+
+    def append_turn(self, session_id, turn):
+        with self._lock:
+            if not self._live_session(session_id):
+                self._connection.execute(
+                    "INSERT INTO sessions (session_id, session_values, last_access) VALUES (?, '{}', ?)",
+                    (session_id, time.time())
+                )
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.execute(
+                    "INSERT INTO turns (session_id, turn) VALUES (?, ?)", (session_id, json.dumps(turn))
+                )
+                self._connection.execute(
+                    "DELETE FROM turns WHERE session_id = ? AND id NOT IN "
+                    "(SELECT id FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                    (session_id, session_id, self.max_turns)
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def clear_history(self, session_id):
+        with self._lock:
+            self._connection.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._delete(session_id)
+
+    def purge_expired(self):
+        with self._lock:
+            return self._purge()
+
+    def stats(self):
+        with self._lock:
+            sessions = self._connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            turns = self._connection.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+        return {
+            'backend': 'sqlite',
+            'sessions': sessions,
+            'turns': turns,
+            'expirations': self.expirations,
+        }
+
+    # Callers must hold self._lock
+    def _live_session(self, session_id):
+        now = time.time()
+        row = self._connection.execute(
+            "SELECT session_values, last_access FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < now - self.idle_ttl:
+            self._delete(session_id)
+            self.expirations += 1
+            return None
+        self._connection.execute(
+            "UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id)
+        )
+        return row
+
+    def _delete(self, session_id):
+        self._connection.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+        self._connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _maybe_purge(self):
+        if time.time() - self._last_purge > self.purge_interval:
+            self._purge()
+
+    def _purge(self):
+        self._last_purge = time.time()
+        cutoff = self._last_purge - self.idle_ttl
+        expired = [row[0] for row in self._connection.execute(
+            "SELECT session_id FROM sessions WHERE last_access < ?", (cutoff,)
+        ).fetchall()]
+        for session_id in expired:
+            self._delete(session_id)
+        self.expirations += len(expired)
+        return len(expired)
+
+
+def create_conversation_store(backend, path=None, **kwargs):
+    if backend == 'memory':
+        return MemoryConversationStore(**kwargs)
+    if backend == 'sqlite':
+        return SqliteConversationStore(path or 'conversations.db', **kwargs)
+    raise ValueError(f"Unknown conversation store backend: {backend}")
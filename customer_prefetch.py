@@ -0,0 +1,201 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from query_cache import parse_point_lookup
+from structured_log import log_event
+
+
+# Self-introductions such as "this is Avery Johnson" or "my name is Avery Johnson".
+# "this is Austin speaking" is the agent introducing themselves and is collected separately.
+_NAME = r"([A-Z][a-z'\-]+(?: [A-Z][a-z'\-]+){0,2})"
+_AGENT_INTRODUCTION = re.compile(r"(?i:this is|my name is|i am|i'm) " + _NAME + r",? (?i:speaking)\b")
+_SELF_INTRODUCTION = re.compile(r"(?i:this is|my name is|i am|i'm) " + _NAME + r"\b(?!,? (?i:speaking)\b)")
+_SPEAKER_LINE = re.compile(r"^\s*" + _NAME + r"\s*:(.*)$", re.MULTILINE)
+# "this is Monday" or "I'm March 3rd" are dates, not names
+_CALENDAR_WORDS = frozenset("""
+monday tuesday wednesday thursday friday saturday sunday january february march april may june july
+august september october november december
+""".split())
+# Account numbers like AJ78542 or QS-0042113
+_ACCOUNT_NUMBER = re.compile(r"\b[A-Z]{1,4}-?\d{4,10}\b")
+
+
+def extract_customer_entities(transcript, known_customers=None):
+    """Find the customer names and account numbers mentioned in a transcript, without an LLM.
+
+    When known_customers is given, the names are the known customer names that appear in
+    the text and nothing else. Otherwise they come from self-introductions and from
+    multi-word speaker labels of anyone who is not the agent. The agent is the first
+    speaker, anyone who says "this is <name> speaking", and any speaker who introduces
+    themselves by first name only. Returns {'customer_names': [...], 'account_numbers': [...]}.
+    """
+    names = []
+
+    def add_name(name, agents=()):
+        lowered_name = name.lower()
+        if lowered_name in agents or any(lowered_name in agent for agent in agents):
+            return
+        if all(word in _CALENDAR_WORDS for word in lowered_name.split()):
+            return
+        if all(lowered_name != existing.lower() for existing in names):
+            names.append(name)
+
+    if known_customers:
+        # Spelled as stored in the tables
+        lowered = transcript.lower()
+        for customer in known_customers:
+            if customer and str(customer).lower() in lowered:
+                add_name(str(customer))
+    else:
+        speaker_lines = _SPEAKER_LINE.findall(transcript)
+        agents = {agent.lower() for agent in _AGENT_INTRODUCTION.findall(transcript)}
+        if speaker_lines:
+            agents.add(speaker_lines[0][0].lower())
+        for label, text in speaker_lines:
+            first_names = [name for name in _SELF_INTRODUCTION.findall(text) if ' ' not in name]
+            if first_names:
+                agents.add(label.lower())
+                agents.update(name.lower() for name in first_names)
+        for name in _SELF_INTRODUCTION.findall(transcript):
+            add_name(name, agents)
+        for label, _ in speaker_lines:
+            # A full name as a speaker label is usually the caller; agents are labelled by first name
+            if ' ' in label:
+                add_name(label, agents)
+
+    account_numbers = []
+    for account_number in _ACCOUNT_NUMBER.findall(transcript):
+        if account_number not in account_numbers:
+            account_numbers.append(account_number)
+    return {'customer_names': names, 'account_numbers': account_numbers}
+
+
+def _sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+class CustomerPrefetcher:
+    """Runs the per-customer lookups the agent usually asks for before it asks for them.
+
+    prefetch() starts one background query per (table, customer) through run_query,
+    typically while the agent's first LLM step is still running. try_lookup() then
+    answers an agent query that is a point lookup by key_column on one of those tables
+    from the in-flight or finished prefetch, waiting up to wait_timeout seconds for it,
+    instead of sending a second, serial query to the warehouse. Prefetched results are
+    reused for ttl seconds.
+    """
+
+    def __init__(self, run_query, tables, key_column='customer_name', max_workers=4, ttl=120,
+                 wait_timeout=30):
+        self.run_query = run_query
+        self.tables = list(tables)
+        self.key_column = key_column
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="customer-prefetch")
+        self._prefetches = {}
+        self._lock = threading.Lock()
+
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def prefetch(self, customer_names, tables=None):
+        """Start lookups for customer_names on tables (all configured tables by default)."""
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            for table_name in tables or self.tables:
+                for customer_name in customer_names:
+                    key = (table_name, customer_name)
+                    if key in self._prefetches:
+                        continue
+                    sql_query = (f"SELECT * FROM {table_name} "
+                                 f"WHERE {self.key_column} = {_sql_string(customer_name)}")
+                    self._prefetches[key] = (self._executor.submit(self.run_query, sql_query), now)
+                    self.started += 1
+                    log_event('customer_prefetch_started', table=table_name, customer_name=customer_name)
+
+    def try_lookup(self, sql_query):
+        """Answer sql_query from prefetched rows if possible.
+
+        Returns (True, rows) when answered, (False, None) when the query must run as usual.
+        """
+        lookup = parse_point_lookup(sql_query)
+        if not lookup or lookup['key'] != self.key_column:
+            return False, None
+        table_name = self._table_for(lookup['table'])
+        if table_name is None:
+            return False, None
+
+        with self._lock:
+            self._purge_expired(time.time())
+            prefetches = [self._prefetches.get((table_name, key)) for key in lookup['keys']]
+        if not prefetches or any(prefetch is None for prefetch in prefetches):
+            self.misses += 1
+            return False, None
+
+        rows, notices = [], []
+        try:
+            for future, _ in prefetches:
+                for row in future.result(timeout=self.wait_timeout):
+                    (notices if '_notice' in row else rows).append(row)
+        except TimeoutError:
+            self.misses += 1
+            return False, None
+        except Exception as e:
+            self.errors += 1
+            log_event('customer_prefetch_failed', level='warning', error=str(e))
+            return False, None
+
+        if lookup['columns']:
+            if rows and any(column not in rows[0] for column in lookup['columns']):
+                self.misses += 1
+                return False, None
+            rows = [{column: row[column] for column in lookup['columns']} for row in rows]
+        if lookup['limit'] is not None:
+            rows = rows[:lookup['limit']]
+
+        self.hits += 1
+        return True, rows + notices
+
+    def invalidate_table(self, table_name):
+        """Forget prefetched rows of table_name, e.g. after the table changed."""
+        with self._lock:
+            stale_keys = [key for key in self._prefetches if key[0] == table_name]
+            for key in stale_keys:
+                del self._prefetches[key]
+        return len(stale_keys)
+
+    def stats(self):
+        with self._lock:
+            in_flight = sum(1 for future, _ in self._prefetches.values() if not future.done())
+            entries = len(self._prefetches)
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'in_flight': in_flight,
+            'started': self.started,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'errors': self.errors,
+        }
+
+    def _table_for(self, reference):
+        reference = reference.replace('`', '')
+        for table_name in self.tables:
+            if table_name.lower() == reference or table_name.lower().endswith('.' + reference):
+                return table_name
+        return None
+
+    # Callers must hold self._lock
+    def _purge_expired(self, now):
+        # Failed lookups are dropped right away so the next prefetch retries them
+        expired = [key for key, (future, started_at) in self._prefetches.items()
+                   if future.done() and (now - started_at > self.ttl or future.exception() is not None)]
+        for key in expired:
+            del self._prefetches[key]
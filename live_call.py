@@ -0,0 +1,194 @@
+import io
+import json
+import math
+import queue
+import threading
+import time
+import wave
+from array import array
+
+from structured_log import log_event
+
+
+def pcm_to_wav(pcm_bytes, sample_rate):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm_bytes)
+    return buffer.getvalue()
+
+
+def pcm_rms(pcm_bytes):
+    samples = array('h')
+    samples.frombytes(pcm_bytes[:len(pcm_bytes) - len(pcm_bytes) % 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+
+
+def parse_start_message(message, allowed_models, default_model):
+    """Validate the JSON 'start' message of a live call; raises ValueError with a message for the browser."""
+    try:
+        start = json.loads(message)
+    except (TypeError, ValueError):
+        raise ValueError("The live call must begin with a JSON start message.")
+    if not isinstance(start, dict) or start.get('type', 'start') != 'start':
+        raise ValueError("The live call must begin with a JSON start message.")
+    llm_model = start.get('llm_model') or default_model
+    if llm_model not in allowed_models:
+        raise ValueError(f"Unsupported LLM model: {llm_model}")
+    try:
+        sample_rate = int(start.get('sample_rate', 16000))
+    except (TypeError, ValueError):
+        sample_rate = 0
+    if sample_rate <= 0:
+        raise ValueError(f"Invalid sample rate: {start.get('sample_rate')}")
+    return {
+        'llm_model': llm_model,
+        'call_agent_ask': start.get('call_agent_ask') or None,
+        'sample_rate': sample_rate,
+    }
+
+
+class LiveCallSession:
+    """Incremental transcription and routing for one live call streamed over a WebSocket.
+
+    Audio arrives as 16-bit mono PCM frames through add_audio(). Every window_seconds of
+    audio is queued for transcription; the queue holds at most max_queued_windows, and
+    when transcription falls behind the oldest window is dropped (and counted) instead
+    of letting audio pile up. Transcribed text accumulates until at least min_new_chars
+    of new dialogue exist and the speaker has paused (the window ends in silence), or
+    max_wait_seconds have passed; then route_fn runs on the new dialogue. Only one
+    routing runs at a time, and text arriving meanwhile is batched into the next one.
+    """
+
+    def __init__(self, send_event, transcribe_fn, route_fn, sample_rate=16000, window_seconds=5,
+                 max_queued_windows=4, min_new_chars=80, turn_silence_ms=700, silence_rms=500,
+                 max_wait_seconds=20):
+        self.send_event = send_event
+        self.transcribe_fn = transcribe_fn
+        self.route_fn = route_fn
+        self.sample_rate = sample_rate
+        self.window_bytes = int(window_seconds * sample_rate) * 2
+        self.min_new_chars = min_new_chars
+        self.turn_silence_bytes = int(turn_silence_ms * sample_rate / 1000) * 2
+        self.silence_rms = silence_rms
+        self.max_wait_seconds = max_wait_seconds
+
+        self._pending_audio = bytearray()
+        self._windows = queue.Queue(maxsize=max_queued_windows)
+        self._new_dialogue = []
+        self._last_routed_at = time.time()
+        self._lock = threading.Lock()
+        self._route_requested = threading.Event()
+        self._closed = threading.Event()
+
+        self.windows_transcribed = 0
+        self.windows_dropped = 0
+        self.routings = 0
+        self.errors = 0
+
+        self._transcriber = threading.Thread(target=self._transcribe_loop, name="live-call-transcriber", daemon=True)
+        self._router = threading.Thread(target=self._route_loop, name="live-call-router", daemon=True)
+        self._transcriber.start()
+        self._router.start()
+
+    def add_audio(self, pcm_bytes):
+        self._pending_audio.extend(pcm_bytes)
+        while len(self._pending_audio) >= self.window_bytes:
+            window = bytes(self._pending_audio[:self.window_bytes])
+            del self._pending_audio[:self.window_bytes]
+            self._enqueue_window(window)
+
+    def close(self, timeout=120):
+        """Transcribe and route whatever is left, then stop the worker threads."""
+        if self._pending_audio:
+            self._enqueue_window(bytes(self._pending_audio), turn_ended=True)
+            self._pending_audio.clear()
+        self._windows.put(None)
+        self._transcriber.join(timeout)
+        self._closed.set()
+        self._route_requested.set()
+        self._router.join(timeout)
+
+    def stats(self):
+        return {
+            'windows_transcribed': self.windows_transcribed,
+            'windows_dropped': self.windows_dropped,
+            'windows_queued': self._windows.qsize(),
+            'routings': self.routings,
+            'errors': self.errors,
+        }
+
+    def _enqueue_window(self, window, turn_ended=None):
+        if turn_ended is None:
+            turn_ended = pcm_rms(window[-self.turn_silence_bytes:]) < self.silence_rms
+        while True:
+            try:
+                self._windows.put_nowait((window, turn_ended))
+                return
+            except queue.Full:
+                # Transcription is falling behind; drop the oldest audio rather than buffer without bound
+                try:
+                    self._windows.get_nowait()
+                    self.windows_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _transcribe_loop(self):
+        while True:
+            item = self._windows.get()
+            if item is None:
+                return
+            window, turn_ended = item
+            try:
+                text = self.transcribe_fn(pcm_to_wav(window, self.sample_rate))
+                if isinstance(text, list):
+                    text = " ".join(str(part) for part in text)
+                text = str(text or "").strip()
+            except Exception as e:
+                self.errors += 1
+                log_event('live_window_transcription_failed', level='error', error=str(e))
+                continue
+            self.windows_transcribed += 1
+            if not text:
+                continue
+            self._send('transcript', {'text': text})
+
+            with self._lock:
+                self._new_dialogue.append(text)
+                new_chars = sum(len(line) for line in self._new_dialogue)
+                waited = time.time() - self._last_routed_at
+            if new_chars >= self.min_new_chars and (turn_ended or waited >= self.max_wait_seconds):
+                self._route_requested.set()
+
+    def _route_loop(self):
+        while True:
+            self._route_requested.wait()
+            self._route_requested.clear()
+            with self._lock:
+                dialogue = "\n".join(self._new_dialogue)
+                self._new_dialogue = []
+                self._last_routed_at = time.time()
+            if dialogue:
+                self._send('status', {'message': "Updating guidance..."})
+                try:
+                    self._send('guidance', self.route_fn(dialogue))
+                    self.routings += 1
+                except Exception as e:
+                    self.errors += 1
+                    log_event('live_call_routing_failed', level='error', error=str(e))
+                    self._send('error', {'user_message': "Could not update guidance for the latest dialogue."})
+            if self._closed.is_set():
+                with self._lock:
+                    if not self._new_dialogue:
+                        return
+                self._route_requested.set()
+
+    def _send(self, event, data):
+        try:
+            self.send_event(event, data)
+        except Exception as e:
+            log_event('live_call_send_failed', level='warning', live_event=event, error=str(e))
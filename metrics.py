@@ -0,0 +1,164 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Latency buckets in seconds, from a local cache hit up to a slow multi-step agent run
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Counters, latency histograms and stats collectors rendered in the Prometheus text format.
+
+    Metric names are prefixed with namespace. Histograms use cumulative buckets as
+    Prometheus expects. Collectors are functions returning a stats dict (like the
+    stats() methods of the caches and pools); their numeric values are exported as
+    gauges when the metrics are rendered, and a dict of dicts becomes one labelled
+    series per outer key.
+    """
+
+    def __init__(self, namespace="call_assistant", buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, help_text=None, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._register_help(name, help_text)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, help_text=None, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._register_help(name, help_text)
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """Time the enclosed block as one observation of stage_duration_seconds{stage=...}.
+
+        Exceptions are counted in stage_errors_total and re-raised.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('stage_errors_total', help_text="Stages that raised an exception", stage=stage, **labels)
+            raise
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - start,
+                         help_text="Time spent in each processing stage", stage=stage, **labels)
+
+    def register_collector(self, name, collect, label=None):
+        """Export collect()'s numeric values as gauges named <namespace>_<name>_<key>.
+
+        When collect() returns a dict of dicts, label names the label that carries the outer keys.
+        """
+        with self._lock:
+            self._collectors[name] = (collect, label)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: dict(value, buckets=list(value['buckets'])) for key, value in series.items()}
+                          for name, series in self._histograms.items()}
+            collectors = dict(self._collectors)
+
+        for name, series in sorted(counters.items()):
+            full_name = f"{self.namespace}_{name}"
+            self._header(lines, name, full_name, 'counter')
+            for key, value in sorted(series.items()):
+                lines.append(f"{full_name}{_format_labels(key)} {_format_value(value)}")
+
+        for name, series in sorted(histograms.items()):
+            full_name = f"{self.namespace}_{name}"
+            self._header(lines, name, full_name, 'histogram')
+            for key, histogram in sorted(series.items()):
+                for bound, count in zip(self.buckets, histogram['buckets']):
+                    lines.append(f"{full_name}_bucket{_format_labels(key, [('le', _format_value(float(bound)))])} {count}")
+                lines.append(f"{full_name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{full_name}_sum{_format_labels(key)} {_format_value(histogram['sum'])}")
+                lines.append(f"{full_name}_count{_format_labels(key)} {histogram['count']}")
+
+        for name, (collect, label) in sorted(collectors.items()):
+            try:
+                stats = collect() or {}
+            except Exception as e:
+                lines.append(f"# collector {name} failed: {str(e)}")
+                continue
+            gauges = {}
+            if label:
+                for label_value, values in stats.items():
+                    for key, value in (values or {}).items():
+                        gauges.setdefault(key, []).append((((label, str(label_value)),), value))
+            else:
+                for key, value in stats.items():
+                    gauges.setdefault(key, []).append(((), value))
+            for key, series in sorted(gauges.items()):
+                full_name = f"{self.namespace}_{name}_{key}"
+                series = [(label_key, value) for label_key, value in series if isinstance(value, (int, float))]
+                if not series:
+                    continue
+                lines.append(f"# TYPE {full_name} gauge")
+                for label_key, value in series:
+                    lines.append(f"{full_name}{_format_labels(label_key)} {_format_value(float(value))}")
+
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, full_name, metric_type):
+        if name in self._help:
+            lines.append(f"# HELP {full_name} {self._help[name]}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+
+    # Callers must hold self._lock
+    def _register_help(self, name, help_text):
+        if help_text and name not in self._help:
+            self._help[name] = help_text
+
+
+# Process-wide registry shared by the app and its helper modules
+registry = MetricsRegistry()
+inc = registry.inc
+observe = registry.observe
+timer = registry.timer
+register_collector = registry.register_collector
+render = registry.render
@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from query_cache import parse_point_lookup
+from result_fetch import to_arrow
+from structured_log import log_event
+
+
+# Delta change data feed change types that carry the new version of a row
+_UPSERT_CHANGE_TYPES = ('insert', 'update_postimage')
+
+
+class CustomerProfileSnapshot:
+    """In-process columnar copy of the customer_profiles table.
+
+    The table is held as an Arrow table, persisted as Parquet under snapshot_dir so a
+    restart can serve lookups before the warehouse is reachable, and indexed by
+    key_column for point lookups. refresh() compares the Delta table version and, when
+    it moved, pulls only the changed rows through the change data feed (falling back to
+    a full reload if the feed is unavailable). After each refresh that changed anything,
+    on_change is called with the list of changed keys, or None after a full reload.
+    """
+
+    def __init__(self, spark_sessions, table_name, snapshot_dir, key_column='customer_name',
+                 refresh_interval=300, on_change=None):
+        self.spark_sessions = spark_sessions
+        self.table_name = table_name
+        self.snapshot_dir = snapshot_dir
+        self.key_column = key_column
+        self.refresh_interval = refresh_interval
+        self.on_change = on_change
+
+        self._table = None
+        self._index = {}
+        self._version = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        self.lookups = 0
+        self.full_loads = 0
+        self.incremental_refreshes = 0
+        self.refresh_errors = 0
+        self.rows_changed = 0
+
+    @property
+    def ready(self):
+        return self._table is not None
+
+    @property
+    def parquet_path(self):
+        return os.path.join(self.snapshot_dir, 'customer_profiles.parquet')
+
+    @property
+    def metadata_path(self):
+        return os.path.join(self.snapshot_dir, 'customer_profiles.json')
+
+    def load_from_disk(self):
+        if not (os.path.exists(self.parquet_path) and os.path.exists(self.metadata_path)):
+            return False
+        try:
+            with open(self.metadata_path) as f:
+                metadata = json.load(f)
+            if metadata.get('table_name') != self.table_name:
+                return False
+            self._install(pq.read_table(self.parquet_path), metadata.get('version'))
+            log_event('profile_snapshot_loaded_from_disk', version=self._version)
+            return True
+        except Exception as e:
+            log_event('profile_snapshot_disk_load_failed', level='error', error=str(e))
+            return False
+
+    def refresh(self):
+        with self._refresh_lock:
+            try:
+                latest_version = self._latest_version()
+                if self._table is not None and latest_version == self._version:
+                    return False
+
+                changed_keys = None
+                if self._table is not None and self._version is not None:
+                    changed_keys = self._apply_changes(latest_version)
+                if changed_keys is None:
+                    self._full_load(latest_version)
+
+                self._save_to_disk()
+                if self.on_change:
+                    self.on_change(changed_keys)
+                return True
+            except Exception as e:
+                self.refresh_errors += 1
+                log_event('profile_snapshot_refresh_failed', level='error', error=str(e))
+                return False
+
+    def start_background_refresh(self):
+        def refresh_loop():
+            self.load_from_disk()
+            while not self._stop_event.is_set():
+                self.refresh()
+                self._stop_event.wait(self.refresh_interval)
+
+        thread = threading.Thread(target=refresh_loop, name="profile-snapshot-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop_event.set()
+
+    def try_lookup(self, sql_query):
+        """Answer sql_query from the snapshot if it is a point lookup by key_column.
+
+        Returns (True, rows) when answered locally, (False, None) when the query must go to Spark.
+        """
+        if self._table is None:
+            return False, None
+
+        lookup = parse_point_lookup(sql_query)
+        if not lookup or not self._is_snapshot_table(lookup['table']):
+            return False, None
+        if lookup['key'] != self.key_column:
+            return False, None
+
+        with self._lock:
+            table, index = self._table, self._index
+
+        columns = lookup['columns'] or table.column_names
+        if any(column not in table.column_names for column in columns):
+            return False, None
+
+        row_indices = [i for key in lookup['keys'] for i in index.get(key, [])]
+        if lookup['limit'] is not None:
+            row_indices = row_indices[:lookup['limit']]
+
+        self.lookups += 1
+        return True, table.select(columns).take(pa.array(row_indices, type=pa.int64())).to_pylist()
+
+    def keys(self):
+        """Every key_column value in the snapshot, e.g. to recognise customer names in a transcript."""
+        with self._lock:
+            return list(self._index)
+
+    def stats(self):
+        return {
+            'ready': self.ready,
+            'version': self._version,
+            'rows': self._table.num_rows if self._table is not None else 0,
+            'age_seconds': time.time() - self._loaded_at if self._loaded_at else None,
+            'lookups': self.lookups,
+            'full_loads': self.full_loads,
+            'incremental_refreshes': self.incremental_refreshes,
+            'rows_changed': self.rows_changed,
+            'refresh_errors': self.refresh_errors,
+        }
+
+    def _is_snapshot_table(self, reference):
+        reference = reference.replace('`', '')
+        return self.table_name.lower() == reference or self.table_name.lower().endswith('.' + reference)
+
+    def _latest_version(self):
+        rows = self.spark_sessions.run(
+            lambda spark: spark.sql(f"DESCRIBE HISTORY {self.table_name} LIMIT 1").collect()
+        )
+        return rows[0]['version'] if rows else None
+
+    def _full_load(self, version):
+        table = self.spark_sessions.run(
+            lambda spark: to_arrow(spark.sql(f"SELECT * FROM {self.table_name}"))
+        )
+        self._install(table, version)
+        self.full_loads += 1
+        log_event('profile_snapshot_full_load', rows=table.num_rows, version=version)
+
+    def _apply_changes(self, latest_version):
+        """Merge the change data feed into the snapshot; None if it must be fully reloaded instead."""
+        try:
+            changes = self.spark_sessions.run(
+                lambda spark: to_arrow(spark.sql(
+                    f"SELECT * FROM table_changes('{self.table_name}', {self._version + 1}, {latest_version})"
+                ))
+            )
+        except Exception as e:
+            log_event('profile_snapshot_change_feed_unavailable', level='warning', table=self.table_name, error=str(e))
+            return None
+
+        try:
+            changed_keys = self._merge_changes(changes, latest_version)
+        except Exception as e:
+            # e.g. a column was renamed or dropped, so the changed rows no longer fit the snapshot's schema
+            log_event('profile_snapshot_change_merge_failed', level='warning', table=self.table_name, error=str(e))
+            return None
+        self.incremental_refreshes += 1
+        self.rows_changed += len(changed_keys)
+        log_event('profile_snapshot_changes_applied', changed=len(changed_keys), version=latest_version)
+        return changed_keys
+
+    def _merge_changes(self, changes, latest_version):
+        changed_keys = pc.unique(changes[self.key_column])
+        # Only the last change of each key counts: an update followed by a delete removes the customer
+        changes = changes.filter(pc.invert(pc.equal(changes['_change_type'], 'update_preimage')))
+        if changes.num_rows:
+            is_delete = pc.cast(pc.equal(changes['_change_type'], 'delete'), pa.int8())
+            changes = changes.append_column('_is_delete', is_delete).sort_by(
+                [('_commit_version', 'descending'), ('_is_delete', 'ascending')]
+            )
+            newest_positions = {}
+            for position, key in enumerate(changes[self.key_column].to_pylist()):
+                newest_positions.setdefault(key, position)
+            changes = changes.take(pa.array(sorted(newest_positions.values()), type=pa.int64()))
+        upserts = changes.filter(pc.is_in(changes['_change_type'], value_set=pa.array(_UPSERT_CHANGE_TYPES)))
+        upserts = upserts.select(self._table.column_names).cast(self._table.schema)
+
+        unchanged = self._table.filter(pc.invert(pc.is_in(self._table[self.key_column], value_set=changed_keys)))
+        self._install(pa.concat_tables([unchanged, upserts]), latest_version)
+        return changed_keys.to_pylist()
+
+    def _install(self, table, version):
+        index = {}
+        for position, key in enumerate(table[self.key_column].to_pylist()):
+            index.setdefault(key, []).append(position)
+        with self._lock:
+            self._table = table
+            self._index = index
+            self._version = version
+            self._loaded_at = time.time()
+
+    def _save_to_disk(self):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        # Write to temporary files first so a crash never leaves a half-written snapshot behind
+        pq.write_table(self._table, self.parquet_path + '.tmp')
+        with open(self.metadata_path + '.tmp', 'w') as f:
+            json.dump({'table_name': self.table_name, 'version': self._version}, f)
+        os.replace(self.parquet_path + '.tmp', self.parquet_path)
+        os.replace(self.metadata_path + '.tmp', self.metadata_path)
@@ -0,0 +1,220 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+# Default time-to-live (seconds) for cached results, keyed by unqualified table name.
+# customer_profiles is a slowly changing aggregate; transcripts gets new calls throughout the day.
+DEFAULT_TABLE_TTLS = {
+    'customer_profiles': 3600,
+    'transcripts': 300,
+}
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+# A string literal or a comment, whichever starts first, so "--" inside a literal or a quote inside a comment
+# is read the way Spark reads it
+_LITERAL_OR_COMMENT = re.compile(_STRING_LITERAL.pattern + r"|--[^\n]*|/\*.*?\*/", re.DOTALL)
+_IN_LIST = re.compile(r"\bin\s*\(([^()]*)\)")
+_TABLE_REFERENCE = re.compile(r"\b(?:from|join)\s+([\w.`]+)")
+_READ_ONLY_QUERY = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+# Single-table point lookups, matched against normalize_sql() output:
+#   select <*|col, col...> from <table> [alias] where <key>='<value>' [limit n]
+#   select <*|col, col...> from <table> [alias] where <key> in('<value>',...) [limit n]
+_POINT_LOOKUP = re.compile(
+    r"^select (?P<columns>\*|[\w.]+(?:,[\w.]+)*) "
+    r"from (?P<table>[\w.`]+)(?: (?:as )?(?!where\b)\w+)? "
+    r"where (?P<key>[\w.]+)(?:=(?P<value>'(?:[^']|'')*')| in\((?P<values>'(?:[^']|'')*'(?:,'(?:[^']|'')*')*)\))"
+    r"(?: ?limit (?P<limit>\d+))?$"
+)
+_QUOTED_VALUE = re.compile(r"'((?:[^']|'')*)'")
+
+
+def normalize_sql(sql_query):
+    """Return a canonical form of sql_query for use as a cache key.
+
+    Comments are removed, whitespace is collapsed, everything outside string literals is lower-cased,
+    double-quoted literals become single-quoted, and the members of IN (...)
+    lists are sorted, so cosmetic variations of the same query share a key.
+    String literal contents keep their case since Spark compares them exactly.
+    """
+    literals = []
+
+    def stash_literal(match):
+        literal = match.group(0)
+        if literal.startswith('--') or literal.startswith('/*'):
+            return " "
+        if literal.startswith('"'):
+            literal = "'" + literal[1:-1].replace("'", "''") + "'"
+        literals.append(literal)
+        return f"\x00{len(literals) - 1}\x00"
+
+    query = _LITERAL_OR_COMMENT.sub(stash_literal, sql_query)
+    query = " ".join(query.lower().split())
+    query = query.rstrip(';').strip()
+    query = re.sub(r"\s*([(),=<>])\s*", r"\1", query)
+
+    def restore_literals(text):
+        return re.sub(r"\x00(\d+)\x00", lambda m: literals[int(m.group(1))], text)
+
+    def sort_in_list(match):
+        members = sorted(restore_literals(member.strip()) for member in match.group(1).split(','))
+        return "in(" + ",".join(members) + ")"
+
+    query = _IN_LIST.sub(sort_in_list, query)
+    return restore_literals(query)
+
+
+def referenced_tables(normalized_query):
+    tables = set()
+    for reference in _TABLE_REFERENCE.findall(normalized_query):
+        tables.add(reference.replace('`', '').split('.')[-1])
+    return tables
+
+
+def parse_point_lookup(sql_query):
+    """Parse a single-table lookup by one key column, or return None for any other query.
+
+    Returns a dict with the table reference, the selected columns (None for *), the
+    unqualified key column, the list of key values and the LIMIT (None if absent).
+    """
+    match = _POINT_LOOKUP.match(normalize_sql(sql_query))
+    if not match:
+        return None
+    if match.group('value'):
+        keys = [match.group('value')]
+    else:
+        keys = [literal.group(0) for literal in _QUOTED_VALUE.finditer(match.group('values'))]
+    return {
+        'table': match.group('table'),
+        'columns': None if match.group('columns') == '*' else
+                   [column.split('.')[-1] for column in match.group('columns').split(',')],
+        'key': match.group('key').split('.')[-1],
+        'keys': [key[1:-1].replace("''", "'") for key in keys],
+        'limit': int(match.group('limit')) if match.group('limit') else None,
+    }
+
+
+def _estimate_size(value):
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(str(value))
+
+
+class QueryResultCache:
+    """Thread-safe TTL + LRU cache for sql_lookup results.
+
+    Entries are keyed by normalize_sql(). Each entry expires after the shortest TTL
+    of the tables the query reads from, and the least recently used entries are
+    evicted once either max_entries or max_bytes (estimated JSON size) is exceeded.
+    Only read-only (SELECT/WITH) queries are cached.
+    """
+
+    def __init__(self, table_ttls=None, default_ttl=300, max_entries=512, max_bytes=32 * 1024 * 1024):
+        self.table_ttls = dict(DEFAULT_TABLE_TTLS if table_ttls is None else table_ttls)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def ttl_for(self, normalized_query):
+        tables = referenced_tables(normalized_query)
+        ttls = [self.table_ttls.get(table, self.default_ttl) for table in tables]
+        return min(ttls) if ttls else self.default_ttl
+
+    def get_or_compute(self, sql_query, compute):
+        """Return the cached result for sql_query, or call compute() and cache its result."""
+        key = normalize_sql(sql_query)
+        # Matched after normalizing so a leading comment doesn't hide the SELECT
+        if not _READ_ONLY_QUERY.match(key):
+            return compute()
+
+        found, value = self.get(key)
+        if found:
+            return value
+
+        value = compute()
+        self.put(key, value)
+        return self._copy(value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            value, expires_at, size = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, self._copy(value)
+
+    def put(self, key, value):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.time() + self.ttl_for(key)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._total_bytes += size
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate_table(self, table_name):
+        table_name = table_name.split('.')[-1].lower()
+        with self._lock:
+            stale_keys = [key for key in self._entries if table_name in referenced_tables(key)]
+            for key in stale_keys:
+                self._remove(key)
+        return len(stale_keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+            }
+
+    # Callers must hold self._lock
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._total_bytes -= size
+
+    @staticmethod
+    def _copy(value):
+        # Hand out copies so callers cannot mutate cached rows
+        if isinstance(value, list):
+            return [dict(row) if isinstance(row, dict) else row for row in value]
+        return value
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from structured_log import log_event
+
+
+def _exact_key(model, messages, kwargs):
+    payload = json.dumps({'model': model, 'messages': messages, 'kwargs': kwargs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _near_key(model, messages, kwargs):
+    # Same request modulo whitespace and letter case, e.g. a transcript pasted with different line breaks
+    payload = json.dumps({'model': model, 'messages': messages, 'kwargs': kwargs}, sort_keys=True, default=str)
+    payload = re.sub(r"(\\[nrt]|\s)+", " ", payload).lower()
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _load_response(data):
+    # Imported here since only a cache hit needs it
+    import litellm
+    return litellm.ModelResponse(**data)
+
+
+class LLMResponseCache:
+    """On-disk cache of LM responses, stored in a local SQLite file.
+
+    Entries are keyed on the model, the full message list (which carries the
+    signature instructions, transcript, agent ask, conversation history and any tool
+    observations so far) and the request parameters. Optionally a second, whitespace-
+    and case-insensitive key is consulted on a miss. The least recently used entries
+    are evicted once the stored payload exceeds max_bytes, and entries older than
+    max_age seconds are ignored. invalidate_mentions() drops entries whose prompt
+    mentions given text, e.g. customers whose profile just changed. Responses are
+    stored as JSON and rebuilt as litellm ModelResponse objects, never unpickled, so a
+    tampered cache file can at worst yield a wrong answer.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, max_age=7 * 24 * 3600, near_duplicates=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.near_duplicates = near_duplicates
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                exact_key TEXT PRIMARY KEY,
+                near_key TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_text TEXT NOT NULL,
+                response BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_by_near_key ON responses (near_key);
+            CREATE INDEX IF NOT EXISTS responses_by_access ON responses (last_access);
+        """)
+        self._total_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, model, messages, kwargs):
+        exact_key = _exact_key(model, messages, kwargs)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT exact_key, response FROM responses WHERE exact_key = ? AND created_at > ?",
+                (exact_key, time.time() - self.max_age)
+            ).fetchone()
+            near_hit = False
+            if row is None and self.near_duplicates:
+                row = self._connection.execute(
+                    "SELECT exact_key, response FROM responses WHERE near_key = ? AND created_at > ? "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (_near_key(model, messages, kwargs), time.time() - self.max_age)
+                ).fetchone()
+                near_hit = row is not None
+            if row is None:
+                self.misses += 1
+                return None
+            try:
+                data = json.loads(row[1])
+            except (TypeError, ValueError):
+                # An entry in an older or foreign format; drop it rather than guess what it is
+                self._delete_where("exact_key = ?", (row[0],))
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE responses SET last_access = ? WHERE exact_key = ?", (time.time(), row[0])
+            )
+            if near_hit:
+                self.near_hits += 1
+            else:
+                self.hits += 1
+        return _load_response(data)
+
+    def put(self, model, messages, kwargs, response):
+        try:
+            payload = response.model_dump_json()
+        except Exception as e:
+            log_event('llm_response_not_cached', level='warning', error=str(e))
+            return
+        prompt_text = json.dumps(messages, default=str)
+        size = len(payload) + len(prompt_text)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        exact_key = _exact_key(model, messages, kwargs)
+        with self._lock:
+            previous = self._connection.execute(
+                "SELECT size FROM responses WHERE exact_key = ?", (exact_key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(exact_key, near_key, model, prompt_text, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (exact_key, _near_key(model, messages, kwargs), model, prompt_text, payload, size, now, now)
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            self._evict()
+
+    def invalidate_mentions(self, texts):
+        """Drop every entry whose prompt contains any of texts. Returns the number of entries dropped."""
+        dropped = 0
+        with self._lock:
+            for text in texts:
+                dropped += self._delete_where("instr(prompt_text, ?) > 0", (json.dumps(text)[1:-1],))
+            self.invalidations += dropped
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            dropped = self._delete_where("1 = 1", ())
+            self.invalidations += dropped
+        return dropped
+
+    def stats(self):
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'entries': entries,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'near_duplicate_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.near_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    # Callers must hold self._lock
+    def _evict(self):
+        while self._total_bytes > self.max_bytes:
+            oldest = self._connection.execute(
+                "SELECT exact_key, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                self._total_bytes = 0
+                return
+            for exact_key, size in oldest:
+                self._connection.execute("DELETE FROM responses WHERE exact_key = ?", (exact_key,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    return
+
+    def _delete_where(self, condition, params):
+        freed, dropped = self._connection.execute(
+            f"SELECT COALESCE(SUM(size), 0), COUNT(*) FROM responses WHERE {condition}", params
+        ).fetchone()
+        self._connection.execute(f"DELETE FROM responses WHERE {condition}", params)
+        self._total_bytes -= freed
+        return dropped
@@ -0,0 +1,79 @@
+import json
+
+import pyarrow as pa
+
+
+TRUNCATION_MARKER = " ...[truncated]"
+
+
+def to_arrow(dataframe):
+    # DataFrame.toArrow is only available on newer Spark Connect clients
+    if hasattr(dataframe, 'toArrow'):
+        return dataframe.toArrow()
+    return pa.Table.from_pandas(dataframe.toPandas(), preserve_index=False)
+
+
+def bounded_dataframe(dataframe, max_rows, max_text_chars):
+    """Apply the fetch budget to dataframe on the server side.
+
+    Long string columns are cut to max_text_chars with TRUNCATION_MARKER appended, and
+    the result is limited to max_rows + 1 rows (the extra row tells the caller that
+    more rows were available). Duplicate column names, e.g. from a join, are suffixed
+    so every column can be referenced unambiguously.
+    """
+    from pyspark.sql import functions as F
+
+    names = []
+    for name in dataframe.columns:
+        unique_name, suffix = name, 2
+        while unique_name in names:
+            unique_name, suffix = f"{name}_{suffix}", suffix + 1
+        names.append(unique_name)
+    if names != dataframe.columns:
+        dataframe = dataframe.toDF(*names)
+
+    columns = []
+    for field in dataframe.schema.fields:
+        column = F.col(f"`{field.name}`")
+        if field.dataType.typeName() == 'string':
+            column = F.when(
+                F.length(column) > max_text_chars,
+                F.concat(F.substring(column, 1, max_text_chars), F.lit(TRUNCATION_MARKER))
+            ).otherwise(column).alias(field.name)
+        columns.append(column)
+    return dataframe.select(*columns).limit(max_rows + 1)
+
+
+def fetch_arrow(spark, sql_query, max_rows, max_text_chars):
+    return to_arrow(bounded_dataframe(spark.sql(sql_query), max_rows, max_text_chars))
+
+
+def iter_rows(table, batch_size=64):
+    # Convert one record batch at a time so only a batch worth of Python objects is alive
+    for batch in table.to_batches(max_chunksize=batch_size):
+        yield from batch.to_pylist()
+
+
+def collect_bounded_rows(rows, max_rows, max_bytes):
+    """Take rows from the rows iterator until either budget is used up.
+
+    Returns the accepted rows followed, when anything was left out, by a notice row
+    telling the agent the result was cut and how to narrow the query.
+    """
+    results = []
+    used_bytes = 0
+    truncated = False
+    for row in rows:
+        row_bytes = len(json.dumps(row, default=str))
+        if len(results) >= max_rows or used_bytes + row_bytes > max_bytes:
+            truncated = True
+            break
+        results.append(row)
+        used_bytes += row_bytes
+
+    if truncated:
+        results.append({
+            '_notice': f"Result truncated to {len(results)} rows ({used_bytes} bytes). "
+                       "Select specific columns, add filters or a LIMIT to see other rows."
+        })
+    return results
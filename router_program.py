@@ -0,0 +1,109 @@
+import time
+from typing import Optional
+
+import dspy
+
+import metrics
+from query_cache import normalize_sql, referenced_tables
+
+
+# Define the transcript router class
+class transcript_router(dspy.Signature):
+    """This handles a ongoing, live call transcript and determines what tools to call to find relevant information to help the call agent handle the conversation with the customer. Prioritize the call_agent_ask to find more useful information to the call agent and to determine which tables to use in the sql query. Check conversatinon_history to see what tables were already sql queried and use that if so. Do not re-query. Skip to a FINISH action if no tools are required given the information. Prepare relevant_information to help the call agent solve issues, achieve upsell goals and prioritize calls
+    relevant_information must be in formatted like a report in Markdown and is also your response"""
+    transcript: str = dspy.InputField()
+    call_agent_ask: Optional[str] = dspy.InputField()
+    conversation_history: list = dspy.InputField()
+    queried_table: str = dspy.OutputField()
+    relevant_information: str = dspy.OutputField(desc="Format using Markdown. Use actual newlines, not \ n characters. If necessary, add a recommended response to say for the call_agent")
+
+
+def build_agent(tools):
+    return dspy.ReAct(transcript_router, tools=tools, max_iters=3)
+
+
+class CachedLM(dspy.LM):
+    """dspy.LM that consults an LLMResponseCache before calling the serving endpoint.
+
+    Every LM call made by the ReAct agent goes through forward/aforward, so each step
+    is cached separately and keyed on the tool observations gathered so far.
+    """
+
+    def __init__(self, model, response_cache=None, **kwargs):
+        super().__init__(model, **kwargs)
+        self.response_cache = response_cache
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        if self.response_cache is None:
+            return super().forward(prompt=prompt, messages=messages, **kwargs)
+        messages = messages or [{"role": "user", "content": prompt}]
+        request_kwargs = {**self.kwargs, **kwargs}
+        cached = self.response_cache.get(self.model, messages, request_kwargs)
+        if cached is not None:
+            cached.cache_hit = True
+            return cached
+        response = super().forward(messages=messages, **kwargs)
+        self.response_cache.put(self.model, messages, request_kwargs, response)
+        return response
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        if self.response_cache is None:
+            return await super().aforward(prompt=prompt, messages=messages, **kwargs)
+        messages = messages or [{"role": "user", "content": prompt}]
+        request_kwargs = {**self.kwargs, **kwargs}
+        cached = self.response_cache.get(self.model, messages, request_kwargs)
+        if cached is not None:
+            cached.cache_hit = True
+            return cached
+        response = await super().aforward(messages=messages, **kwargs)
+        self.response_cache.put(self.model, messages, request_kwargs, response)
+        return response
+
+
+class StageTimingCallback(dspy.utils.callback.BaseCallback):
+    """Records the latency of every LM call (one per ReAct iteration) and tool call in the metrics."""
+
+    def __init__(self):
+        self._started = {}
+
+    def on_lm_start(self, call_id, instance, inputs):
+        self._started[call_id] = (time.perf_counter(), 'lm_call', {'model': getattr(instance, 'model', None)})
+
+    def on_lm_end(self, call_id, outputs, exception=None):
+        self._finish(call_id, exception)
+
+    def on_tool_start(self, call_id, instance, inputs):
+        self._started[call_id] = (time.perf_counter(), 'tool_call', {'tool': getattr(instance, 'name', None)})
+
+    def on_tool_end(self, call_id, outputs, exception=None):
+        self._finish(call_id, exception)
+
+    def _finish(self, call_id, exception):
+        started = self._started.pop(call_id, None)
+        if started is None:
+            return
+        start, stage, labels = started
+        if exception is not None:
+            metrics.inc('stage_errors_total', stage=stage, **labels)
+        metrics.observe('stage_duration_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+
+class ToolProgressMessages(dspy.streaming.StatusMessageProvider):
+    """Status messages streamed to the browser while the ReAct agent runs its tools."""
+
+    def tool_start_message(self, instance, inputs):
+        if instance.name == 'finish':
+            return "Preparing the report..."
+        if instance.name == 'find_similar_calls':
+            return "Searching past calls..."
+        inputs = inputs or {}
+        queries = inputs.get('sql_queries') or [inputs.get('sql_query', '')]
+        if isinstance(queries, str):
+            queries = [queries]
+        tables = set().union(*(referenced_tables(normalize_sql(str(query))) for query in queries))
+        if tables:
+            return f"Querying {', '.join(sorted(tables))}..."
+        return f"Running {instance.name}..."
+
+    def tool_end_message(self, outputs):
+        return "Query complete."
@@ -0,0 +1,148 @@
+import threading
+import time
+
+from structured_log import log_event
+
+
+# Substrings Databricks Connect uses when a serverless session has expired or been closed
+SESSION_EXPIRED_MARKERS = (
+    "INVALID_HANDLE",
+    "SESSION_NOT_FOUND",
+    "SESSION_CLOSED",
+    "session_id is no longer usable",
+    "has been closed",
+)
+
+
+def default_session_factory():
+    # Imported here so a local stand-in factory does not need databricks-connect installed
+    from databricks.connect import DatabricksSession
+    return DatabricksSession.builder.serverless(True).getOrCreate()
+
+
+def is_session_expired_error(error):
+    message = str(error)
+    return any(marker in message for marker in SESSION_EXPIRED_MARKERS)
+
+
+class SparkSessionManager:
+    """Owns the single serverless Spark session used by this process.
+
+    The session is created once (ideally at startup, by calling get_session), health checked
+    periodically, and transparently recreated when it expires. Queries go through
+    run(), which bounds how many execute concurrently against the session.
+    """
+
+    def __init__(self, session_factory=None, max_concurrent_queries=4, health_check_interval=300):
+        self.session_factory = session_factory or default_session_factory
+        self.health_check_interval = health_check_interval
+        self.max_concurrent_queries = max_concurrent_queries
+
+        self._session = None
+        self._session_created_at = None
+        self._last_health_check = 0.0
+        self._lock = threading.Lock()
+        self._query_slots = threading.BoundedSemaphore(max_concurrent_queries)
+        self._counter_lock = threading.Lock()
+
+        # Counters exposed through stats()
+        self.connect_count = 0
+        self.reconnect_count = 0
+        self.health_check_failures = 0
+        self.query_count = 0
+        self.query_errors = 0
+        self.active_queries = 0
+
+    def get_session(self):
+        with self._lock:
+            if self._session is None:
+                self._connect()
+            elif time.time() - self._last_health_check > self.health_check_interval:
+                if not self._is_healthy():
+                    self.health_check_failures += 1
+                    log_event('spark_session_reconnecting', level='warning', reason='health_check')
+                    self._reconnect()
+            return self._session
+
+    def invalidate(self, session=None):
+        # Drop the current session so the next get_session() reconnects.
+        # If a specific session is given, only drop it if it is still the current one,
+        # so concurrent callers seeing the same failure only trigger one reconnect.
+        with self._lock:
+            if session is None or session is self._session:
+                self._reconnect()
+
+    def run(self, action):
+        """Run action(spark) with a healthy session, bounded by max_concurrent_queries.
+
+        The action must fully materialize its results (collect, toArrow, ...) since
+        the concurrency slot is released when it returns. If the session turns out to
+        have expired mid-query, the session is recreated and the action retried once.
+        """
+        with self._query_slots:
+            self._count('active_queries', 1)
+            try:
+                spark = self.get_session()
+                try:
+                    result = action(spark)
+                except Exception as e:
+                    if not is_session_expired_error(e):
+                        raise
+                    log_event('spark_session_reconnecting', level='warning', reason='expired', error=str(e))
+                    self.invalidate(spark)
+                    result = action(self.get_session())
+                self._count('query_count', 1)
+                return result
+            except Exception:
+                self._count('query_errors', 1)
+                raise
+            finally:
+                self._count('active_queries', -1)
+
+    def stats(self):
+        session_age = None
+        if self._session_created_at is not None:
+            session_age = time.time() - self._session_created_at
+        return {
+            'session_active': self._session is not None,
+            'session_age_seconds': session_age,
+            'connect_count': self.connect_count,
+            'reconnect_count': self.reconnect_count,
+            'health_check_failures': self.health_check_failures,
+            'query_count': self.query_count,
+            'query_errors': self.query_errors,
+            'active_queries': self.active_queries,
+            'max_concurrent_queries': self.max_concurrent_queries,
+        }
+
+    def _count(self, name, delta):
+        with self._counter_lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    # Callers must hold self._lock
+    def _connect(self):
+        self._session = self.session_factory()
+        self._session_created_at = time.time()
+        self._last_health_check = self._session_created_at
+        self.connect_count += 1
+        log_event('spark_session_created')
+
+    def _reconnect(self):
+        old_session = self._session
+        self._session = None
+        if old_session is not None:
+            try:
+                old_session.stop()
+            except Exception:
+                pass
+        self.reconnect_count += 1
+        self._connect()
+
+    def _is_healthy(self):
+        self._last_health_check = time.time()
+        try:
+            self._session.sql("SELECT 1").collect()
+            return True
+        except Exception as e:
+            log_event('spark_session_health_check_failed', level='warning', error=str(e))
+            return False
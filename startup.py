@@ -0,0 +1,75 @@
+import threading
+import time
+
+from structured_log import log_event
+
+
+class DeferredStartup:
+    """Runs the slow parts of app start-up (imports, remote clients) in background threads.
+
+    Each step added with add() gets its own thread once start() is called, after the
+    steps named in `after` have finished, so the process can bind its socket and answer
+    health checks while they warm up. Routes that need a step call wait(name). A failed
+    step is logged and reported by status(); callers that waited on it go ahead anyway
+    and hit the same error in the lazy path, as they would without deferred start-up.
+    """
+
+    def __init__(self):
+        self._steps = {}
+        self._lock = threading.Lock()
+        self.started_at = None
+
+    def add(self, name, fn, after=()):
+        self._steps[name] = {
+            'fn': fn,
+            'after': tuple(after),
+            'done': threading.Event(),
+            'state': 'pending',
+            'seconds': None,
+            'error': None,
+        }
+
+    def start(self, background=True):
+        """Run every step; with background=False they run in this thread, in the order they were added."""
+        self.started_at = time.time()
+        for name in self._steps:
+            if background:
+                threading.Thread(target=self._run_step, args=(name,), name=f"startup-{name}", daemon=True).start()
+            else:
+                self._run_step(name)
+
+    def wait(self, name, timeout=None):
+        """Block until step name has finished (ready or failed). Returns False on timeout."""
+        step = self._steps.get(name)
+        return step is None or step['done'].wait(timeout)
+
+    @property
+    def ready(self):
+        return all(step['state'] == 'ready' for step in self._steps.values())
+
+    def status(self):
+        with self._lock:
+            return {
+                name: {key: step[key] for key in ('state', 'seconds', 'error')}
+                for name, step in self._steps.items()
+            }
+
+    def _run_step(self, name):
+        step = self._steps[name]
+        for dependency in step['after']:
+            self.wait(dependency)
+        with self._lock:
+            step['state'] = 'warming'
+        started = time.perf_counter()
+        try:
+            step['fn']()
+            state, error = 'ready', None
+            log_event('startup_step_ready', step=name, seconds=round(time.perf_counter() - started, 3))
+        except Exception as e:
+            state, error = 'failed', str(e)
+            log_event('startup_step_failed', level='error', step=name, error=str(e))
+        with self._lock:
+            step['state'] = state
+            step['error'] = error
+            step['seconds'] = round(time.perf_counter() - started, 3)
+        step['done'].set()
@@ -311,6 +311,140 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Live call mode: stream microphone audio over a WebSocket and receive
+    // the running transcript and updated guidance on the same socket
+    const liveCallButton = document.getElementById('live-call-button');
+    const liveCallStatus = document.getElementById('live-call-status');
+    const LIVE_CALL_SAMPLE_RATE = 16000;
+    // Skip frames while this much audio is still waiting to be sent, so a slow link can't build a backlog
+    const LIVE_CALL_MAX_BUFFERED_BYTES = LIVE_CALL_SAMPLE_RATE * 2 * 5;
+    let liveCallSocket = null;
+    let liveCallAudioContext = null;
+    let liveCallStream = null;
+
+    function startLiveCall() {
+        navigator.mediaDevices.getUserMedia({
+            audio: {
+                sampleRate: LIVE_CALL_SAMPLE_RATE,
+                channelCount: 1,
+                echoCancellation: true,
+                noiseSuppression: true
+            }
+        })
+            .then(stream => {
+                liveCallStream = stream;
+                const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+                liveCallSocket = new WebSocket(`${protocol}//${window.location.host}/live_call`);
+                liveCallSocket.binaryType = 'arraybuffer';
+
+                liveCallSocket.addEventListener('open', () => {
+                    liveCallSocket.send(JSON.stringify({
+                        type: 'start',
+                        llm_model: document.getElementById('llm_model').value,
+                        call_agent_ask: document.getElementById('call_agent_ask').value,
+                        sample_rate: LIVE_CALL_SAMPLE_RATE
+                    }));
+
+                    liveCallAudioContext = new (window.AudioContext || window.webkitAudioContext)({
+                        sampleRate: LIVE_CALL_SAMPLE_RATE
+                    });
+                    const source = liveCallAudioContext.createMediaStreamSource(stream);
+                    const processor = liveCallAudioContext.createScriptProcessor(4096, 1, 1);
+
+                    processor.onaudioprocess = event => {
+                        if (!liveCallSocket || liveCallSocket.readyState !== WebSocket.OPEN) {
+                            return;
+                        }
+                        if (liveCallSocket.bufferedAmount > LIVE_CALL_MAX_BUFFERED_BYTES) {
+                            console.warn('Live call socket is backed up, skipping an audio frame');
+                            return;
+                        }
+                        // Convert float samples to 16-bit PCM
+                        const samples = event.inputBuffer.getChannelData(0);
+                        const pcm = new Int16Array(samples.length);
+                        for (let i = 0; i < samples.length; i++) {
+                            const sample = Math.max(-1, Math.min(1, samples[i]));
+                            pcm[i] = sample * 0x7FFF;
+                        }
+                        liveCallSocket.send(pcm.buffer);
+                    };
+
+                    source.connect(processor);
+                    processor.connect(liveCallAudioContext.destination);
+
+                    transcriptTextarea.value = '';
+                    liveCallButton.textContent = 'Stop Live Call';
+                    liveCallButton.classList.add('recording');
+                    liveCallStatus.textContent = 'Live call in progress...';
+                    liveCallStatus.style.display = 'block';
+                });
+
+                liveCallSocket.addEventListener('message', event => {
+                    const data = JSON.parse(event.data);
+                    if (data.event === 'transcript') {
+                        transcriptTextarea.value += (transcriptTextarea.value ? '\n' : '') + data.text;
+                        transcriptTextarea.scrollTop = transcriptTextarea.scrollHeight;
+                    } else if (data.event === 'status') {
+                        liveCallStatus.textContent = data.message;
+                    } else if (data.event === 'guidance' && aiResponseContainer) {
+                        aiResponseContainer.innerHTML = data.response;
+                        liveCallStatus.textContent = 'Live call in progress...';
+                    } else if (data.event === 'error') {
+                        console.error('Live call error:', data);
+                        liveCallStatus.textContent = data.user_message;
+                    }
+                });
+
+                liveCallSocket.addEventListener('close', () => {
+                    releaseLiveCallAudio();
+                    liveCallSocket = null;
+                    liveCallButton.textContent = 'Start Live Call';
+                    liveCallButton.classList.remove('recording');
+                    liveCallButton.disabled = false;
+                    liveCallStatus.style.display = 'none';
+                });
+
+                liveCallSocket.addEventListener('error', error => {
+                    console.error('Live call WebSocket error:', error);
+                });
+            })
+            .catch(error => {
+                console.error('Error accessing microphone:', error);
+                alert('Could not access microphone. Please check your browser permissions.');
+            });
+    }
+
+    function releaseLiveCallAudio() {
+        if (liveCallAudioContext) {
+            liveCallAudioContext.close();
+            liveCallAudioContext = null;
+        }
+        if (liveCallStream) {
+            liveCallStream.getTracks().forEach(track => track.stop());
+            liveCallStream = null;
+        }
+    }
+
+    function stopLiveCall() {
+        // Stop capturing right away; the server finishes the last window and closes the socket
+        releaseLiveCallAudio();
+        if (liveCallSocket && liveCallSocket.readyState === WebSocket.OPEN) {
+            liveCallSocket.send(JSON.stringify({ type: 'stop' }));
+            liveCallButton.disabled = true;
+            liveCallStatus.textContent = 'Finishing the last part of the call...';
+        }
+    }
+
+    if (liveCallButton) {
+        liveCallButton.addEventListener('click', function() {
+            if (liveCallSocket) {
+                stopLiveCall();
+            } else {
+                startLiveCall();
+            }
+        });
+    }
+
     // Add event listener to mic button
     if (micButton) {
         micButton.addEventListener('click', function() {
@@ -322,6 +456,97 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Read the Server-Sent Events stream from /process_transcript_stream.
+    // EventSource only supports GET, so the POST response body is parsed by hand.
+    async function streamTranscript(formData, onEvent) {
+        const response = await fetch('/process_transcript_stream', {
+            method: 'POST',
+            body: formData
+        });
+        console.log("Response received:", response);
+        if (!response.ok) {
+            throw new Error(`Server responded with status: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                const dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLines.push(line.slice(5).trim());
+                    }
+                });
+
+                if (dataLines.length > 0) {
+                    onEvent(eventName, JSON.parse(dataLines.join('\n')));
+                }
+            }
+        }
+    }
+
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    // Lightweight markdown rendering for the partial report while tokens stream in.
+    // Handles headings, bold/italic and bullet lists; the server-rendered HTML replaces it at the end.
+    function renderMarkdownPreview(markdown) {
+        const inline = text => escapeHtml(text)
+            .replace(/\*\*(.+?)\*\*/g, '<strong>$1</strong>')
+            .replace(/\*(.+?)\*/g, '<em>$1</em>');
+
+        let html = '';
+        let inList = false;
+        markdown.split('\n').forEach(line => {
+            const heading = line.match(/^(#{1,6})\s+(.*)$/);
+            const bullet = line.match(/^\s*[-*]\s+(.*)$/);
+
+            if (bullet) {
+                if (!inList) {
+                    html += '<ul>';
+                    inList = true;
+                }
+                html += '<li>' + inline(bullet[1]) + '</li>';
+                return;
+            }
+            if (inList) {
+                html += '</ul>';
+                inList = false;
+            }
+
+            if (heading) {
+                const level = heading[1].length;
+                html += `<h${level}>` + inline(heading[2]) + `</h${level}>`;
+            } else if (line.trim()) {
+                html += inline(line) + '<br>';
+            }
+        });
+        if (inList) {
+            html += '</ul>';
+        }
+        return html;
+    }
+
     if (transcriptForm) {
         // Add direct click handler for the button
         if (processButton) {
@@ -377,21 +602,40 @@ document.addEventListener('DOMContentLoaded', function() {
             // Get form data
             const formData = new FormData(transcriptForm);
 
-            // Send AJAX request
-            fetch('/process_transcript', {
-                method: 'POST',
-                body: formData
+            // Stream the analysis so tool progress and the report show up while the agent works
+            let streamedMarkdown = '';
+            let finalData = null;
+
+            streamTranscript(formData, (eventName, data) => {
+                if (eventName === 'status' || eventName === 'token') {
+                    // Real progress replaces the rotating placeholder messages
+                    if (window.processingMessageInterval) {
+                        clearInterval(window.processingMessageInterval);
+                        window.processingMessageInterval = null;
+                    }
+                }
+
+                if (eventName === 'status' && aiResponseContainer && !streamedMarkdown) {
+                    aiResponseContainer.innerHTML = '<div class="info-box">' + escapeHtml(data.message) + '</div>';
+                } else if (eventName === 'token' && aiResponseContainer) {
+                    streamedMarkdown += data.chunk;
+                    aiResponseContainer.innerHTML = renderMarkdownPreview(streamedMarkdown);
+                } else if (eventName === 'final') {
+                    finalData = data;
+                } else if (eventName === 'error') {
+                    console.error('Error event received:', data);
+                    throw new Error(data.user_message || data.error);
+                }
             })
-            .then(response => {
-                console.log("Response received:", response);
-                if (!response.ok) {
-                    throw new Error(`Server responded with status: ${response.status}`);
+            .then(() => {
+                if (!finalData) {
+                    throw new Error('The response stream ended without a final result');
                 }
-                return response.json().catch(err => {
-                    throw new Error("Failed to parse response as JSON: " + err.message);
-                });
+                handleProcessResult(finalData);
             })
-            .then(data => {
+            .catch(error => handleProcessError(error));
+
+            function handleProcessResult(data) {
                 console.log("Data received:", data);
 
                 // Hide processing indicator
@@ -601,8 +845,9 @@ document.addEventListener('DOMContentLoaded', function() {
                         }
                     });
                 }
-            })
-            .catch(error => {
+            }
+
+            function handleProcessError(error) {
                 console.error('Error:', error);
 
                 // Hide processing indicator
@@ -631,7 +876,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     // Log the error details to the console for debugging
                     console.error('Error details:', error);
                 }
-            });
+            }
         });
     }
 
@@ -0,0 +1,51 @@
+import json
+import logging
+import random
+import sys
+import time
+
+
+_logger = logging.getLogger("call_assistant")
+_debug_sample_rate = 1.0
+
+
+def configure_logging(level="INFO", debug_sample_rate=1.0):
+    """Write one JSON object per line to stdout for events at level or above.
+
+    Debug events, which may carry payload previews, are additionally sampled at
+    debug_sample_rate so they can stay on in production without flooding the logs.
+    """
+    global _debug_sample_rate
+    _debug_sample_rate = debug_sample_rate
+    if not _logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+        _logger.propagate = False
+    _logger.setLevel(level.upper())
+
+
+def log_event(event, level="info", sample_rate=None, **fields):
+    """Log event with fields as one structured line, e.g. log_event('sql_lookup', source='cache', rows=3).
+
+    sample_rate keeps only that fraction of the events; debug events default to the
+    configured debug sample rate.
+    """
+    level_number = logging.getLevelName(level.upper())
+    if not _logger.isEnabledFor(level_number):
+        return
+    if sample_rate is None and level_number == logging.DEBUG:
+        sample_rate = _debug_sample_rate
+    if sample_rate is not None and sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    record = {'ts': round(time.time(), 3), 'level': level.lower(), 'event': event}
+    record.update(fields)
+    _logger.log(level_number, json.dumps(record, default=str))
+
+
+def preview(text, limit=200):
+    """Shorten text for a log line, noting the original length when it was cut."""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text)} chars)"
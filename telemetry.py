@@ -0,0 +1,214 @@
+import os
+import queue
+import random
+import threading
+import time
+
+from structured_log import log_event
+
+
+class ExperimentCache:
+    """Remembers which MLflow experiment IDs resolved, so repeat requests skip the lookup.
+
+    The first activate() of an ID goes through mlflow.set_experiment, which checks the
+    experiment exists on the tracking server. Switching back to an ID that already
+    resolved only repoints the active experiment locally. An ID that fails to resolve
+    is not cached and raises as before.
+    """
+
+    def __init__(self):
+        self._resolved = set()
+        self._active = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def active_experiment_id(self):
+        return self._active
+
+    def activate(self, experiment_id):
+        import mlflow
+
+        with self._lock:
+            if experiment_id in self._resolved:
+                if experiment_id != self._active:
+                    _set_active_experiment(experiment_id)
+                    self._active = experiment_id
+                self.hits += 1
+                return
+        mlflow.set_experiment(experiment_id=experiment_id)
+        with self._lock:
+            self._resolved.add(experiment_id)
+            self._active = experiment_id
+            self.misses += 1
+
+    def stats(self):
+        return {'active_experiment_id': self._active, 'resolved': len(self._resolved),
+                'hits': self.hits, 'misses': self.misses}
+
+
+def _set_active_experiment(experiment_id):
+    # What mlflow.set_experiment does once the experiment is found, minus the tracking-server lookup
+    import mlflow
+    from mlflow.tracking import fluent
+
+    if not hasattr(fluent, '_active_experiment_id'):
+        mlflow.set_experiment(experiment_id=experiment_id)
+        return
+    fluent._active_experiment_id = experiment_id
+    os.environ['MLFLOW_EXPERIMENT_ID'] = experiment_id
+
+
+class AsyncRunLogger:
+    """Logs MLflow runs from a background thread instead of the request thread.
+
+    record() puts a finished run (its experiment, params, metrics, tags and timing) on a
+    bounded queue and returns immediately. When the queue is full the run is dropped and
+    counted rather than blocking the request. Only sample_rate of the runs are kept.
+    The worker takes up to batch_size runs at a time, or whatever arrived within
+    flush_interval seconds, and writes each through MlflowClient, which does not touch
+    the process-wide active run. Call stop() at exit to write out what is still queued.
+    """
+
+    def __init__(self, max_queue=1000, batch_size=50, flush_interval=2.0, sample_rate=1.0, client_factory=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_rate = sample_rate
+        self.client_factory = client_factory or self._default_client
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._stop_lock = threading.Lock()
+        self._client = None
+
+        self.recorded = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.logged = 0
+        self.errors = 0
+        self.batches = 0
+
+        self._worker = threading.Thread(target=self._run, name="mlflow-run-logger", daemon=True)
+        self._worker.start()
+
+    def record(self, experiment_id, params=None, metrics=None, tags=None, start_time=None, end_time=None,
+               status="FINISHED"):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return False
+        end_time = end_time or time.time()
+        run = {
+            'experiment_id': experiment_id,
+            'params': params or {},
+            'metrics': metrics or {},
+            'tags': tags or {},
+            'start_time': start_time or end_time,
+            'end_time': end_time,
+            'status': status,
+        }
+        try:
+            self._queue.put_nowait(run)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.recorded += 1
+        return True
+
+    def flush(self, timeout=10):
+        """Wait until everything queued so far has been written (or timeout seconds pass)."""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+
+    def stop(self, timeout=10):
+        """Flush, then stop the worker. Runs not written by then are counted as dropped."""
+        self.flush(timeout)
+        with self._stop_lock:
+            self._stop_event.set()
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._queue.task_done()
+            # Everything not yet written, including the batch the worker holds; the worker
+            # discards those runs from here on, so none of them is counted again
+            unflushed = self._queue.unfinished_tasks
+            self.dropped += unflushed
+        if unflushed:
+            log_event('mlflow_runs_unflushed', level='warning', runs=unflushed)
+        return unflushed
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'recorded': self.recorded,
+            'sampled_out': self.sampled_out,
+            'dropped': self.dropped,
+            'logged': self.logged,
+            'errors': self.errors,
+            'batches': self.batches,
+            'sample_rate': self.sample_rate,
+        }
+
+    @staticmethod
+    def _default_client():
+        from mlflow.tracking import MlflowClient
+        return MlflowClient()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._take_batch()
+            if not batch:
+                continue
+            self.batches += 1
+            for run in batch:
+                error = None
+                if not self._stop_event.is_set():
+                    try:
+                        self._log_run(run)
+                    except Exception as e:
+                        error = e
+                with self._stop_lock:
+                    # After stop() the run was already counted as dropped
+                    if not self._stop_event.is_set():
+                        if error is None:
+                            self.logged += 1
+                        else:
+                            self.errors += 1
+                            log_event('mlflow_run_log_failed', level='warning', error=str(error))
+                    self._queue.task_done()
+
+    def _take_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _log_run(self, run):
+        from mlflow.entities import Metric, Param
+
+        if self._client is None:
+            self._client = self.client_factory()
+        start_ms = int(run['start_time'] * 1000)
+        end_ms = int(run['end_time'] * 1000)
+        mlflow_run = self._client.create_run(run['experiment_id'], start_time=start_ms,
+                                             tags={key: str(value) for key, value in run['tags'].items()})
+        run_id = mlflow_run.info.run_id
+        self._client.log_batch(
+            run_id,
+            metrics=[Metric(key, float(value), end_ms, 0) for key, value in run['metrics'].items()
+                     if value is not None],
+            params=[Param(key, str(value)) for key, value in run['params'].items()],
+        )
+        self._client.set_terminated(run_id, status=run['status'], end_time=end_ms)
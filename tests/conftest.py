@@ -0,0 +1,32 @@
+import pytest
+
+from benchmarks.fakes import FakeServices
+
+# No latency, so the fakes answer immediately
+FAST = {'transcribe_latency_ms': 0, 'transcribe_ms_per_audio_second': 0, 'spark_connect_ms': 0,
+        'spark_query_ms': 0, 'lm_latency_ms': 0, 'lm_ms_per_output_char': 0, 'mlflow_set_experiment_ms': 0,
+        'mlflow_start_run_ms': 0, 'mlflow_end_run_ms': 0, 'jitter': 0}
+
+
+@pytest.fixture(scope='session')
+def fake_app():
+    """app imported against the benchmark fakes; returns (app module, FakeServices)."""
+    for module in ('flask', 'flask_sock', 'dspy', 'mlflow', 'databricks.connect'):
+        pytest.importorskip(module)
+    from benchmarks import fakes
+
+    services = FakeServices(FAST)
+    fakes.install(services)
+    import app as app_module
+    fakes.patch_app(app_module, services)
+    app_module.startup.wait('agent')
+    services.reset_counts()
+    return app_module, services
+
+
+@pytest.fixture
+def app_client(fake_app):
+    app_module, services = fake_app
+    services.configure(**FAST)
+    services.reset_counts()
+    return app_module.app.test_client(), services
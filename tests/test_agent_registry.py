@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+from agent_registry import AgentBusyError, AgentRegistry
+
+MODELS = ['model-a', 'model-b']
+
+
+class FakeLM:
+    def __init__(self, model):
+        self.model = model
+        self.calls = []
+
+    def __call__(self, prompt, **kwargs):
+        self.calls.append(prompt)
+        return ["pong"]
+
+
+@pytest.fixture
+def built():
+    return []
+
+
+@pytest.fixture
+def registry(built):
+    def lm_factory(model_name):
+        built.append(model_name)
+        return FakeLM(model_name)
+
+    return AgentRegistry(MODELS, lm_factory, lambda lm: ('agent', lm), max_concurrent_per_model=2,
+                         acquire_timeout=0.05)
+
+
+def test_each_model_gets_one_lm_and_agent_shared_by_every_request(registry, built):
+    first = registry.get('model-a')
+    with registry.acquire('model-a') as second:
+        assert second is first
+        assert second.agent == ('agent', first.lm)
+    assert registry.get('model-b').lm is not first.lm
+    assert built == ['model-a', 'model-b']
+
+
+def test_concurrent_first_use_builds_the_lm_once(registry, built):
+    threads = [threading.Thread(target=registry.get, args=('model-a',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert built == ['model-a']
+
+
+def test_unknown_model_is_rejected(registry):
+    with pytest.raises(ValueError, match="Unsupported LLM model"):
+        registry.get('model-z')
+
+
+def test_acquire_releases_its_slot(registry):
+    for _ in range(3):
+        with registry.acquire('model-a'):
+            assert registry.stats()['model-a']['active'] == 1
+    assert registry.stats()['model-a']['active'] == 0
+
+    with pytest.raises(RuntimeError):
+        with registry.acquire('model-a'):
+            raise RuntimeError("agent failed")
+    assert registry.stats()['model-a']['active'] == 0
+
+
+def test_busy_model_raises_after_the_timeout(registry):
+    with registry.acquire('model-a'), registry.acquire('model-a'):
+        with pytest.raises(AgentBusyError):
+            with registry.acquire('model-a'):
+                pass
+        # Other models have their own slots
+        with registry.acquire('model-b'):
+            pass
+
+
+def test_stats(registry):
+    with registry.acquire('model-a'), registry.acquire('model-a'):
+        with pytest.raises(AgentBusyError):
+            with registry.acquire('model-a'):
+                pass
+        stats = registry.stats()
+    assert set(stats) == {'model-a'}
+    assert stats['model-a']['active'] == 2
+    assert stats['model-a']['requests'] == 2
+    assert stats['model-a']['rejected'] == 1
+    assert stats['model-a']['max_concurrent'] == 2
+
+
+def test_warm_up_pings_and_survives_failures(built):
+    def lm_factory(model_name):
+        if model_name == 'model-b':
+            raise ConnectionError("endpoint down")
+        built.append(model_name)
+        return FakeLM(model_name)
+
+    registry = AgentRegistry(MODELS, lm_factory, lambda lm: 'agent')
+    registry.warm_up(ping=True)
+
+    assert registry.get('model-a').lm.calls == ["ping"]
+    assert set(registry.stats()) == {'model-a'}
@@ -0,0 +1,79 @@
+import json
+import time
+
+import pytest
+
+
+def sse_events(payload):
+    events = []
+    for block in payload.decode('utf-8').strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def stream_transcript(client, app_module, transcript=None):
+    return client.post('/process_transcript_stream', data={
+        'transcript': transcript or app_module.example_transcript_turn_1,
+        'call_agent_ask': "What should I offer this customer?",
+        'llm_model': app_module.DEFAULT_LLM_MODEL,
+    })
+
+
+def test_stream_sends_status_then_tokens_then_final(fake_app, app_client):
+    app_module, _ = fake_app
+    client, services = app_client
+
+    response = stream_transcript(client, app_module)
+
+    events = sse_events(response.data)
+    names = [name for name, _ in events]
+    assert response.status_code == 200
+    assert names[0] == 'status'
+    assert names[-1] == 'final'
+    assert 'token' in names
+    first_token = names.index('token')
+    assert all(name == 'status' for name in names[:first_token])
+    assert all(name == 'token' for name in names[first_token:-1])
+    streamed = "".join(data['chunk'] for name, data in events if name == 'token')
+    assert "Recommended response" in streamed
+    assert events[-1][1]['success'] is True
+    assert services.reset_counts()['lm'] >= 2
+
+
+def test_first_token_arrives_before_the_answer_is_complete(fake_app, app_client):
+    app_module, services = fake_app
+    client, _ = app_client
+    # 300ms until the first chunk, then ~1.5s to write the report
+    services.configure(lm_latency_ms=300, lm_ms_per_output_char=1, lm_response_chars=1500)
+
+    started = time.perf_counter()
+    arrivals = []
+    response = stream_transcript(client, app_module)
+    for chunk in response.response:
+        if b'event: token' in chunk:
+            arrivals.append(time.perf_counter() - started)
+    total = time.perf_counter() - started
+
+    assert arrivals
+    assert arrivals[0] < total - 1.0
+
+
+def test_stream_sends_an_error_event_when_the_agent_fails(fake_app, app_client, monkeypatch):
+    import dspy.clients.lm
+
+    app_module, _ = fake_app
+    client, _ = app_client
+
+    def fail(*args, **kwargs):
+        raise ConnectionError("serving endpoint unavailable")
+
+    monkeypatch.setattr(dspy.clients.lm, 'litellm_completion', fail)
+    monkeypatch.setattr(dspy.clients.lm, 'alitellm_completion', fail)
+    response = stream_transcript(client, app_module, transcript="Agent: hello\nCaller: a brand new question")
+
+    events = sse_events(response.data)
+    assert events[0][0] == 'status'
+    assert events[-1][0] == 'error'
+    assert events[-1][1]['success'] is False
+    assert 'final' not in [name for name, _ in events]
@@ -0,0 +1,219 @@
+import io
+import threading
+import time
+
+import pytest
+
+import audio_transcription
+from audio_transcription import plan_segments, stitch_transcripts, transcribe_segments
+from benchmarks.fakes import FakeDeployClient, FakeServices, wav_bytes
+from conftest import FAST
+
+
+
+@pytest.mark.parametrize('speech_ranges, total_ms, expected', [
+    # Short ranges are grouped until the next one would overflow the segment
+    ([(0, 2000), (3000, 5000), (6000, 9000)], 10000, [(0, 5000), (6000, 9000)]),
+    # A single range longer than the limit is cut at fixed intervals
+    ([(1000, 13000)], 14000, [(1000, 6000), (6000, 11000), (11000, 13000)]),
+    # The pending group is closed before a long range is hard-split
+    ([(0, 1000), (2000, 8000)], 8000, [(0, 1000), (2000, 7000), (7000, 8000)]),
+    # No speech detected: send the start of the recording anyway
+    ([], 12000, [(0, 5000)]),
+    ([], 0, []),
+])
+def test_plan_segments(speech_ranges, total_ms, expected):
+    assert plan_segments(speech_ranges, total_ms, max_segment_ms=5000) == expected
+
+
+def test_plan_segments_never_exceeds_max_length():
+    speech_ranges = [(start, start + 700 + start % 2300) for start in range(0, 120000, 4000)]
+    segments = plan_segments(speech_ranges, 125000, max_segment_ms=6000)
+
+    assert all(end - start <= 6000 for start, end in segments)
+    assert segments[0][0] == 0
+    assert segments[-1][1] == speech_ranges[-1][1]
+
+
+def test_transcribe_segments_keeps_input_order():
+    # Later segments finish first
+    def transcribe(segment):
+        time.sleep(0.01 * (5 - segment))
+        return f"part {segment}"
+
+    assert transcribe_segments(iter(range(5)), transcribe, max_workers=3) == [f"part {i}" for i in range(5)]
+
+
+def test_transcribe_segments_bounds_segments_in_flight():
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def segments():
+        for i in range(8):
+            with lock:
+                in_flight.append(i)
+                peak.append(len(in_flight))
+            yield i
+
+    def transcribe(segment):
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(segment)
+        return segment
+
+    assert transcribe_segments(segments(), transcribe, max_workers=2) == list(range(8))
+    assert max(peak) <= 2
+
+
+def failing_transcriber(failures):
+    """A transcribe_fn that fails the first failures[segment] attempts for each segment."""
+    attempts = {}
+    lock = threading.Lock()
+
+    def transcribe(segment):
+        with lock:
+            attempts[segment] = attempts.get(segment, 0) + 1
+            attempt = attempts[segment]
+        if attempt <= failures.get(segment, 0):
+            raise ConnectionError(f"endpoint unavailable for {segment}")
+        return segment.upper()
+
+    return transcribe, attempts
+
+
+def test_transcribe_segments_retries_with_exponential_backoff(monkeypatch):
+    delays = []
+    monkeypatch.setattr(audio_transcription.time, 'sleep', delays.append)
+    transcribe, attempts = failing_transcriber({'b': 2})
+
+    result = transcribe_segments(['a', 'b', 'c'], transcribe, max_workers=1, retries=2, retry_backoff=0.5)
+
+    assert result == ['A', 'B', 'C']
+    assert attempts == {'a': 1, 'b': 3, 'c': 1}
+    assert delays == [0.5, 1.0]
+
+
+def test_transcribe_segments_fails_after_retries_are_exhausted(monkeypatch):
+    delays = []
+    monkeypatch.setattr(audio_transcription.time, 'sleep', delays.append)
+    transcribe, attempts = failing_transcriber({'b': 3})
+
+    with pytest.raises(ConnectionError, match="unavailable for b"):
+        transcribe_segments(['a', 'b'], transcribe, max_workers=1, retries=2, retry_backoff=1.0)
+    assert attempts['b'] == 3
+    assert delays == [1.0, 2.0]
+
+
+@pytest.mark.parametrize('transcripts, expected', [
+    (["  Hello there. ", ["How", "are", "you?"], "", "   ", "Bye."], "Hello there.\nHow are you?\nBye."),
+    ([], ""),
+    ([123], "123"),
+])
+def test_stitch_transcripts(transcripts, expected):
+    assert stitch_transcripts(transcripts) == expected
+
+
+def test_endpoint_transcriber_against_fake_endpoint():
+    services = FakeServices(FAST)
+    transcribe = audio_transcription.endpoint_transcriber(FakeDeployClient(services), 'gemma3n')
+
+    transcript = transcribe(wav_bytes(2))
+
+    assert set(transcript.split()) == {"pickup"}
+    assert services.calls == {'transcribe': 1}
+
+
+def test_iter_audio_segments_splits_on_silence(tmp_path):
+    pytest.importorskip('pydub')
+    path = tmp_path / 'call.wav'
+    path.write_bytes(wav_bytes(14, speech_seconds=4.0, pause_seconds=1.0))
+
+    segments = list(audio_transcription.iter_audio_segments(str(path), 'wav', max_segment_ms=5000))
+
+    # Three stretches of speech, each its own segment
+    assert len(segments) == 3
+    assert all(segment[:4] == b'RIFF' for segment in segments)
+
+
+def test_process_audio_transcribes_segments_in_order(app_client):
+    client, services = app_client
+
+    response = client.post('/process_audio', data={'audio_file': (io.BytesIO(wav_bytes(14)), 'call.wav')},
+                           content_type='multipart/form-data')
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['success'] is True
+    assert set(body['transcript'].split()) == {"pickup"}
+    assert services.reset_counts()['transcribe'] >= 1
+
+
+def test_process_audio_rejects_other_formats(app_client):
+    client, services = app_client
+
+    response = client.post('/process_audio', data={'audio_file': (io.BytesIO(b'ID3'), 'call.ogg')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert 'transcribe' not in services.reset_counts()
+
+
+def test_transcribe_segments_stops_after_a_segment_fails(monkeypatch):
+    monkeypatch.setattr(audio_transcription.time, 'sleep', lambda delay: None)
+    pulled = []
+    attempts = []
+
+    def segments():
+        for i in range(20):
+            pulled.append(i)
+            yield f"segment {i}"
+
+    def transcribe(segment):
+        attempts.append(segment)
+        raise ConnectionError("endpoint down")
+
+    with pytest.raises(ConnectionError):
+        transcribe_segments(segments(), transcribe, max_workers=2, retries=2)
+    assert len(pulled) <= 3
+    assert len(attempts) <= 2 * 3
+
+
+def wav_duration_ms(data):
+    import wave
+    with wave.open(io.BytesIO(data)) as wav_file:
+        return wav_file.getnframes() * 1000 // wav_file.getframerate()
+
+
+def test_iter_audio_segments_decodes_in_windows(tmp_path, monkeypatch):
+    pytest.importorskip('pydub')
+    path = tmp_path / 'call.wav'
+    # Speech from 0-4s, 5-9s, 10-14s, ...; 6s decode windows cut through the speech at 6s, 12s, ...
+    path.write_bytes(wav_bytes(60, speech_seconds=4.0, pause_seconds=1.0))
+    window_lengths = []
+    decode_windows = audio_transcription._decode_windows
+
+    def recording_decode_windows(*args):
+        for window in decode_windows(*args):
+            window_lengths.append(len(window))
+            yield window
+
+    monkeypatch.setattr(audio_transcription, '_decode_windows', recording_decode_windows)
+    segments = list(audio_transcription.iter_audio_segments(str(path), 'wav', max_segment_ms=6000))
+
+    assert max(window_lengths) == 6000
+    assert len(window_lengths) == 10
+    # Every stretch of speech is its own whole segment, never cut at a window boundary
+    assert len(segments) == 12
+    assert all(4000 <= wav_duration_ms(segment) <= 4400 for segment in segments)
+
+
+def test_iter_audio_segments_sends_silent_recording_anyway(tmp_path):
+    pytest.importorskip('pydub')
+    path = tmp_path / 'silence.wav'
+    path.write_bytes(wav_bytes(8, speech_seconds=0.0, pause_seconds=1.0))
+
+    segments = list(audio_transcription.iter_audio_segments(str(path), 'wav', max_segment_ms=5000))
+
+    assert [wav_duration_ms(segment) for segment in segments] == [5000]
@@ -0,0 +1,136 @@
+import io
+import json
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+batch_analysis = pytest.importorskip('batch_analysis', exc_type=ImportError)
+
+ROWS = [{'id': str(i), 'transcript': f"call {i}"} for i in range(7)]
+
+
+class FakeRow:
+    def __init__(self, values):
+        self.values = values
+
+    def asDict(self, recursive=False):
+        return dict(self.values)
+
+
+class FakeSparkSessions:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+        self.streamed = 0
+
+    def get_session(self):
+        return self
+
+    def sql(self, sql_query):
+        self.queries.append(sql_query)
+        return self
+
+    def toLocalIterator(self):
+        for row in self.rows:
+            self.streamed += 1
+            yield FakeRow(row)
+
+
+def test_table_rows_are_streamed():
+    sessions = FakeSparkSessions(ROWS)
+
+    rows = batch_analysis.iter_source_rows('catalog.agents.calls', sessions, limit=3)
+
+    assert list(rows) == ROWS[:3]
+    assert sessions.queries == ["SELECT * FROM catalog.agents.calls"]
+    assert sessions.streamed == 3
+
+
+def test_jsonl_source(tmp_path):
+    path = tmp_path / 'calls.jsonl'
+    path.write_text("\n".join(json.dumps(row) for row in ROWS[:2]) + "\n\n")
+
+    assert list(batch_analysis.iter_source_rows(str(path), None)) == ROWS[:2]
+
+
+def test_row_key_numbers_repeated_transcripts():
+    seen = Counter()
+    keys = [batch_analysis.row_key({'transcript': "same call"}, 'id', 'transcript', seen) for _ in range(3)]
+
+    assert keys[0] == batch_analysis.row_key({'transcript': "same call"}, 'id', 'transcript')
+    assert keys[1:] == [f"{keys[0]}-2", f"{keys[0]}-3"]
+    assert batch_analysis.row_key({'id': 7, 'transcript': "same call"}, 'id', 'transcript', seen) == '7'
+
+
+def test_checkpoint_keeps_successes_and_retries_failures(tmp_path):
+    path = tmp_path / 'guidance.jsonl'
+    path.write_text(
+        json.dumps({'key': 'a', 'relevant_information': "ok"}) + "\n"
+        + json.dumps({'key': 'b', 'error': "timeout"}) + "\n"
+        + json.dumps({'key': 'c', 'relevant_information': "ok"}) + "\n"
+        + json.dumps({'key': 'c', 'error': "rerun failed"}) + "\n"
+        + '{"key": "d", "relevant_inf'
+    )
+
+    assert batch_analysis.load_checkpoint(str(path)) == {'a'}
+    assert batch_analysis.load_checkpoint(str(tmp_path / 'missing.jsonl')) == set()
+
+
+def test_resumed_output_starts_on_a_fresh_line(tmp_path):
+    path = tmp_path / 'guidance.jsonl'
+    path.write_text('{"key": "a"}\n{"key": "b", "partial')
+
+    with batch_analysis.open_output(str(path), resume=True) as output:
+        output.write('{"key": "c"}\n')
+
+    assert path.read_text().splitlines()[-1] == '{"key": "c"}'
+    with pytest.raises(FileExistsError):
+        batch_analysis.open_output(str(path), resume=False)
+
+
+def test_run_batch_counts_successes_failures_and_skips(monkeypatch):
+    def analyze_row(app, key, row, llm_model, transcript_field, call_agent_ask, callbacks):
+        if row['transcript'] == "broken":
+            raise RuntimeError("agent failed")
+        return {'key': key, 'llm_model': llm_model}
+
+    monkeypatch.setattr(batch_analysis, 'analyze_row', analyze_row)
+    rows = [{'id': 'done', 'transcript': "x"}, {'id': 'empty', 'transcript': ""},
+            {'id': 'ok-1', 'transcript': "fine"}, {'id': 'bad', 'transcript': "broken"},
+            {'id': 'ok-2', 'transcript': "fine"}]
+    output = io.StringIO()
+
+    counts = batch_analysis.run_batch(SimpleNamespace(), rows, output, ['model-a', 'model-b'], 2, {}, {'done'})
+
+    assert {key: counts[key] for key in ('succeeded', 'failed', 'skipped')} == {
+        'succeeded': 2, 'failed': 1, 'skipped': 2
+    }
+    records = {record['key']: record for record in map(json.loads, output.getvalue().splitlines())}
+    assert records['bad'] == {'key': 'bad', 'error': "agent failed"}
+    # Round-robin over the rows that were submitted: ok-1, bad, ok-2
+    assert (records['ok-1']['llm_model'], records['ok-2']['llm_model']) == ('model-a', 'model-a')
+
+
+def test_rate_limiter_spaces_calls_evenly(monkeypatch):
+    clock = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(round(seconds, 3))
+        clock[0] += seconds
+
+    monkeypatch.setattr(batch_analysis.time, 'monotonic', lambda: clock[0])
+    monkeypatch.setattr(batch_analysis.time, 'sleep', sleep)
+    limiter = batch_analysis.RateLimiter(per_minute=120)
+
+    for _ in range(3):
+        limiter.acquire()
+    clock[0] += 5
+    limiter.acquire()
+
+    assert sleeps == [0.5, 0.5]
+
+
+def test_parse_rate_limits():
+    assert batch_analysis.parse_rate_limits(['model-a=120', 'model-b=30.5']) == {'model-a': 120.0, 'model-b': 30.5}
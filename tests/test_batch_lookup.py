@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from batch_lookup import BatchQueryRunner
+
+
+class FakeWarehouse:
+    """run_query stand-in: 'slow:<seconds>' sleeps, 'hang' blocks until released, 'fail' raises."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def run_query(self, query):
+        if query.startswith('slow:'):
+            time.sleep(float(query.split(':')[1]))
+        elif query == 'hang':
+            self.release.wait(5)
+        elif query == 'fail':
+            raise RuntimeError("table not found")
+        return [{'query': query}]
+
+
+@pytest.fixture
+def warehouse():
+    warehouse = FakeWarehouse()
+    yield warehouse
+    warehouse.release.set()
+
+
+def test_results_are_reported_per_query_in_order(warehouse):
+    runner = BatchQueryRunner(warehouse.run_query, max_workers=4, query_timeout=1, max_queries=3)
+
+    results = runner.run(['slow:0.05', 'fail', 'a', 'b', '  '])
+
+    assert results == [
+        {'query': 'slow:0.05', 'result': [{'query': 'slow:0.05'}]},
+        {'query': 'fail', 'error': "table not found"},
+        {'query': 'a', 'result': [{'query': 'a'}]},
+        {'query': 'b', 'error': "Skipped, at most 3 queries run per batch"},
+    ]
+    assert runner.stats()['failures'] == 1
+
+
+def test_deadline_counts_from_when_each_query_starts(warehouse):
+    # One worker: the second query waits 0.2s for the first, then still gets its own 0.3s
+    runner = BatchQueryRunner(warehouse.run_query, max_workers=1, query_timeout=0.3)
+
+    results = runner.run(['slow:0.2', 'slow:0.2'])
+
+    assert [result.get('result') for result in results] == [[{'query': 'slow:0.2'}]] * 2
+    assert runner.stats()['timeouts'] == 0
+
+
+def test_hung_query_times_out_without_waiting_for_it(warehouse):
+    runner = BatchQueryRunner(warehouse.run_query, max_workers=2, query_timeout=0.1)
+
+    started = time.monotonic()
+    results = runner.run(['hang', 'a'])
+
+    assert time.monotonic() - started < 1
+    assert results[0] == {'query': 'hang', 'error': "Timed out after 0.1 seconds"}
+    assert results[1]['result'] == [{'query': 'a'}]
+    assert runner.stats()['abandoned_running'] == 1
+
+
+def test_queued_query_is_cancelled_when_the_pool_is_busy(warehouse):
+    runner = BatchQueryRunner(warehouse.run_query, max_workers=1, query_timeout=0.1, max_abandoned=5)
+
+    results = runner.run(['hang', 'a'])
+
+    assert results[0]['error'] == "Timed out after 0.1 seconds"
+    assert results[1]['error'].startswith("Not started within 0.1 seconds")
+    assert runner.stats()['cancelled'] == 1
+
+
+def test_new_queries_are_refused_while_too_many_are_abandoned(warehouse):
+    runner = BatchQueryRunner(warehouse.run_query, max_workers=4, query_timeout=0.05, max_abandoned=2)
+    runner.run(['hang', 'hang'])
+
+    refused = runner.run(['a'])
+    assert refused == [{'query': 'a', 'error': "Refused, earlier lookups are still running; try again later"}]
+
+    warehouse.release.set()
+    deadline = time.monotonic() + 2
+    while runner.stats()['abandoned_running'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert runner.run(['a']) == [{'query': 'a', 'result': [{'query': 'a'}]}]
+    assert runner.stats()['refused'] == 1
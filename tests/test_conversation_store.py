@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from conversation_store import ConversationStore, create_conversation_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        return create_conversation_store(request.param, path=str(tmp_path / 'conversations.db'), **kwargs)
+    return make
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        ConversationStore()
+
+
+def test_values_and_bounded_history(make_store):
+    store = make_store(max_turns=2)
+    store.set_values('a', llm_model='m', processing=True)
+    store.set_values('a', processing=False)
+    for turn in range(3):
+        store.append_turn('a', {'turn': turn})
+    assert store.get_values('a') == {'llm_model': 'm', 'processing': False}
+    assert store.get_history('a') == [{'turn': 1}, {'turn': 2}]
+    assert store.get_history('b') == []
+
+    store.clear_history('a')
+    assert store.get_history('a') == []
+    store.delete('a')
+    assert store.get_values('a') == {}
+
+
+def test_idle_sessions_are_purged_as_other_sessions_write(make_store):
+    store = make_store(idle_ttl=0.05, purge_interval=0.05)
+    store.set_values('idle', transcript_input='x')
+    time.sleep(0.1)
+    store.set_values('active', transcript_input='y')
+    stats = store.stats()
+    assert stats['sessions'] == 1
+    assert stats['expirations'] == 1
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'conversations.db')
+    first = create_conversation_store('sqlite', path=path)
+    second = create_conversation_store('sqlite', path=path)
+    first.append_turn('a', {'transcript': 'hello'})
+    assert second.get_history('a') == [{'transcript': 'hello'}]
+
+
+def test_sqlite_concurrent_writers_keep_each_others_values(tmp_path):
+    path = str(tmp_path / 'conversations.db')
+    writes = 50
+    stores = [create_conversation_store('sqlite', path=path) for _ in range(2)]
+    stores[0].set_values('a', started=True)
+    errors = []
+
+    def write(store, key):
+        try:
+            for i in range(writes):
+                store.set_values('a', **{key: i})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(store, key)) for store, key in zip(stores, ['first', 'second'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert stores[0].get_values('a') == {'started': True, 'first': writes - 1, 'second': writes - 1}
@@ -0,0 +1,44 @@
+from customer_prefetch import extract_customer_entities
+
+EXAMPLE = """
+Austin: Thank you for calling QuickShip Logistics, this is Austin speaking. How may I assist you today?
+Avery Johnson: Hi Austin, this is Avery Johnson. I need to schedule a pickup. It's AJ78542.
+Austin: Thanks, Mr. Johnson. I see account QS-0042113 as well.
+"""
+
+
+def names(transcript, known_customers=None):
+    return extract_customer_entities(transcript, known_customers)['customer_names']
+
+
+def test_caller_and_account_numbers():
+    assert extract_customer_entities(EXAMPLE) == {
+        'customer_names': ['Avery Johnson'], 'account_numbers': ['AJ78542', 'QS-0042113']
+    }
+
+
+def test_its_is_not_an_introduction():
+    assert names("Caller: It's Tuesday Morning Delivery I'm worried about, it's Fragile Goods.") == []
+
+
+def test_first_speaker_is_the_agent():
+    transcript = "Jordan Lee: QuickShip, how can I help?\nSam Rivera: My name is Sam Rivera."
+    assert names(transcript) == ['Sam Rivera']
+
+
+def test_speaker_introducing_themselves_by_first_name_is_an_agent():
+    transcript = ("Caller Line: hello?\n"
+                  "Dana Park: Hi, I'm Dana, I'll take your call.\n"
+                  "Caller Line: I am Chris Moss.")
+    assert names(transcript) == ['Chris Moss']
+
+
+def test_weekday_and_month_words_are_not_names():
+    transcript = "Agent: Hello.\nCustomer: This is Monday, and my pickup was due in March. I am May Chen."
+    assert names(transcript) == ['May Chen']
+
+
+def test_known_customers_replace_the_heuristics():
+    transcript = EXAMPLE + "Avery Johnson: I'm also calling for Jamie Fox."
+    assert names(transcript, ['Jamie Fox', 'Pat Doe']) == ['Jamie Fox']
+    assert names(transcript, ['avery johnson']) == ['avery johnson']
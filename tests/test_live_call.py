@@ -0,0 +1,201 @@
+import json
+import threading
+import time
+from array import array
+
+import pytest
+
+from live_call import LiveCallSession, parse_start_message
+
+MODELS = ['databricks-claude-3-7-sonnet', 'databricks-llama-4-maverick']
+
+
+def test_start_message_defaults():
+    start = parse_start_message(json.dumps({'type': 'start'}), MODELS, MODELS[0])
+
+    assert start == {'llm_model': MODELS[0], 'call_agent_ask': None, 'sample_rate': 16000}
+
+
+def test_start_message_settings():
+    message = json.dumps({'type': 'start', 'llm_model': MODELS[1], 'call_agent_ask': "Any upsell?",
+                          'sample_rate': '8000'})
+
+    assert parse_start_message(message, MODELS, MODELS[0]) == {
+        'llm_model': MODELS[1], 'call_agent_ask': "Any upsell?", 'sample_rate': 8000
+    }
+
+
+@pytest.mark.parametrize('message, error', [
+    ("not json", "JSON start message"),
+    (None, "JSON start message"),
+    (b'\x00\x01', "JSON start message"),
+    (json.dumps(['start']), "JSON start message"),
+    (json.dumps({'type': 'stop'}), "JSON start message"),
+    (json.dumps({'type': 'start', 'llm_model': 'gpt-unlisted'}), "Unsupported LLM model: gpt-unlisted"),
+    (json.dumps({'type': 'start', 'sample_rate': 'fast'}), "Invalid sample rate"),
+    (json.dumps({'type': 'start', 'sample_rate': 0}), "Invalid sample rate"),
+])
+def test_invalid_start_message(message, error):
+    with pytest.raises(ValueError, match=error):
+        parse_start_message(message, MODELS, MODELS[0])
+
+
+# 100 Hz keeps the windows tiny: one second of audio is 200 bytes
+SAMPLE_RATE = 100
+SILENT = bytes(200)
+LOUD = array('h', [12000] * 100).tobytes()
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.005)
+
+
+class Recorder:
+    """Fake transcribe_fn, route_fn and send_event for one LiveCallSession."""
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+        self.events = []
+        self.routed = []
+        self.transcribing = threading.Event()
+        self.transcribe_gate = threading.Event()
+        self.route_gate = threading.Event()
+        self.transcribe_gate.set()
+        self.route_gate.set()
+
+    def transcribe(self, wav):
+        assert wav[:4] == b'RIFF'
+        self.transcribing.set()
+        self.transcribe_gate.wait(2)
+        return self.texts.pop(0) if self.texts else ""
+
+    def route(self, dialogue):
+        self.routed.append(dialogue)
+        self.route_gate.wait(2)
+        return {'response': f"guidance for {len(dialogue)} chars"}
+
+    def send(self, event, data):
+        self.events.append((event, data))
+
+    def session(self, **kwargs):
+        settings = dict(sample_rate=SAMPLE_RATE, window_seconds=1, min_new_chars=10, turn_silence_ms=100,
+                        max_wait_seconds=60)
+        settings.update(kwargs)
+        return LiveCallSession(self.send, self.transcribe, self.route, **settings)
+
+    def event_names(self):
+        return [event for event, _ in self.events]
+
+
+def test_audio_is_cut_into_windows():
+    recorder = Recorder(["first window", "second window"])
+    session = recorder.session(min_new_chars=1000)
+
+    session.add_audio(bytes(150))
+    assert session.stats()['windows_transcribed'] == 0
+    session.add_audio(bytes(250))
+    wait_for(lambda: session.stats()['windows_transcribed'] == 2)
+
+    assert [data['text'] for event, data in recorder.events if event == 'transcript'] == ["first window",
+                                                                                         "second window"]
+    session.close()
+
+
+def test_oldest_windows_are_dropped_when_transcription_falls_behind():
+    recorder = Recorder(["window %d" % i for i in range(10)])
+    recorder.transcribe_gate.clear()
+    session = recorder.session(max_queued_windows=2, min_new_chars=1000)
+
+    session.add_audio(SILENT)
+    assert recorder.transcribing.wait(2)
+    session.add_audio(SILENT * 5)
+
+    assert session.stats()['windows_dropped'] == 3
+    assert session.stats()['windows_queued'] == 2
+    recorder.transcribe_gate.set()
+    session.close()
+    assert session.stats()['windows_transcribed'] == 3
+
+
+def test_routing_waits_for_enough_new_dialogue():
+    recorder = Recorder(["hi", "yes", "I need to reschedule my pickup"])
+    session = recorder.session()
+
+    session.add_audio(SILENT * 2)
+    wait_for(lambda: session.stats()['windows_transcribed'] == 2)
+    time.sleep(0.05)
+    assert recorder.routed == []
+
+    session.add_audio(SILENT)
+    wait_for(lambda: session.stats()['routings'] == 1)
+    assert recorder.routed == ["hi\nyes\nI need to reschedule my pickup"]
+    assert recorder.event_names()[-2:] == ['status', 'guidance']
+    session.close()
+
+
+def test_routing_waits_for_a_pause_unless_max_wait_has_passed():
+    recorder = Recorder(["the caller is still talking", "and now pauses"])
+    session = recorder.session()
+
+    session.add_audio(LOUD)
+    wait_for(lambda: session.stats()['windows_transcribed'] == 1)
+    time.sleep(0.05)
+    assert recorder.routed == []
+
+    session.add_audio(SILENT)
+    wait_for(lambda: session.stats()['routings'] == 1)
+    assert recorder.routed == ["the caller is still talking\nand now pauses"]
+    session.close()
+
+    impatient = Recorder(["the caller is still talking"])
+    session = impatient.session(max_wait_seconds=0)
+    session.add_audio(LOUD)
+    wait_for(lambda: session.stats()['routings'] == 1)
+    session.close()
+
+
+def test_text_arriving_during_a_routing_is_batched_into_the_next():
+    recorder = Recorder(["first question from caller", "second part", "third part of it"])
+    recorder.route_gate.clear()
+    session = recorder.session()
+
+    session.add_audio(SILENT)
+    wait_for(lambda: len(recorder.routed) == 1)
+    session.add_audio(SILENT * 2)
+    wait_for(lambda: session.stats()['windows_transcribed'] == 3)
+    recorder.route_gate.set()
+    wait_for(lambda: session.stats()['routings'] == 2)
+
+    assert recorder.routed == ["first question from caller", "second part\nthird part of it"]
+    session.close()
+
+
+def test_close_transcribes_and_routes_what_is_left():
+    recorder = Recorder(["short", "tail"])
+    session = recorder.session(min_new_chars=1000)
+
+    session.add_audio(LOUD + LOUD[:50])
+    session.close(timeout=2)
+
+    assert recorder.routed == ["short\ntail"]
+    assert session.stats()['windows_transcribed'] == 2
+    assert session.stats()['routings'] == 1
+
+
+def test_failed_routing_sends_an_error_event():
+    recorder = Recorder(["a long enough piece of dialogue"])
+
+    def fail(dialogue):
+        raise RuntimeError("endpoint down")
+
+    session = LiveCallSession(recorder.send, recorder.transcribe, fail, sample_rate=SAMPLE_RATE,
+                              window_seconds=1, min_new_chars=10, turn_silence_ms=100)
+    session.add_audio(SILENT)
+    wait_for(lambda: session.stats()['errors'] == 1)
+    session.close()
+
+    assert recorder.event_names()[-1] == 'error'
@@ -0,0 +1,86 @@
+import pytest
+
+from metrics import MetricsRegistry
+
+
+def test_counter_render():
+    registry = MetricsRegistry(namespace="test")
+    registry.inc('requests_total', help_text="Requests served", route='/a')
+    registry.inc('requests_total', 2, route='/a')
+    registry.inc('requests_total', route='/b')
+    assert registry.render() == (
+        '# HELP test_requests_total Requests served\n'
+        '# TYPE test_requests_total counter\n'
+        'test_requests_total{route="/a"} 3\n'
+        'test_requests_total{route="/b"} 1\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry(namespace="test", buckets=(0.1, 1, 10))
+    for value in (0.05, 0.5, 0.5, 5, 50):
+        registry.observe('latency_seconds', value, stage='lookup')
+    assert registry.render().splitlines() == [
+        '# TYPE test_latency_seconds histogram',
+        'test_latency_seconds_bucket{stage="lookup",le="0.1"} 1',
+        'test_latency_seconds_bucket{stage="lookup",le="1"} 3',
+        'test_latency_seconds_bucket{stage="lookup",le="10"} 4',
+        'test_latency_seconds_bucket{stage="lookup",le="+Inf"} 5',
+        'test_latency_seconds_sum{stage="lookup"} 56.05',
+        'test_latency_seconds_count{stage="lookup"} 5',
+    ]
+
+
+def test_label_values_are_escaped_and_none_labels_dropped():
+    registry = MetricsRegistry(namespace="test")
+    registry.inc('events_total', detail='say "hi"\\\n', source=None)
+    assert 'test_events_total{detail="say \\"hi\\"\\\\\\n"} 1' in registry.render()
+
+
+def test_timer_records_duration_and_errors():
+    registry = MetricsRegistry(namespace="test", buckets=(60,))
+    with registry.timer('decode', audio_format='wav'):
+        pass
+    with pytest.raises(ValueError):
+        with registry.timer('decode', audio_format='wav'):
+            raise ValueError("bad audio")
+    output = registry.render()
+    assert 'test_stage_errors_total{audio_format="wav",stage="decode"} 1' in output
+    assert 'test_stage_duration_seconds_count{audio_format="wav",stage="decode"} 2' in output
+    assert 'test_stage_duration_seconds_bucket{audio_format="wav",stage="decode",le="60"} 2' in output
+
+
+def test_collector_values_become_gauges():
+    registry = MetricsRegistry(namespace="test")
+    registry.register_collector('cache', lambda: {'entries': 3, 'hit_rate': 0.5, 'ready': True, 'name': 'lru'})
+    assert registry.render() == (
+        '# TYPE test_cache_entries gauge\n'
+        'test_cache_entries 3\n'
+        '# TYPE test_cache_hit_rate gauge\n'
+        'test_cache_hit_rate 0.5\n'
+        '# TYPE test_cache_ready gauge\n'
+        'test_cache_ready 1\n'
+    )
+
+
+def test_nested_collector_values_are_labelled():
+    registry = MetricsRegistry(namespace="test")
+    registry.register_collector('agents', lambda: {'model-a': {'active': 1}, 'model-b': {'active': 0}}, label='model')
+    assert registry.render().splitlines() == [
+        '# TYPE test_agents_active gauge',
+        'test_agents_active{model="model-a"} 1',
+        'test_agents_active{model="model-b"} 0',
+    ]
+
+
+def test_failing_collector_does_not_break_render():
+    registry = MetricsRegistry(namespace="test")
+
+    def collect():
+        raise RuntimeError("not ready")
+
+    registry.register_collector('broken', collect)
+    registry.inc('requests_total')
+    output = registry.render()
+    assert '# collector broken failed: not ready' in output
+    assert 'test_requests_total 1' in output
@@ -0,0 +1,118 @@
+import pyarrow as pa
+import pytest
+
+from profile_snapshot import CustomerProfileSnapshot
+
+
+class FakeDataFrame:
+    def __init__(self, table):
+        self.table = table
+
+    def toArrow(self):
+        return self.table
+
+    def collect(self):
+        return self.table.to_pylist()
+
+
+class FakeWarehouse:
+    """Answers the version, full-load and change-feed queries CustomerProfileSnapshot sends."""
+
+    def __init__(self, rows):
+        self.version = 1
+        self.rows = rows
+        self.changes = []
+        self.queries = []
+
+    def sql(self, query):
+        self.queries.append(query)
+        if query.startswith('DESCRIBE HISTORY'):
+            return FakeDataFrame(pa.Table.from_pylist([{'version': self.version}]))
+        if 'table_changes' in query:
+            return FakeDataFrame(pa.Table.from_pylist(self.changes))
+        return FakeDataFrame(pa.Table.from_pylist(self.rows))
+
+    def run(self, action):
+        return action(self)
+
+
+@pytest.fixture
+def warehouse():
+    return FakeWarehouse([
+        {'customer_name': 'Avery Johnson', 'total_calls': 10},
+        {'customer_name': 'Maria Lopez', 'total_calls': 3},
+    ])
+
+
+@pytest.fixture
+def snapshot(warehouse, tmp_path):
+    snapshot = CustomerProfileSnapshot(warehouse, 'catalog.agents.customer_profiles', str(tmp_path))
+    assert snapshot.refresh()
+    return snapshot
+
+
+def lookup(snapshot, name):
+    return snapshot.try_lookup(f"SELECT * FROM customer_profiles WHERE customer_name = '{name}'")
+
+
+def test_point_lookup_is_answered_locally(snapshot):
+    assert lookup(snapshot, 'Avery Johnson') == (True, [{'customer_name': 'Avery Johnson', 'total_calls': 10}])
+    assert snapshot.try_lookup("SELECT count(*) FROM customer_profiles") == (False, None)
+
+
+def test_change_feed_is_applied_incrementally(snapshot, warehouse):
+    warehouse.version = 2
+    warehouse.changes = [
+        {'customer_name': 'Avery Johnson', 'total_calls': 11, '_change_type': 'update_postimage',
+         '_commit_version': 2},
+        {'customer_name': 'Avery Johnson', 'total_calls': 10, '_change_type': 'update_preimage',
+         '_commit_version': 2},
+    ]
+    assert snapshot.refresh()
+    assert lookup(snapshot, 'Avery Johnson')[1] == [{'customer_name': 'Avery Johnson', 'total_calls': 11}]
+    assert snapshot.stats()['incremental_refreshes'] == 1
+    assert snapshot.stats()['full_loads'] == 1
+
+
+def test_changes_that_no_longer_fit_fall_back_to_a_full_load(snapshot, warehouse):
+    # total_calls was renamed, so the changed rows can't be merged into the snapshot's schema
+    warehouse.version = 2
+    warehouse.rows = [{'customer_name': 'Avery Johnson', 'call_count': 12}]
+    warehouse.changes = [{'customer_name': 'Avery Johnson', 'call_count': 12, '_change_type': 'update_postimage',
+                          '_commit_version': 2}]
+    assert snapshot.refresh()
+    stats = snapshot.stats()
+    assert stats['full_loads'] == 2
+    assert stats['refresh_errors'] == 0
+    assert stats['version'] == 2
+    assert lookup(snapshot, 'Avery Johnson')[1] == [{'customer_name': 'Avery Johnson', 'call_count': 12}]
+
+
+def test_snapshot_reloads_from_disk(snapshot, warehouse, tmp_path):
+    restarted = CustomerProfileSnapshot(warehouse, 'catalog.agents.customer_profiles', str(tmp_path))
+    assert restarted.load_from_disk()
+    assert lookup(restarted, 'Maria Lopez')[1] == [{'customer_name': 'Maria Lopez', 'total_calls': 3}]
+
+
+def test_update_then_delete_in_one_refresh_removes_the_customer(snapshot, warehouse):
+    warehouse.version = 3
+    warehouse.changes = [
+        {'customer_name': 'Avery Johnson', 'total_calls': 10, '_change_type': 'update_preimage',
+         '_commit_version': 2},
+        {'customer_name': 'Avery Johnson', 'total_calls': 11, '_change_type': 'update_postimage',
+         '_commit_version': 2},
+        {'customer_name': 'Avery Johnson', 'total_calls': 11, '_change_type': 'delete', '_commit_version': 3},
+    ]
+    assert snapshot.refresh()
+    assert lookup(snapshot, 'Avery Johnson') == (True, [])
+    assert lookup(snapshot, 'Maria Lopez')[1] == [{'customer_name': 'Maria Lopez', 'total_calls': 3}]
+
+
+def test_delete_then_reinsert_keeps_the_new_row(snapshot, warehouse):
+    warehouse.version = 3
+    warehouse.changes = [
+        {'customer_name': 'Maria Lopez', 'total_calls': 3, '_change_type': 'delete', '_commit_version': 2},
+        {'customer_name': 'Maria Lopez', 'total_calls': 1, '_change_type': 'insert', '_commit_version': 3},
+    ]
+    assert snapshot.refresh()
+    assert lookup(snapshot, 'Maria Lopez')[1] == [{'customer_name': 'Maria Lopez', 'total_calls': 1}]
@@ -0,0 +1,150 @@
+import json
+import time
+
+from query_cache import QueryResultCache, normalize_sql, parse_point_lookup
+
+
+def test_cosmetic_variations_share_a_key():
+    assert normalize_sql("SELECT *\n  FROM t WHERE name = 'Avery'; ") == normalize_sql("select * from t where name='Avery'")
+
+
+def test_literal_case_is_kept():
+    assert normalize_sql("SELECT * FROM t WHERE name = 'Avery'") != normalize_sql("SELECT * FROM t WHERE name = 'avery'")
+
+
+def test_line_comment_ends_at_newline():
+    commented = normalize_sql("SELECT * FROM t WHERE a = 'x' -- note\n AND b = 1")
+    assert commented == normalize_sql("SELECT * FROM t WHERE a = 'x' AND b = 1")
+    assert commented != normalize_sql("SELECT * FROM t WHERE a = 'x' -- note and b = 1")
+
+
+def test_block_comments_are_removed():
+    assert normalize_sql("SELECT /* all\n columns */ * FROM t") == normalize_sql("SELECT * FROM t")
+
+
+def test_comment_markers_inside_literals_are_kept():
+    assert normalize_sql("SELECT * FROM t WHERE a = '-- not a comment'") == "select * from t where a='-- not a comment'"
+    assert normalize_sql("SELECT * FROM t /* don't */ WHERE a = 'x'") == "select * from t where a='x'"
+
+
+def test_point_lookup_with_comment():
+    lookup = parse_point_lookup("SELECT * FROM customer_profiles -- by name\nWHERE customer_name = 'Avery Johnson'")
+    assert lookup['key'] == 'customer_name'
+    assert lookup['keys'] == ['Avery Johnson']
+
+
+def _cache(**kwargs):
+    return QueryResultCache(table_ttls={'customer_profiles': 3600, 'transcripts': 300}, default_ttl=60, **kwargs)
+
+
+def test_ttl_is_the_shortest_of_the_referenced_tables():
+    cache = _cache()
+    assert cache.ttl_for(normalize_sql("SELECT * FROM cat.db.customer_profiles")) == 3600
+    assert cache.ttl_for(normalize_sql("SELECT * FROM transcripts")) == 300
+    joined = normalize_sql("SELECT * FROM customer_profiles p JOIN transcripts t ON p.id = t.id")
+    assert cache.ttl_for(joined) == 300
+    assert cache.ttl_for(normalize_sql("SELECT * FROM other_table")) == 60
+    assert cache.ttl_for(normalize_sql("SELECT 1")) == 60
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = _cache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [{'n': len(calls)}]
+
+    query = "SELECT * FROM transcripts WHERE call_id = 'a'"
+    assert cache.get_or_compute(query, compute) == [{'n': 1}]
+    now[0] += 299
+    assert cache.get_or_compute(query, compute) == [{'n': 1}]
+    now[0] += 1
+    assert cache.get_or_compute(query, compute) == [{'n': 2}]
+    assert cache.stats()['expirations'] == 1
+
+
+def test_cosmetic_variations_hit_the_same_entry():
+    cache = _cache()
+    cache.get_or_compute("SELECT * FROM t WHERE a = 'x'", lambda: [{'a': 'x'}])
+    assert cache.get_or_compute("select *\nfrom t where a='x';", lambda: [{'a': 'other'}]) == [{'a': 'x'}]
+
+
+def test_query_starting_with_a_comment_is_cached():
+    cache = _cache()
+    query = "-- lookup by name\nSELECT * FROM customer_profiles WHERE customer_name = 'Avery'"
+    cache.get_or_compute(query, lambda: [{'customer_name': 'Avery'}])
+    assert cache.get_or_compute(query, lambda: []) == [{'customer_name': 'Avery'}]
+    assert cache.stats()['entries'] == 1
+
+
+def test_non_read_only_queries_are_not_cached():
+    cache = _cache()
+    calls = []
+    for _ in range(2):
+        cache.get_or_compute("INSERT INTO t VALUES (1)", lambda: calls.append(1))
+    assert len(calls) == 2
+    assert cache.stats()['entries'] == 0
+
+
+def test_lru_eviction_by_entry_count():
+    cache = _cache(max_entries=2)
+    cache.put('select * from a', [1])
+    cache.put('select * from b', [2])
+    assert cache.get('select * from a') == (True, [1])
+    cache.put('select * from c', [3])
+    assert cache.get('select * from b') == (False, None)
+    assert cache.get('select * from a') == (True, [1])
+    assert cache.get('select * from c') == (True, [3])
+    assert cache.stats()['evictions'] == 1
+
+
+def test_lru_eviction_by_bytes():
+    row = [{'value': 'x' * 80}]
+    size = len(json.dumps(row))
+    cache = _cache(max_bytes=size * 2)
+    cache.put('select * from a', row)
+    cache.put('select * from b', row)
+    cache.put('select * from c', row)
+    stats = cache.stats()
+    assert stats['entries'] == 2
+    assert stats['bytes'] == size * 2
+    assert stats['evictions'] == 1
+    assert cache.get('select * from a') == (False, None)
+
+
+def test_values_larger_than_max_bytes_are_not_cached():
+    cache = _cache(max_bytes=10)
+    cache.put('select * from a', [{'value': 'x' * 80}])
+    assert cache.stats()['entries'] == 0
+
+
+def test_hit_and_miss_stats():
+    cache = _cache()
+    cache.get('select * from a')
+    cache.put('select * from a', [1])
+    cache.get('select * from a')
+    cache.get('select * from a')
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 1)
+    assert stats['hit_rate'] == 2 / 3
+
+
+def test_cached_rows_are_copies():
+    cache = _cache()
+    cache.put('select * from a', [{'name': 'Avery'}])
+    _, rows = cache.get('select * from a')
+    rows[0]['name'] = 'changed'
+    assert cache.get('select * from a') == (True, [{'name': 'Avery'}])
+
+
+def test_invalidate_table_removes_only_queries_reading_it():
+    cache = _cache()
+    cache.put(normalize_sql("SELECT * FROM cat.db.customer_profiles WHERE customer_name = 'a'"), [1])
+    cache.put(normalize_sql("SELECT * FROM transcripts t JOIN customer_profiles p ON t.id = p.id"), [2])
+    cache.put(normalize_sql("SELECT * FROM transcripts"), [3])
+    assert cache.invalidate_table('cat.db.Customer_Profiles') == 2
+    assert cache.stats()['entries'] == 1
+    assert cache.get(normalize_sql("SELECT * FROM transcripts")) == (True, [3])
@@ -0,0 +1,83 @@
+import json
+import pickle
+
+import pytest
+
+import response_cache
+from response_cache import LLMResponseCache
+
+MESSAGES = [{'role': 'user', 'content': "Customer Jane Doe asks about her bill"}]
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def model_dump_json(self):
+        return json.dumps({'content': self.content})
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # Rebuild plain dicts instead of litellm responses so the cache can be tested on its own
+    monkeypatch.setattr(response_cache, '_load_response', lambda data: data)
+    return LLMResponseCache(str(tmp_path / 'responses.sqlite'))
+
+
+def test_put_then_get_round_trips_through_json(cache):
+    cache.put('model-a', MESSAGES, {'temperature': 0}, FakeResponse("Offer the loyalty discount"))
+
+    assert cache.get('model-a', MESSAGES, {'temperature': 0}) == {'content': "Offer the loyalty discount"}
+    assert cache.get('model-b', MESSAGES, {'temperature': 0}) is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_pickled_entry_is_dropped_not_unpickled(cache, monkeypatch):
+    cache.put('model-a', MESSAGES, {}, FakeResponse("original"))
+
+    class Exploit:
+        def __reduce__(self):
+            return (pytest.fail, ("pickle payload was executed",))
+
+    cache._connection.execute("UPDATE responses SET response = ?", (pickle.dumps(Exploit()),))
+
+    assert cache.get('model-a', MESSAGES, {}) is None
+    assert cache.stats()['entries'] == 0
+    assert cache.stats()['bytes'] == 0
+
+
+def test_unserializable_response_is_not_cached(cache):
+    cache.put('model-a', MESSAGES, {}, object())
+
+    assert cache.stats()['entries'] == 0
+
+
+def test_invalidate_mentions_drops_matching_prompts(cache):
+    cache.put('model-a', MESSAGES, {}, FakeResponse("a"))
+    cache.put('model-a', [{'role': 'user', 'content': "John Roe"}], {}, FakeResponse("b"))
+
+    assert cache.invalidate_mentions(["Jane Doe"]) == 1
+    assert cache.get('model-a', MESSAGES, {}) is None
+    assert cache.stats()['entries'] == 1
+
+
+def test_near_duplicate_lookup_ignores_whitespace_and_case(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, '_load_response', lambda data: data)
+    cache = LLMResponseCache(str(tmp_path / 'responses.sqlite'), near_duplicates=True)
+    cache.put('model-a', MESSAGES, {}, FakeResponse("a"))
+
+    reformatted = [{'role': 'user', 'content': "customer  jane doe\nasks about her bill"}]
+    assert cache.get('model-a', reformatted, {}) == {'content': "a"}
+    assert cache.stats()['near_duplicate_hits'] == 1
+
+
+def test_litellm_response_round_trip(tmp_path):
+    litellm = pytest.importorskip('litellm')
+    cache = LLMResponseCache(str(tmp_path / 'responses.sqlite'))
+    response = litellm.ModelResponse(choices=[{'message': {'role': 'assistant', 'content': "Hello"}}])
+    cache.put('model-a', MESSAGES, {}, response)
+
+    cached = cache.get('model-a', MESSAGES, {})
+    assert isinstance(cached, litellm.ModelResponse)
+    assert cached.choices[0].message.content == "Hello"
@@ -0,0 +1,131 @@
+import json
+
+import pyarrow as pa
+import pytest
+
+from result_fetch import TRUNCATION_MARKER, bounded_dataframe, collect_bounded_rows, iter_rows, to_arrow
+
+
+class FakeArrowDataFrame:
+    def __init__(self, table):
+        self.table = table
+
+    def toArrow(self):
+        return self.table
+
+
+class FakePandasDataFrame:
+    """A DataFrame from an older Spark Connect client, which has toPandas but no toArrow."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def toPandas(self):
+        return self.table.to_pandas()
+
+
+def _rows(count, text='x'):
+    return [{'id': i, 'text': text} for i in range(count)]
+
+
+def test_collect_bounded_rows_within_budget():
+    rows = _rows(3)
+    assert collect_bounded_rows(iter(rows), max_rows=3, max_bytes=10_000) == rows
+
+
+def test_collect_bounded_rows_stops_at_max_rows():
+    results = collect_bounded_rows(iter(_rows(10)), max_rows=4, max_bytes=10_000)
+    assert results[:4] == _rows(4)
+    assert len(results) == 5
+    assert results[-1]['_notice'].startswith("Result truncated to 4 rows")
+
+
+def test_collect_bounded_rows_stops_at_max_bytes():
+    rows = _rows(10, text='y' * 50)
+    row_bytes = len(json.dumps(rows[0]))
+    results = collect_bounded_rows(iter(rows), max_rows=100, max_bytes=row_bytes * 3 + 1)
+    assert results[:3] == rows[:3]
+    assert results[-1] == {
+        '_notice': f"Result truncated to 3 rows ({row_bytes * 3} bytes). "
+                   "Select specific columns, add filters or a LIMIT to see other rows."
+    }
+
+
+def test_collect_bounded_rows_does_not_read_past_the_budget():
+    consumed = []
+
+    def rows():
+        for row in _rows(100):
+            consumed.append(row)
+            yield row
+
+    collect_bounded_rows(rows(), max_rows=2, max_bytes=10_000)
+    assert len(consumed) == 3
+
+
+def test_collect_bounded_rows_keeps_a_notice_when_the_first_row_is_too_large():
+    results = collect_bounded_rows(iter(_rows(1, text='z' * 500)), max_rows=10, max_bytes=100)
+    assert len(results) == 1
+    assert results[0]['_notice'].startswith("Result truncated to 0 rows (0 bytes)")
+
+
+def test_iter_rows_yields_every_row_in_order():
+    rows = _rows(10)
+    table = pa.Table.from_pylist(rows)
+    assert list(iter_rows(table, batch_size=3)) == rows
+
+
+def test_iter_rows_is_lazy():
+    rows = iter_rows(pa.Table.from_pylist(_rows(10)), batch_size=4)
+    assert next(rows) == {'id': 0, 'text': 'x'}
+
+
+def test_iter_rows_feeds_collect_bounded_rows():
+    table = pa.Table.from_pylist(_rows(50))
+    results = collect_bounded_rows(iter_rows(table, batch_size=8), max_rows=20, max_bytes=10_000)
+    assert results[:20] == _rows(20)
+    assert '_notice' in results[-1]
+
+
+def test_to_arrow_prefers_to_arrow():
+    table = pa.Table.from_pylist(_rows(2))
+    assert to_arrow(FakeArrowDataFrame(table)) is table
+
+
+def test_to_arrow_falls_back_to_pandas():
+    pytest.importorskip('pandas')
+    table = pa.Table.from_pylist(_rows(2))
+    assert to_arrow(FakePandasDataFrame(table)).to_pylist() == table.to_pylist()
+
+
+@pytest.fixture(scope='module')
+def spark():
+    pytest.importorskip('pyspark')
+    from pyspark.sql import SparkSession
+
+    try:
+        session = SparkSession.builder.master('local[1]').appName('test_result_fetch').getOrCreate()
+    except Exception as e:
+        pytest.skip(f"No local Spark session available: {e}")
+    yield session
+    session.stop()
+
+
+def test_bounded_dataframe_truncates_long_text(spark):
+    dataframe = spark.createDataFrame([(1, 'short'), (2, 'a much longer value')], ['id', 'text'])
+    rows = to_arrow(bounded_dataframe(dataframe, max_rows=10, max_text_chars=6)).to_pylist()
+    assert rows == [{'id': 1, 'text': 'short'}, {'id': 2, 'text': 'a much' + TRUNCATION_MARKER}]
+
+
+def test_bounded_dataframe_fetches_one_extra_row(spark):
+    dataframe = spark.createDataFrame([(i,) for i in range(10)], ['id'])
+    assert bounded_dataframe(dataframe, max_rows=3, max_text_chars=10).count() == 4
+
+
+def test_bounded_dataframe_suffixes_duplicate_columns(spark):
+    left = spark.createDataFrame([(1, 'a')], ['id', 'name'])
+    right = spark.createDataFrame([(1, 'b')], ['id', 'name'])
+    joined = left.join(right, left['id'] == right['id'])
+    bounded = bounded_dataframe(joined, max_rows=10, max_text_chars=10)
+    assert bounded.columns == ['id', 'name', 'id_2', 'name_2']
+    assert to_arrow(bounded).to_pylist() == [{'id': 1, 'name': 'a', 'id_2': 1, 'name_2': 'b'}]
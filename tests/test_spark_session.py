@@ -0,0 +1,168 @@
+import threading
+import time
+
+import pytest
+
+from spark_session import SparkSessionManager, is_session_expired_error
+
+
+class FakeSession:
+    def __init__(self, number, healthy=True):
+        self.number = number
+        self.healthy = healthy
+        self.stopped = False
+
+    def sql(self, query):
+        if not self.healthy:
+            raise RuntimeError("INVALID_HANDLE: session is gone")
+        return self
+
+    def collect(self):
+        return [1]
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeFactory:
+    def __init__(self):
+        self.sessions = []
+
+    def __call__(self):
+        session = FakeSession(len(self.sessions) + 1)
+        self.sessions.append(session)
+        return session
+
+
+@pytest.fixture
+def factory():
+    return FakeFactory()
+
+
+def test_session_is_reused_across_runs(factory):
+    manager = SparkSessionManager(session_factory=factory)
+    seen = [manager.run(lambda spark: spark) for _ in range(5)]
+    assert len(factory.sessions) == 1
+    assert all(session is factory.sessions[0] for session in seen)
+    assert manager.stats()['connect_count'] == 1
+
+
+@pytest.mark.parametrize('message', ["INVALID_HANDLE.SESSION_NOT_FOUND", "[SESSION_CLOSED] session closed"])
+def test_expired_session_reconnects_once_and_retries(factory, message):
+    manager = SparkSessionManager(session_factory=factory)
+    calls = []
+
+    def action(spark):
+        calls.append(spark)
+        if spark is factory.sessions[0]:
+            raise RuntimeError(message)
+        return 'rows'
+
+    assert manager.run(action) == 'rows'
+    assert len(calls) == 2
+    assert len(factory.sessions) == 2
+    assert factory.sessions[0].stopped
+    stats = manager.stats()
+    assert stats['reconnect_count'] == 1
+    assert stats['query_count'] == 1
+    assert stats['query_errors'] == 0
+
+
+def test_other_errors_are_not_retried(factory):
+    manager = SparkSessionManager(session_factory=factory)
+    calls = []
+
+    def action(spark):
+        calls.append(spark)
+        raise ValueError("syntax error at or near SELEC")
+
+    with pytest.raises(ValueError):
+        manager.run(action)
+    assert len(calls) == 1
+    assert manager.stats()['reconnect_count'] == 0
+    assert manager.stats()['query_errors'] == 1
+
+
+def test_still_expired_after_retry_raises(factory):
+    manager = SparkSessionManager(session_factory=factory)
+
+    def action(spark):
+        raise RuntimeError("INVALID_HANDLE")
+
+    with pytest.raises(RuntimeError):
+        manager.run(action)
+    assert manager.stats()['reconnect_count'] == 1
+    assert manager.stats()['query_errors'] == 1
+
+
+def test_failed_health_check_reconnects_after_interval(factory):
+    manager = SparkSessionManager(session_factory=factory, health_check_interval=0.05)
+    first = manager.get_session()
+    # Within the interval no health check runs, even if the session went bad
+    first.healthy = False
+    assert manager.get_session() is first
+
+    time.sleep(0.06)
+    second = manager.get_session()
+    assert second is not first
+    assert first.stopped
+    stats = manager.stats()
+    assert stats['health_check_failures'] == 1
+    assert stats['reconnect_count'] == 1
+
+
+def test_healthy_session_is_kept_after_interval(factory):
+    manager = SparkSessionManager(session_factory=factory, health_check_interval=0.01)
+    first = manager.get_session()
+    time.sleep(0.02)
+    assert manager.get_session() is first
+    assert manager.stats()['health_check_failures'] == 0
+
+
+def test_concurrent_queries_are_capped(factory):
+    manager = SparkSessionManager(session_factory=factory, max_concurrent_queries=2)
+    lock = threading.Lock()
+    running = {'now': 0, 'peak': 0}
+
+    def action(spark):
+        with lock:
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+        time.sleep(0.05)
+        with lock:
+            running['now'] -= 1
+
+    threads = [threading.Thread(target=manager.run, args=(action,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert running['peak'] == 2
+    stats = manager.stats()
+    assert stats['query_count'] == 6
+    assert stats['active_queries'] == 0
+    assert stats['max_concurrent_queries'] == 2
+
+
+def test_stats_before_and_after_connect(factory):
+    manager = SparkSessionManager(session_factory=factory)
+    stats = manager.stats()
+    assert stats['session_active'] is False
+    assert stats['session_age_seconds'] is None
+    assert stats['connect_count'] == 0
+
+    manager.run(lambda spark: None)
+    with pytest.raises(ZeroDivisionError):
+        manager.run(lambda spark: 1 / 0)
+    stats = manager.stats()
+    assert stats['session_active'] is True
+    assert stats['session_age_seconds'] >= 0
+    assert stats['connect_count'] == 1
+    assert stats['query_count'] == 1
+    assert stats['query_errors'] == 1
+    assert stats['active_queries'] == 0
+
+
+def test_is_session_expired_error():
+    assert is_session_expired_error(RuntimeError("[INVALID_HANDLE.SESSION_CLOSED] ..."))
+    assert not is_session_expired_error(RuntimeError("Table or view not found"))
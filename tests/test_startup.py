@@ -0,0 +1,61 @@
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from startup import DeferredStartup
+
+# Modules app.py imports at import time; none of them may pull in the slow client libraries
+LIGHT_MODULES = [
+    'agent_registry', 'audio_transcription', 'batch_lookup', 'conversation_store', 'customer_prefetch',
+    'live_call', 'metrics', 'query_cache', 'response_cache', 'result_fetch', 'spark_session', 'startup',
+    'structured_log', 'telemetry', 'transcript_delta', 'transcript_index',
+]
+HEAVY_MODULES = ['dspy', 'mlflow', 'pyspark', 'databricks', 'litellm', 'markdown2']
+
+
+@pytest.mark.parametrize('module', LIGHT_MODULES)
+def test_module_does_not_import_heavy_dependencies(module):
+    check = (f"import sys, {module}; "
+             f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', check], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
+
+
+def test_steps_run_in_background_after_their_dependencies():
+    startup = DeferredStartup()
+    order = []
+    release = threading.Event()
+    startup.add('slow', lambda: (release.wait(1), order.append('slow')))
+    startup.add('dependent', lambda: order.append('dependent'), after=['slow'])
+    startup.start()
+
+    assert not startup.wait('dependent', timeout=0.05)
+    assert startup.status()['dependent']['state'] == 'pending'
+    release.set()
+    assert startup.wait('dependent', timeout=1)
+    assert order == ['slow', 'dependent']
+    assert startup.ready
+
+
+def test_failed_step_is_reported_and_releases_waiters():
+    startup = DeferredStartup()
+
+    def fail():
+        raise RuntimeError("endpoint unreachable")
+
+    startup.add('mlflow', fail)
+    startup.add('agent', lambda: None, after=['mlflow'])
+    startup.start(background=False)
+
+    assert startup.wait('agent', timeout=0)
+    status = startup.status()
+    assert status['mlflow']['state'] == 'failed'
+    assert status['mlflow']['error'] == "endpoint unreachable"
+    assert status['agent']['state'] == 'ready'
+    assert not startup.ready
+
+
+def test_unknown_step_does_not_block():
+    assert DeferredStartup().wait('missing', timeout=0)
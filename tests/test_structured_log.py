@@ -0,0 +1,38 @@
+import json
+import logging
+
+import structured_log
+from structured_log import log_event, preview
+
+
+def _records(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records]
+
+
+def test_log_event_writes_one_json_record(caplog):
+    caplog.set_level(logging.INFO, logger="call_assistant")
+    log_event('sql_lookup', source='cache', rows=3)
+    [record] = _records(caplog)
+    assert record['event'] == 'sql_lookup'
+    assert record['level'] == 'info'
+    assert (record['source'], record['rows']) == ('cache', 3)
+
+
+def test_events_below_the_level_are_skipped(caplog):
+    caplog.set_level(logging.WARNING, logger="call_assistant")
+    log_event('routine')
+    log_event('slow', level='warning')
+    assert [record['event'] for record in _records(caplog)] == ['slow']
+
+
+def test_debug_events_are_sampled(caplog, monkeypatch):
+    caplog.set_level(logging.DEBUG, logger="call_assistant")
+    monkeypatch.setattr(structured_log, '_debug_sample_rate', 0.0)
+    log_event('payload', level='debug')
+    log_event('kept', level='debug', sample_rate=1.0)
+    assert [record['event'] for record in _records(caplog)] == ['kept']
+
+
+def test_preview():
+    assert preview("short") == "short"
+    assert preview("x" * 300, limit=10) == "xxxxxxxxxx... (300 chars)"
@@ -0,0 +1,99 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from telemetry import AsyncRunLogger, ExperimentCache
+
+
+class FakeClient:
+    def __init__(self):
+        self.runs = []
+
+    def create_run(self, experiment_id, start_time=None, tags=None):
+        self.runs.append(experiment_id)
+        return SimpleNamespace(info=SimpleNamespace(run_id=f"run-{len(self.runs)}"))
+
+    def log_batch(self, run_id, metrics=(), params=()):
+        pass
+
+    def set_terminated(self, run_id, status=None, end_time=None):
+        pass
+
+
+def test_stop_writes_out_queued_runs():
+    pytest.importorskip('mlflow')
+    client = FakeClient()
+    logger = AsyncRunLogger(flush_interval=0.05, client_factory=lambda: client)
+    for i in range(3):
+        logger.record('exp', metrics={'latency': i})
+
+    assert logger.stop(timeout=2) == 0
+    assert client.runs == ['exp'] * 3
+    assert logger.stats()['logged'] == 3
+    assert logger.stats()['dropped'] == 0
+
+
+def test_runs_not_written_before_stop_are_counted_as_dropped():
+    # The worker holds its batch open for flush_interval, so nothing is written before stop()
+    logger = AsyncRunLogger(flush_interval=5, client_factory=FakeClient)
+    for i in range(3):
+        logger.record('exp')
+
+    assert logger.stop(timeout=0.1) == 3
+    assert logger.stats()['dropped'] == 3
+    assert logger.stats()['logged'] == 0
+
+
+def test_batch_held_at_the_stop_deadline_is_counted_once():
+    logger = AsyncRunLogger(flush_interval=0.01, client_factory=FakeClient)
+    writing, release = threading.Event(), threading.Event()
+    written = []
+
+    def log_run(run):
+        writing.set()
+        release.wait(5)
+        written.append(run)
+
+    logger._log_run = log_run
+    for i in range(3):
+        logger.record('exp')
+    assert writing.wait(5)
+
+    assert logger.stop(timeout=0.1) == 3
+    release.set()
+    logger._worker.join(5)
+
+    stats = logger.stats()
+    assert (stats['dropped'], stats['logged'], stats['errors']) == (3, 0, 0)
+    # The run already being written finishes, but the rest of the batch is discarded
+    assert len(written) == 1
+
+
+def test_experiment_cache_resolves_each_id_once(monkeypatch):
+    mlflow = pytest.importorskip('mlflow')
+    resolved = []
+    monkeypatch.setattr(mlflow, 'set_experiment', lambda experiment_id: resolved.append(experiment_id))
+    monkeypatch.delenv('MLFLOW_EXPERIMENT_ID', raising=False)
+    cache = ExperimentCache()
+    for experiment_id in ['1', '2', '1', '2', '2']:
+        cache.activate(experiment_id)
+        assert cache.active_experiment_id == experiment_id
+
+    assert resolved == ['1', '2']
+    assert cache.stats()['hits'] == 3
+    assert cache.stats()['misses'] == 2
+
+
+def test_experiment_cache_does_not_cache_failures(monkeypatch):
+    mlflow = pytest.importorskip('mlflow')
+
+    def set_experiment(experiment_id):
+        raise ValueError(f"No experiment {experiment_id}")
+
+    monkeypatch.setattr(mlflow, 'set_experiment', set_experiment)
+    cache = ExperimentCache()
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.activate('missing')
+    assert cache.stats()['resolved'] == 0
@@ -0,0 +1,65 @@
+from transcript_delta import PromptTokenTracker, RollingCallSummary, split_new_dialogue
+
+TURN_1 = "Agent: Thanks for calling, how can I help?\nCustomer: I need a pickup.\nAgent: Sure.\nCustomer: Yes."
+
+
+def test_first_submission_is_all_new():
+    new_dialogue, keys = split_new_dialogue(TURN_1, [])
+    assert new_dialogue == TURN_1
+    assert len(keys) == 4
+
+
+def test_cumulative_transcript_keeps_repeated_short_lines():
+    _, keys = split_new_dialogue(TURN_1, [])
+    turn_2 = TURN_1 + "\nAgent: Do you want expedited?\nCustomer: Yes."
+    new_dialogue, keys = split_new_dialogue(turn_2, keys)
+    assert new_dialogue == "Agent: Do you want expedited?\nCustomer: Yes."
+    assert len(keys) == 6
+
+
+def test_latest_turns_only():
+    _, keys = split_new_dialogue(TURN_1, [])
+    new_dialogue, _ = split_new_dialogue("Agent: Anything else?\nCustomer: Yes.", keys)
+    assert new_dialogue == "Agent: Anything else?\nCustomer: Yes."
+
+
+def test_single_repeated_line_is_not_treated_as_overlap():
+    _, keys = split_new_dialogue(TURN_1, [])
+    assert split_new_dialogue("Customer: Yes.", keys)[0] == "Customer: Yes."
+
+
+def test_overlapping_resubmission_sends_only_the_new_lines():
+    _, keys = split_new_dialogue(TURN_1, [])
+    new_dialogue, _ = split_new_dialogue("agent:  SURE.\nCustomer: Yes.\nAgent: Great.", keys)
+    assert new_dialogue == "Agent: Great."
+
+
+def test_identical_resubmission_has_no_new_dialogue():
+    _, keys = split_new_dialogue(TURN_1, [])
+    assert split_new_dialogue(TURN_1, keys) == ("", keys)
+
+
+def test_cumulative_transcript_longer_than_the_tracked_lines():
+    transcript = "\n".join(f"Speaker: line {i}" for i in range(10))
+    _, keys = split_new_dialogue(transcript, [], max_tracked_lines=4)
+    assert len(keys) == 4
+    new_dialogue, _ = split_new_dialogue(transcript + "\nSpeaker: line 10", keys, max_tracked_lines=4)
+    assert new_dialogue == "Speaker: line 10"
+
+
+def test_rolling_summary_stays_bounded():
+    summary = RollingCallSummary(max_chars=300, digest_chars=100)
+    for turn in range(20):
+        summary.add_turn(f"Agent: turn {turn}\nCustomer: reply", "guidance " * 30, "customer_profiles")
+    history = summary.as_history()[0]
+    assert sum(len(digest) for digest in history['earlier_turns_summary']) <= 300
+    assert history['tables_already_queried'] == ['customer_profiles']
+
+
+def test_prompt_token_tracker_averages_per_turn():
+    tracker = PromptTokenTracker(max_turns=3)
+    tracker.record(1, 100)
+    tracker.record(1, 200)
+    tracker.record(5, 50)
+    assert tracker.stats() == {'1': {'requests': 2, 'avg_prompt_tokens': 150.0},
+                               '3': {'requests': 1, 'avg_prompt_tokens': 50.0}}
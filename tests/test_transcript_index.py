@@ -0,0 +1,70 @@
+import pytest
+
+from benchmarks.fakes import FakeServices, FakeSparkSession
+from transcript_index import TranscriptIndex, tokenize
+
+TABLE = 'austin_choi_demo_catalog.agents.transcripts'
+
+
+class FakeSparkSessions:
+    def __init__(self, services):
+        self.spark = FakeSparkSession(services)
+
+    def run(self, fn):
+        return fn(self.spark)
+
+
+@pytest.fixture
+def services():
+    return FakeServices({'spark_query_ms': 0, 'spark_rows': 3, 'delta_commit_seconds': 60,
+                         'delta_rows_per_commit': 2, 'jitter': 0})
+
+
+@pytest.fixture
+def index(services, tmp_path):
+    return TranscriptIndex(FakeSparkSessions(services), TABLE, str(tmp_path / 'index'))
+
+
+def advance(services, commits):
+    services.started_at -= commits * services.config['delta_commit_seconds']
+
+
+def test_tokenize_drops_stopwords_and_short_tokens():
+    assert tokenize("Um, the customer is ANGRY about a 2nd delay!") == ['customer', 'angry', 'about', '2nd', 'delay']
+
+
+def test_full_load_then_incremental_refresh_from_change_feed(services, index):
+    assert index.refresh()
+    assert index.stats()['rows'] == 3
+    assert index.stats()['version'] == 0
+    assert not index.refresh()
+
+    advance(services, 2)
+    assert index.refresh()
+
+    stats = index.stats()
+    assert stats['version'] == 2
+    assert stats['rows'] == 3 + 2 * 2
+    assert stats['full_loads'] == 1
+    assert stats['incremental_refreshes'] == 1
+
+
+def test_search_ranks_matching_calls(index):
+    index.refresh()
+    index.add_rows([{'agent_name': 'Sam', 'customer_name': 'Pat Doe', 'tone': 'calm', 'topic': 'refund request',
+                     'transcript': "The customer wants a refund for a damaged parcel."}])
+
+    results = index.search("refund for a damaged parcel", k=2)
+
+    assert results[0]['customer_name'] == 'Pat Doe'
+    assert results[0]['relevance'] > (results[1]['relevance'] if len(results) > 1 else 0)
+    assert index.search("", k=2) == []
+
+
+def test_index_is_restored_from_disk(services, index, tmp_path):
+    index.refresh()
+
+    restored = TranscriptIndex(FakeSparkSessions(services), TABLE, str(tmp_path / 'index'))
+    assert restored.load_from_disk()
+    assert restored.stats()['rows'] == 3
+    assert restored.search("delayed pickup")
@@ -0,0 +1,147 @@
+import hashlib
+import re
+import threading
+
+
+# Rough characters-per-token ratio used when the LM does not report usage
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+def _line_key(line):
+    normalized = " ".join(line.lower().split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def split_new_dialogue(transcript, processed_line_keys, max_tracked_lines=2000, min_overlap_lines=2):
+    """Return (new_dialogue, updated_processed_line_keys) for an incoming transcript.
+
+    processed_line_keys is the ordered list of dialogue lines processed so far in the
+    call (compared ignoring case and whitespace). The submission's new dialogue is
+    whatever follows the point where it lines up with the end of that list, so this
+    works both when the agent pastes the growing, cumulative transcript and when each
+    submission only holds the latest turns, possibly repeating the last few lines.
+    Lines are matched by position, so a short line that legitimately recurs ("Yes.")
+    is still sent. An overlap shorter than min_overlap_lines that doesn't cover every
+    processed line is ambiguous and treated as new dialogue. Only the most recent
+    max_tracked_lines line keys are remembered.
+    """
+    lines = [line.strip() for line in transcript.splitlines() if line.strip()]
+    keys = [_line_key(line) for line in lines]
+    processed = list(processed_line_keys)
+
+    start = 0
+    if processed:
+        # Try the latest possible end of the already-processed dialogue first
+        for end in range(len(keys), 0, -1):
+            if keys[end - 1] != processed[-1]:
+                continue
+            overlap = min(end, len(processed))
+            if keys[end - overlap:end] != processed[-overlap:]:
+                continue
+            if overlap == len(processed) or overlap >= min_overlap_lines:
+                start = end
+                break
+
+    updated_keys = (processed + keys[start:])[-max_tracked_lines:]
+    return "\n".join(lines[start:]), updated_keys
+
+
+def _speakers(dialogue):
+    speakers = []
+    for line in dialogue.splitlines():
+        match = re.match(r"^\s*([^:]{1,60}):", line)
+        if match and match.group(1).strip() not in speakers:
+            speakers.append(match.group(1).strip())
+    return speakers
+
+
+def _shorten(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+class RollingCallSummary:
+    """Compact, size-bounded memory of the earlier turns of one call.
+
+    Each processed turn contributes a short digest (speakers plus the start of the
+    guidance already given) and the table it queried. Once the digests exceed
+    max_chars, the oldest ones are folded into a single truncated "earlier" entry,
+    so what is sent to the LLM stays roughly constant no matter how long the call runs.
+    """
+
+    def __init__(self, digests=None, queried_tables=None, recent_dialogue="",
+                 max_chars=2000, digest_chars=400, recent_lines=4):
+        self.digests = list(digests or [])
+        self.queried_tables = list(queried_tables or [])
+        self.recent_dialogue = recent_dialogue
+        self.max_chars = max_chars
+        self.digest_chars = digest_chars
+        self.recent_lines = recent_lines
+
+    @classmethod
+    def from_dict(cls, data, **kwargs):
+        data = data or {}
+        return cls(data.get('digests'), data.get('queried_tables'), data.get('recent_dialogue', ""), **kwargs)
+
+    def to_dict(self):
+        return {
+            'digests': self.digests,
+            'queried_tables': self.queried_tables,
+            'recent_dialogue': self.recent_dialogue,
+        }
+
+    def add_turn(self, dialogue, relevant_information, queried_table):
+        speakers = ", ".join(_speakers(dialogue)) or "unknown speakers"
+        self.digests.append(_shorten(f"[{speakers}] {relevant_information}", self.digest_chars))
+        for table in re.split(r"[,\s]+", queried_table or ""):
+            if table and table.lower() not in ("none", "n/a") and table not in self.queried_tables:
+                self.queried_tables.append(table)
+        dialogue_lines = [line for line in dialogue.splitlines() if line.strip()]
+        self.recent_dialogue = "\n".join(dialogue_lines[-self.recent_lines:])
+        self._compact()
+
+    def as_history(self):
+        """Conversation history entries to hand to transcript_router instead of the full history."""
+        if not self.digests and not self.queried_tables:
+            return []
+        return [{
+            'earlier_turns_summary': self.digests,
+            'tables_already_queried': self.queried_tables,
+            'last_lines_of_previous_turn': self.recent_dialogue,
+        }]
+
+    def _compact(self):
+        while len(self.digests) > 1 and sum(len(digest) for digest in self.digests) > self.max_chars:
+            half = self.digest_chars // 2
+            merged = _shorten(self.digests[0], half) + " " + _shorten(self.digests[1], half)
+            self.digests[:2] = [merged]
+
+
+class PromptTokenTracker:
+    """Prompt tokens per LLM request, grouped by the turn number within a call.
+
+    With incremental processing the average for turn 5 should look like the average
+    for turn 1; with full transcripts it grows with every turn.
+    """
+
+    def __init__(self, max_turns=50):
+        self.max_turns = max_turns
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, turn_number, prompt_tokens):
+        turn_number = min(turn_number, self.max_turns)
+        with self._lock:
+            count, total = self._totals.get(turn_number, (0, 0))
+            self._totals[turn_number] = (count + 1, total + prompt_tokens)
+
+    def stats(self):
+        with self._lock:
+            return {
+                str(turn_number): {'requests': count, 'avg_prompt_tokens': total / count}
+                for turn_number, (count, total) in sorted(self._totals.items())
+            }
@@ -0,0 +1,268 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from result_fetch import to_arrow
+from structured_log import log_event
+
+
+# Columns kept for each past call; transcript is indexed, the rest are returned with each match
+INDEXED_COLUMNS = ('agent_name', 'customer_name', 'tone', 'topic', 'transcript')
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a an and are as at be but by can could did do does for from had has have he her him his how i if in into is it
+its just me my no not of on or our she so that the their them then there they this to was we were what when
+which who will with would you your yes okay ok um uh
+""".split())
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(str(text or '').lower())
+            if len(token) > 1 and token not in _STOPWORDS]
+
+
+class TranscriptIndex:
+    """In-process BM25 index over past call transcripts, for "how did other agents handle this".
+
+    Every row of the transcripts table is one document made of its topic (weighted
+    topic_weight times), tone and transcript. Term and document frequencies live in an
+    inverted index, so adding rows only touches the new rows' terms and search() only
+    scores documents that share a term with the query. refresh() follows the table's
+    Delta version like CustomerProfileSnapshot: new rows from the change data feed are
+    added incrementally; updates, deletes or a missing feed rebuild the index. The rows
+    are persisted as Parquet under index_dir so a restart can search before the
+    warehouse is reachable.
+    """
+
+    def __init__(self, spark_sessions, table_name, index_dir, refresh_interval=300, topic_weight=3,
+                 excerpt_chars=600, k1=1.2, b=0.75):
+        self.spark_sessions = spark_sessions
+        self.table_name = table_name
+        self.index_dir = index_dir
+        self.refresh_interval = refresh_interval
+        self.topic_weight = topic_weight
+        self.excerpt_chars = excerpt_chars
+        self.k1 = k1
+        self.b = b
+
+        self._rows = []
+        self._lengths = []
+        self._postings = {}
+        self._total_length = 0
+        self._version = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        self.searches = 0
+        self.full_loads = 0
+        self.incremental_refreshes = 0
+        self.rows_added = 0
+        self.refresh_errors = 0
+
+    @property
+    def ready(self):
+        return self._loaded_at is not None
+
+    @property
+    def parquet_path(self):
+        return os.path.join(self.index_dir, 'transcripts.parquet')
+
+    @property
+    def metadata_path(self):
+        return os.path.join(self.index_dir, 'transcripts.json')
+
+    def search(self, query, k=5):
+        """Return the k past calls most similar to query, best first, each with a relevance score."""
+        query_terms = Counter(tokenize(query))
+        if not query_terms:
+            return []
+        with self._lock:
+            self.searches += 1
+            document_count = len(self._rows)
+            if not document_count:
+                return []
+            average_length = self._total_length / document_count
+            scores = {}
+            for term, query_count in query_terms.items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, term_count in postings.items():
+                    length_norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + query_count * idf * term_count * (self.k1 + 1) / (
+                        term_count + length_norm)
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            rows = [(self._rows[doc_id], score) for doc_id, score in best]
+
+        results = []
+        for row, score in rows:
+            transcript = row.get('transcript') or ''
+            if len(transcript) > self.excerpt_chars:
+                transcript = transcript[:self.excerpt_chars] + " ...[truncated]"
+            results.append(dict(row, transcript=transcript, relevance=round(score, 3)))
+        return results
+
+    def add_rows(self, rows):
+        """Index rows (dicts with INDEXED_COLUMNS) in addition to the ones already indexed."""
+        documents = [self._document(row) for row in rows]
+        with self._lock:
+            for row, terms in documents:
+                doc_id = len(self._rows)
+                self._rows.append(row)
+                self._lengths.append(sum(terms.values()))
+                self._total_length += self._lengths[-1]
+                for term, count in terms.items():
+                    self._postings.setdefault(term, {})[doc_id] = count
+        return len(documents)
+
+    def load_from_disk(self):
+        if not (os.path.exists(self.parquet_path) and os.path.exists(self.metadata_path)):
+            return False
+        try:
+            import pyarrow.parquet as pq
+
+            with open(self.metadata_path) as f:
+                metadata = json.load(f)
+            if metadata.get('table_name') != self.table_name:
+                return False
+            self._install(pq.read_table(self.parquet_path).to_pylist(), metadata.get('version'))
+            log_event('transcript_index_loaded_from_disk', rows=len(self._rows), version=self._version)
+            return True
+        except Exception as e:
+            log_event('transcript_index_disk_load_failed', level='error', error=str(e))
+            return False
+
+    def refresh(self):
+        with self._refresh_lock:
+            try:
+                latest_version = self._latest_version()
+                if self.ready and latest_version == self._version:
+                    return False
+                applied = self.ready and self._version is not None and self._apply_changes(latest_version)
+                if not applied:
+                    self._full_load(latest_version)
+                self._save_to_disk()
+                return True
+            except Exception as e:
+                self.refresh_errors += 1
+                log_event('transcript_index_refresh_failed', level='error', error=str(e))
+                return False
+
+    def start_background_refresh(self):
+        def refresh_loop():
+            self.load_from_disk()
+            while not self._stop_event.is_set():
+                self.refresh()
+                self._stop_event.wait(self.refresh_interval)
+
+        thread = threading.Thread(target=refresh_loop, name="transcript-index-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'version': self._version,
+                'rows': len(self._rows),
+                'terms': len(self._postings),
+                'age_seconds': time.time() - self._loaded_at if self._loaded_at else None,
+                'searches': self.searches,
+                'full_loads': self.full_loads,
+                'incremental_refreshes': self.incremental_refreshes,
+                'rows_added': self.rows_added,
+                'refresh_errors': self.refresh_errors,
+            }
+
+    def _document(self, row):
+        row = {column: row.get(column) for column in INDEXED_COLUMNS}
+        terms = Counter(tokenize(row['transcript']))
+        terms.update(tokenize(row['tone']))
+        for term in tokenize(row['topic']):
+            terms[term] += self.topic_weight
+        return row, terms
+
+    def _latest_version(self):
+        rows = self.spark_sessions.run(
+            lambda spark: spark.sql(f"DESCRIBE HISTORY {self.table_name} LIMIT 1").collect()
+        )
+        return rows[0]['version'] if rows else None
+
+    def _select(self, source):
+        return f"SELECT {', '.join(INDEXED_COLUMNS)} FROM {source}"
+
+    def _full_load(self, version):
+        table = self.spark_sessions.run(lambda spark: to_arrow(spark.sql(self._select(self.table_name))))
+        self._install(table.to_pylist(), version)
+        self.full_loads += 1
+        log_event('transcript_index_full_load', rows=table.num_rows, version=version)
+
+    def _apply_changes(self, latest_version):
+        """Add the rows inserted since the indexed version; False if the index must be rebuilt instead."""
+        try:
+            changes = self.spark_sessions.run(
+                lambda spark: to_arrow(spark.sql(
+                    f"SELECT {', '.join(INDEXED_COLUMNS)}, _change_type FROM "
+                    f"table_changes('{self.table_name}', {self._version + 1}, {latest_version})"
+                ))
+            )
+        except Exception as e:
+            log_event('transcript_index_change_feed_unavailable', level='warning', table=self.table_name, error=str(e))
+            return False
+
+        changes = changes.to_pylist()
+        # Past calls are only ever appended; anything else is rare enough to rebuild for
+        if any(change['_change_type'] != 'insert' for change in changes):
+            return False
+        added = self.add_rows(changes)
+        with self._lock:
+            self._version = latest_version
+            self._loaded_at = time.time()
+        self.incremental_refreshes += 1
+        self.rows_added += added
+        log_event('transcript_index_changes_applied', added=added, version=latest_version)
+        return True
+
+    def _install(self, rows, version):
+        documents = [self._document(row) for row in rows]
+        postings = {}
+        lengths = []
+        for doc_id, (_, terms) in enumerate(documents):
+            lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                postings.setdefault(term, {})[doc_id] = count
+        with self._lock:
+            self._rows = [row for row, _ in documents]
+            self._lengths = lengths
+            self._postings = postings
+            self._total_length = sum(lengths)
+            self._version = version
+            self._loaded_at = time.time()
+
+    def _save_to_disk(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with self._lock:
+            rows = list(self._rows)
+            version = self._version
+        os.makedirs(self.index_dir, exist_ok=True)
+        # Write to temporary files first so a crash never leaves a half-written index behind
+        table = pa.Table.from_pylist(rows, schema=pa.schema([(column, pa.string()) for column in INDEXED_COLUMNS]))
+        pq.write_table(table, self.parquet_path + '.tmp')
+        with open(self.metadata_path + '.tmp', 'w') as f:
+            json.dump({'table_name': self.table_name, 'version': version}, f)
+        os.replace(self.parquet_path + '.tmp', self.parquet_path)
+        os.replace(self.metadata_path + '.tmp', self.metadata_path)